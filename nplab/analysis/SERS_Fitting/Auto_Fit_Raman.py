@@ -4,6 +4,7 @@ from past.utils import old_div
 import numpy as np 
 import scipy.ndimage.filters as imf
 import scipy.optimize as spo
+from nplab.analysis.SERS_Fitting import lineshapes
 
 """
 Author: jpg66 October 2018
@@ -71,12 +72,13 @@ def Multi_L_Constant(x,*Params):
 	"""
 	Defines a contant plus a sum of Lorentzians. Params goes Constant, Height1,Centre1, Width1,Height2.....
 	"""
-	Output=Params[0]
-	n=1
-	while n<len(Params):
-		Output+=L(x,*Params[n:n+3])
-		n+=3
-	return Output
+	return lineshapes.model(x,Params,'L',constant=True)
+
+def Multi_L_Constant_Jacobian(x,*Params):
+	"""
+	The derivatives of Multi_L_Constant with respect to each parameter, for curve_fit
+	"""
+	return lineshapes.jacobian(x,Params,'L',constant=True)
 
 def Attempt_To_Fit(Shift,Array,Peak_Shifts,Peak_Heights,Width,Minimum_Height=0):
 	"""
@@ -114,7 +116,7 @@ def Attempt_To_Fit(Shift,Array,Peak_Shifts,Peak_Heights,Width,Minimum_Height=0):
 				U_Bounds+=[np.inf,np.max(Shift),np.inf]
 				#print Initial
 			try:
-				Params=spo.curve_fit(Multi_L_Constant,Shift,Array,Initial,bounds=(L_Bounds,U_Bounds))
+				Params=spo.curve_fit(Multi_L_Constant,Shift,Array,Initial,bounds=(L_Bounds,U_Bounds),jac=Multi_L_Constant_Jacobian)
 				Params=[Params[0],np.sqrt(np.diag(Params[1]))]
 
 				#print Params
@@ -176,7 +178,7 @@ def Run(Input,Shift,Width=10,Smoothing_Factor=5,Noise_Threshold=2):
 		n+=3	
 
 	try:
-		Params=spo.curve_fit(Multi_L_Constant,Shift,Input,First_Draft,bounds=(L_Bounds,U_Bounds))
+		Params=spo.curve_fit(Multi_L_Constant,Shift,Input,First_Draft,bounds=(L_Bounds,U_Bounds),jac=Multi_L_Constant_Jacobian)
 		Params=[Params[0],np.sqrt(np.diag(Params[1]))]
 		Params=[Params[0][1:],Params[1][1:]]
 		return Params
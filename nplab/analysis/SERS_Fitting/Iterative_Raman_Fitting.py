@@ -10,6 +10,7 @@ import scipy.ndimage.filters as ndimf
 import scipy.optimize as spo
 import copy
 import multiprocessing as mp
+from nplab.analysis.SERS_Fitting import lineshapes
 
 """
 Author: jpg66 April 2019
@@ -116,12 +117,7 @@ def Multi_L(x,*Params):
 	"""
 	Defines a sum of Lorentzians. Params goes Height1,Centre1, Width1,Height2.....
 	"""
-	Output=0
-	n=0
-	while n<len(Params):
-		Output+=L(x,*Params[n:n+3])
-		n+=3
-	return Output
+	return lineshapes.model(x,Params,'L')
 
 def G(x,H,C,W):
 	"""
@@ -133,12 +129,7 @@ def Multi_G(x,*Params):
 	"""
 	Defines a sum of LGuassians. Params goes Height1,Centre1, Width1,Height2.....
 	"""
-	Output=0
-	n=0
-	while n<len(Params):
-		Output+=G(x,*Params[n:n+3])
-		n+=3
-	return Output
+	return lineshapes.model(x,Params,'G',gaussian_factor=0.5)
 
 def Add_New_Peak(x_axis,Signal,Current_Peaks,Width,Maximum_Width,Regions=50,Peak_Type='L'):
 	"""
@@ -341,12 +332,11 @@ def Run(x_axis,Signal,Maximum_FWHM=40,Regions=50,Minimum_Width_Factor=0.1,Peak_T
 					Regions*=5
 
 
+	#A constant plus the peaks, and its analytic Jacobian
 	if Peak_Type=='L':
-		def Final_Fitting_Function(x,*Params):
-			return Multi_L(x,*Params[1:])+Params[0]
+		Final_Fitting_Function,Final_Jacobian=lineshapes.curve_fit_functions('L',constant=True)
 	else:
-		def Final_Fitting_Function(x,*Params):
-			return Multi_G(x,*Params[1:])+Params[0]
+		Final_Fitting_Function,Final_Jacobian=lineshapes.curve_fit_functions('G',constant=True,gaussian_factor=0.5)
 
 	Output=None
 	while Output is None and len(Results)>0:
@@ -357,7 +347,7 @@ def Run(x_axis,Signal,Maximum_FWHM=40,Regions=50,Minimum_Width_Factor=0.1,Peak_T
 			BU+=[np.inf,np.max(x_axis),Max_Width]
 			n+=3
 		try:
-			Fits=spo.curve_fit(Final_Fitting_Function,x_axis,Signal,[0]+Results[-1],bounds=(BL,BU))
+			Fits=spo.curve_fit(Final_Fitting_Function,x_axis,Signal,[0]+Results[-1],bounds=(BL,BU),jac=Final_Jacobian)
 			Fits=[Fits[0],np.sqrt(np.diag(Fits[1]))]
 			Output=[Fits[0][1:],Fits[1][1:]]
 		except RuntimeError:
@@ -33,6 +33,7 @@ import matplotlib.pyplot as pl
 import numpy as np
 import multiprocessing as mp
 import scipy.optimize as spo
+from nplab.analysis.SERS_Fitting import lineshapes
 
 def Select_Time_Range(Min,Max):
 	"""
@@ -232,21 +233,22 @@ def Constant_plus_Lorentzians(x,*Params):
 	"""
 	Defines a constant plus an arbitary sum of Lorentzians
 	"""
-	Output=Params[0]
-	n=1
-	while n<len(Params):
-		Output+=Lorentzian(x,*Params[n:n+3])
-		n+=3
-	return Output
+	return lineshapes.model(x,Params,'L',constant=True,order='CWH')
+
+def Constant_plus_Lorentzians_Jacobian(x,*Params):
+	"""
+	The derivatives of Constant_plus_Lorentzians with respect to each parameter, for curve_fit
+	"""
+	return lineshapes.jacobian(x,Params,'L',constant=True,order='CWH')
 
-def Fitting_Worker(Function,x,y,Initial,Bounds,Label):
+def Fitting_Worker(Function,x,y,Initial,Bounds,Label,Jacobian=None):
 	"""
 	Worker to complete the fitting. Function is function to fit. x and y is the data. Initial is a guess for the fitting parameters.
 	Bounds are the bounds for the fitting. Label is a number labelling which spectrum is being fit here. Returns [Parameters, Errors] which can 
-	all be None if the fitting fails.
+	all be None if the fitting fails. Jacobian is an optional function returning the derivatives of Function (otherwise they are estimated).
 	"""
 	try:
-		Output=spo.curve_fit(Function,x,y,Initial,bounds=Bounds)
+		Output=spo.curve_fit(Function,x,y,Initial,bounds=Bounds,jac=Jacobian)
 		Output=[Output[0],np.sqrt(np.diag(Output[1])),Label]
 	except RuntimeError:
 		Output=[]
@@ -288,7 +290,7 @@ def Run_Fitting(Array,x_axis,Center_Guesses,Width_Guess,Cores):
 		for j in range(len(Center_Guesses)):
 			Initial+=[Center_Guesses[j],Width_Guess,Heights[j]]
 
-		Processes.append(Pool.apply_async(Fitting_Worker,args=(Constant_plus_Lorentzians,x_axis,Array[i],Initial,(Bounds_Lower,Bounds_Upper),i)))
+		Processes.append(Pool.apply_async(Fitting_Worker,args=(Constant_plus_Lorentzians,x_axis,Array[i],Initial,(Bounds_Lower,Bounds_Upper),i,Constant_plus_Lorentzians_Jacobian)))
 
 	Results=[p.get() for p in Processes]
 
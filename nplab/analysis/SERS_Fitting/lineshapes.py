@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-peak model and analytic Jacobian kernel, shared by the SERS_Fitting modules.
+
+A model is an optional constant plus a sum of Lorentzians ('L'):
+
+    H/(1 + ((x - C)/W)**2)
+
+or Gaussians ('G'):
+
+    H*exp(-k*((x - C)/W)**2)
+
+where k is gaussian_factor (1 in peaks_and_bg_fitting, 0.5 in Iterative_Raman_Fitting).
+All the peaks are evaluated at once by broadcasting, rather than in a Python loop, and so are their derivatives,
+so scipy.optimize.curve_fit can be given the exact Jacobian instead of estimating it by finite differences
+(one model evaluation per parameter per iteration).
+
+Parameters are flat, in the same layout the existing functions use: [constant,] then the parameters of each peak in
+turn, in the order given by `order` ('HCW' is height, centre, width - Peak_Fitting_UI uses 'CWH').
+Any leading dimensions of the parameters are treated as a batch of models sharing the same x axis, e.g. the fits of
+every spectrum in a time series can be evaluated in one call:
+
+>>> model(x, params)           # params: (n_params,) -> (len(x),)
+>>> model(x, params_stack)     # params_stack: (n_spectra, n_params) -> (n_spectra, len(x))
+>>> f, jac = curve_fit_functions('L', constant=True)
+>>> curve_fit(f, x, y, initial, jac=jac)
+
+Run this module to print a timing comparison with the loop-based functions (see `benchmark`).
+"""
+from __future__ import division
+from __future__ import print_function
+import time
+import numpy as np
+
+CANONICAL_ORDER = 'HCW'
+
+
+def _split(params, constant, order):
+    '''(constant, H, C, W) from flat parameters, each of H, C, W with shape (..., n_peaks, 1)'''
+    params = np.asarray(params, dtype=float)
+    offset = 1 if constant else 0
+    peaks = params[..., offset:].reshape(params.shape[:-1] + (-1, 3))
+    hcw = [peaks[..., order.index(p), np.newaxis] for p in CANONICAL_ORDER]
+    return (params[..., :1] if constant else 0.), hcw[0], hcw[1], hcw[2]
+
+
+def model(x, params, lineshape='L', constant=False, order=CANONICAL_ORDER, gaussian_factor=1.):
+    '''
+    [constant +] the sum of the peaks described by params, evaluated at x.
+
+    :param x: 1D array, the x axis
+    :param params: array (..., n_params), see the module docstring
+    :param lineshape: 'L' (Lorentzian) or 'G' (Gaussian)
+    :param constant: bool, whether the first parameter is a constant background
+    :param order: the order of the parameters of each peak
+    :param gaussian_factor: k in exp(-k*((x - C)/W)**2)
+    :return: array (..., len(x))
+    '''
+    x = np.asarray(x, dtype=float)
+    const, H, C, W = _split(params, constant, order)
+    # in place, as this is memory-bound for large batches
+    peaks = x - C
+    peaks /= W
+    np.square(peaks, out=peaks)
+    if lineshape == 'L':
+        peaks += 1.
+        np.divide(H, peaks, out=peaks)
+    elif lineshape == 'G':
+        peaks *= -gaussian_factor
+        np.exp(peaks, out=peaks)
+        peaks *= H
+    else:
+        raise ValueError("lineshape should be 'L' or 'G', not %r" % (lineshape, ))
+    return np.sum(peaks, axis=-2) + const
+
+
+def model_and_jacobian(x, params, lineshape='L', constant=False, order=CANONICAL_ORDER, gaussian_factor=1.):
+    '''
+    `model`, and its derivatives with respect to each parameter, sharing the work.
+
+    :return: arrays (..., len(x)) and (..., len(x), n_params), as scipy.optimize.curve_fit expects
+    '''
+    x = np.asarray(x, dtype=float)
+    const, H, C, W = _split(params, constant, order)
+    n_peaks = H.shape[-2]
+    offset = 1 if constant else 0
+    # the derivatives are written straight into the Jacobian, with one row per parameter for now
+    jac = np.empty(H.shape[:-2] + (offset + 3 * n_peaks, len(x)))
+    jac[..., :offset, :] = 1.
+    peaks = jac[..., offset:, :].reshape(H.shape[:-2] + (n_peaks, 3, len(x)))
+    shape, d_dC, d_dW = [peaks[..., order.index(p), :] for p in CANONICAL_ORDER]
+    u = x - C
+    u /= W
+    np.multiply(u, u, out=shape)
+    if lineshape == 'L':
+        shape += 1.
+        np.divide(1., shape, out=shape)
+        np.multiply(shape, shape, out=d_dC)
+        d_dC *= u
+        d_dC *= 2. * H / W  # du/dC = -1/W, and d(shape)/du = -2*shape**2*u
+    elif lineshape == 'G':
+        shape *= -gaussian_factor
+        np.exp(shape, out=shape)
+        np.multiply(shape, u, out=d_dC)
+        d_dC *= 2. * gaussian_factor * H / W  # d(shape)/du = -2*k*shape*u
+    else:
+        raise ValueError("lineshape should be 'L' or 'G', not %r" % (lineshape, ))
+    np.multiply(d_dC, u, out=d_dW)  # du/dW = -u/W
+    values = np.matmul(np.swapaxes(H, -1, -2), shape)[..., 0, :]
+    return values + const, np.swapaxes(jac, -1, -2)
+
+
+def jacobian(x, params, lineshape='L', constant=False, order=CANONICAL_ORDER, gaussian_factor=1.):
+    '''
+    the derivatives of `model` with respect to each parameter.
+
+    :return: array (..., len(x), n_params), as scipy.optimize.curve_fit expects
+    '''
+    return model_and_jacobian(x, params, lineshape, constant, order, gaussian_factor)[1]
+
+
+def curve_fit_functions(lineshape='L', constant=False, order=CANONICAL_ORDER, gaussian_factor=1.):
+    '''
+    (f, jac) with the signature scipy.optimize.curve_fit expects: f(x, *params) and jac(x, *params)
+    '''
+    options = dict(lineshape=lineshape, constant=constant, order=order, gaussian_factor=gaussian_factor)
+
+    def f(x, *params):
+        return model(x, params, **options)
+
+    def jac(x, *params):
+        return jacobian(x, params, **options)
+    return f, jac
+
+
+def benchmark(n_points=1600, peak_numbers=(1, 5, 20), batch=100, repeats=5):
+    '''
+    Prints the time taken to evaluate a model, and to fit it with curve_fit, compared with the loop-based
+    Multi_L_Constant that Auto_Fit_Raman used before (with a finite-difference Jacobian)
+
+    :return: dict of n_peaks: (loop evaluation, kernel evaluation, batched kernel evaluation per spectrum,
+        loop fit, kernel fit) times in seconds
+    '''
+    from scipy.optimize import curve_fit
+
+    def Multi_L_Constant(x, *Params):
+        '''the loop-based model that Auto_Fit_Raman used before'''
+        Output = Params[0]
+        for n in range(1, len(Params), 3):
+            H, C, W = Params[n:n + 3]
+            Output = Output + H / (1. + ((x - C) / W)**2)
+        return Output
+
+    def best_time(function):
+        times = []
+        for i in range(repeats):
+            start = time.time()
+            function()
+            times.append(time.time() - start)
+        return min(times)
+
+    rng = np.random.RandomState(0)
+    x = np.linspace(200, 1800, n_points)
+    f, jac = curve_fit_functions('L', constant=True)
+    results = {}
+    print('{:>8} {:>12} {:>12} {:>14} {:>10} {:>10}'.format('n_peaks', 'loop eval', 'kernel eval', 'batched eval',
+                                                           'loop fit', 'kernel fit'))
+    for n_peaks in peak_numbers:
+        true = [10.] + [p for i in range(n_peaks)
+                        for p in (rng.uniform(50, 500), 250 + 1500 * (i + 0.5) / n_peaks, rng.uniform(5, 15))]
+        y = f(x, *true) + rng.normal(0, 5, n_points)
+        initial = np.array(true)
+        initial[1::3] *= rng.uniform(0.8, 1.2, n_peaks)  # heights
+        initial[2::3] += rng.uniform(-3, 3, n_peaks)  # centres
+        initial[3::3] *= rng.uniform(0.8, 1.2, n_peaks)  # widths
+        bounds = ([-np.inf] + [0, -np.inf, 0] * n_peaks, np.inf)  # as in Auto_Fit_Raman
+        stack = np.tile(true, (batch, 1))
+        timings = (best_time(lambda: Multi_L_Constant(x, *true)),
+                   best_time(lambda: model(x, true, constant=True)),
+                   best_time(lambda: model(x, stack, constant=True)) / batch,
+                   best_time(lambda: curve_fit(Multi_L_Constant, x, y, initial, bounds=bounds)),
+                   best_time(lambda: curve_fit(f, x, y, initial, bounds=bounds, jac=jac)))
+        results[n_peaks] = timings
+        print('{:>8} {:>9.3f} ms {:>9.3f} ms {:>11.3f} ms {:>7.1f} ms {:>7.1f} ms'.format(
+            n_peaks, *[t * 1e3 for t in timings]))
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -22,6 +22,7 @@ The fullfit class is the main thing here - sample use:
         This way, the IRF is only applied to the background-subtracted signal 
         bg function determines what function to use for the background, default is polynomial. Feel free to add your own functions here!
         set vary_const_bg to False if the spectrum is already (electronic) background subtracted and you're using an exponential fit
+        executor (optional) is a concurrent.futures executor (e.g. ProcessPoolExecutor()) used to optimise the regions of add_new_peak in parallel
     
 >>>ff.Run() # this does the actual fitting.
                 then the peaks are stored as 
@@ -63,6 +64,8 @@ The fitting works as follows:
     optionally, you can include the commented out self.optimize_peaks() here to optimise all the peak parameters together but I leave this to the end.
     
     add_new_peak() forcibly adds a peak to the signal similarly to in Iterative_Raman_fitting.
+    Each region is fitted independently (see fit_region) against the signal minus the existing peaks, using the analytic
+    gradient of the lineshape (see lineshapes.model_and_jacobian).
     
     
     
@@ -99,6 +102,8 @@ from scipy.optimize import curve_fit
 # import pywt
 from scipy.ndimage.filters import gaussian_filter
 from scipy.signal import argrelextrema
+import time
+from nplab.analysis.SERS_Fitting import lineshapes
 def sm(spec, sigma=3):
     return gaussian_filter(spec, sigma)
 
@@ -148,6 +153,30 @@ def cm_to_omega(cm):
     return 2*np.pi*constants.c*100.*cm
 
 
+def peak_search_loss(params, x, target, lineshape='L'):
+    '''
+    the loss minimised by fullfit.add_new_peak: sum(|line - target|), where
+    target is the signal minus the existing peaks, and its gradient
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        line, jacobian = lineshapes.model_and_jacobian(x, params, lineshape)
+    if not np.isfinite(jacobian).all():  # the width is 0
+        line, jacobian = np.nan_to_num(line), np.nan_to_num(jacobian)
+    residual = line-target
+    return np.sum(np.abs(residual)), np.dot(np.sign(residual), jacobian)
+
+
+def fit_region(x, target, initial_params, bounds, lineshape='L'):
+    '''
+    fits a single peak to target within bounds, starting from initial_params.
+    Returns the parameters and the loss.
+    Module level (rather than a method) so it can be run in a process pool.
+    '''
+    params = minimize(peak_search_loss, initial_params, args=(x, target, lineshape),
+                      jac=True, bounds=bounds).x
+    return params.tolist(), peak_search_loss(params, x, target, lineshape)[0]
+
+
 def reshape(List, n):
     while len(List) >= n:
         yield List[:n]
@@ -162,9 +191,11 @@ class fullfit(object):
                  order=7,
                  transmission=None,
                  bg_function='poly',
-                 vary_const_bg=True):
+                 vary_const_bg=True,
+                 executor=None):
 
         self.spec = np.array(spec)
+        self.executor = executor
         self.shifts = np.array(shifts)
         self.order = order
         self.peaks = []
@@ -211,7 +242,7 @@ class fullfit(object):
         """
         returns a sum of Lorenzians/Gaussians. 
         """
-        return np.sum(np.array([self.line(*peak) for peak in parameters]), axis=0)
+        return lineshapes.model(self.shifts, np.ravel(parameters), self.lineshape)
 
     def exponential(self, A, T, bg):
         '''
@@ -271,36 +302,33 @@ class fullfit(object):
             float(self.regions)
         Start = np.min(self.shifts)
 
-        results = []
-        loss_results = []
-
-        
         if not len(self.peaks):
             Current = np.array(self.shifts)*0
         else:
             Current = self.multi_line(self.peaks)
+        # the existing peaks don't change, so they're subtracted once
+        target = self.signal-Current
 
-   
-
-        def loss(params):
-            # *self.multi_L(self.shifts,*self.peaks))# if this overlaps with another lorentzian it's biased against it
-            return np.sum(np.abs(Current+self.line(*params)-self.signal))
-
+        initial_params = []
+        bounds = []
         for i in range(int(self.regions)):
-            bounds = [(0, np.inf), (i*sectionsize+Start, (i+1) *
-                                    sectionsize+Start), (0, max(self.shifts)-min(self.shifts))]
+            bounds.append([(0, np.inf), (i*sectionsize+Start, (i+1) *
+                                         sectionsize+Start), (0, max(self.shifts)-min(self.shifts))])
             Centre = (i+np.random.rand())*sectionsize+Start
             try:
                 Height = max(truncate(self.signal, self.shifts, i*sectionsize +
                                       Start, (i+1)*sectionsize+Start)[0])-min(self.signal)
             except:
                 Height = self.noise_threshold
-            params = [Height, Centre, self.width]
+            initial_params.append([Height, Centre, self.width])
 
-            params = minimize(loss, params, bounds=bounds).x.tolist()
-
-            results.append(params)
-            loss_results.append(loss(params))
+        # the regions are independent, so they can be optimised in parallel
+        n = len(initial_params)
+        mapper = map if self.executor is None else self.executor.map
+        fits = list(mapper(fit_region, [self.shifts]*n, [target]*n, initial_params,
+                           bounds, [self.lineshape]*n))
+        results = [params for params, _ in fits]
+        loss_results = [loss for _, loss in fits]
 
         sorted_indices = np.argsort(loss_results)
 
@@ -822,6 +850,53 @@ class fullfit(object):
 #
 
 
+def benchmark_region_search(region_numbers=(10, 40, 160), n_points=1600, n_peaks=8, lineshape='L', repeats=3):
+    '''
+    Prints the time taken by the region search of fullfit.add_new_peak (fitting a peak in each region), compared with
+    how it was done before fit_region: re-evaluating every existing peak in the loss, with a finite-difference gradient
+
+    :return: dict of number of regions: (before, after) times in seconds
+    '''
+    rng = np.random.RandomState(0)
+    shifts = np.linspace(200, 1800, n_points)
+    peaks = [[rng.uniform(50, 500), 250+1500*(i+0.5)/n_peaks, rng.uniform(5, 15)] for i in range(n_peaks)]
+    ff = fullfit(np.zeros(n_points), shifts, lineshape=lineshape)
+    ff.signal = ff.multi_line(peaks)+rng.normal(0, 5, n_points)
+    ff.peaks = peaks
+    target = ff.signal-ff.multi_line(ff.peaks)
+
+    def previous_search(initial_params, bounds):
+        '''the search that add_new_peak did before'''
+        Current = ff.multi_line(ff.peaks)
+
+        def loss(params):
+            return np.sum(np.abs(Current+ff.line(*params)-ff.signal))
+        with np.errstate(divide='ignore', invalid='ignore'):  # the width can reach 0
+            return [minimize(loss, params, bounds=bound).x.tolist() for params, bound in zip(initial_params, bounds)]
+
+    def best_time(function):
+        times = []
+        for i in range(repeats):
+            start = time.time()
+            function()
+            times.append(time.time()-start)
+        return min(times)
+
+    results = {}
+    print('{:>8} {:>10} {:>10}'.format('regions', 'before', 'after'))
+    for regions in region_numbers:
+        sectionsize = (shifts.max()-shifts.min())/float(regions)
+        bounds = [[(0, np.inf), (i*sectionsize+shifts.min(), (i+1)*sectionsize+shifts.min()),
+                   (0, shifts.max()-shifts.min())] for i in range(regions)]
+        initial_params = [[100., (i+rng.rand())*sectionsize+shifts.min(), PEAKWIDTH] for i in range(regions)]
+        timings = (best_time(lambda: previous_search(initial_params, bounds)),
+                   best_time(lambda: [fit_region(shifts, target, params, bound, lineshape)
+                                      for params, bound in zip(initial_params, bounds)]))
+        results[regions] = timings
+        print('{:>8} {:>7.0f} ms {:>7.0f} ms'.format(regions, *[t*1e3 for t in timings]))
+    return results
+
+
 if __name__ == '__main__':
     from nplab.analysis.example_data import SERS_and_shifts
     spec = SERS_and_shifts[0]
@@ -4,7 +4,7 @@ import re
 import numpy as np
 from pathlib import Path
 import h5py
-from scipy.ndimage import gaussian_filter
+from scipy.ndimage import gaussian_filter, gaussian_filter1d
 from scipy.signal import savgol_filter
 from functools import cached_property
 
@@ -115,16 +115,13 @@ class Spectrum(np.ndarray):
                           thresh=5,
                           smooth=30,
                           max_iterations=10):
-        '''wrapper around remove_cosmic_ray to allow 2d or 1d spectra
-        to be passed'''
-        func = lambda s: remove_cosmic_ray(s,
-                                           thresh=thresh,
-                                           smooth=smooth,
-                                           max_iterations=max_iterations)
-        if len(self.shape) == 2:
-            return self.__class__([func(s) for s in self], 
-                                  self.x,)
-        return self.__class__(func(self), self.x)
+        '''wrapper around remove_cosmic_ray, which cleans 1d spectra or each
+        spectrum of a stack (e.g. a time series) along the last axis'''
+        return self.__class__(remove_cosmic_ray(np.asarray(self),
+                                                thresh=thresh,
+                                                smooth=smooth,
+                                                max_iterations=max_iterations),
+                              self.x)
 
 class RamanSpectrum(Spectrum):
     '''
@@ -226,44 +223,49 @@ def remove_cosmic_ray(spectrum, thresh=5, smooth=30, max_iterations=10):
     max_iterations: 
         maximum iterations. Shouldn't matter how high it is as most spectra
         are done in 1-3. 
-    
+
+    spectrum can also be a stack of spectra (e.g. a time series), in which
+    case each spectrum along the last axis is cleaned on its own, but all of
+    them are filtered together.
     '''
-    _len = len(spectrum)
-    cleaned = np.copy(spectrum) # prevent modification in place
-    
-    for i in range(max_iterations): 
-        noise_spectrum = cleaned/gaussian_filter(cleaned, smooth)
+    cleaned = np.array(spectrum) # prevent modification in place
+    rows = cleaned.reshape(-1, cleaned.shape[-1])
+    # ^ a view, so cleaning the rows cleans the spectrum. Each row is cleaned
+    # independently, exactly as if it were passed on its own.
+    active = np.arange(len(rows)) # the rows that may still contain cosmic rays
+
+    for i in range(max_iterations):
+        if not len(active):
+            break
+        smoothed = gaussian_filter1d(rows[active], smooth, axis=-1)
+        noise_spectrum = rows[active]/smoothed
         # ^ should be a flat, noisy line, with a large spike where there's
         # a cosmic ray.
-        noise_level = np.sqrt(np.var(noise_spectrum)) 
+        noise_level = np.sqrt(np.var(noise_spectrum, axis=-1, keepdims=True))
         # average deviation of a datapoint from the mean
-        mean_noise = noise_spectrum.mean() # should be == 1
-        spikes = np.arange(_len)[noise_spectrum > mean_noise+(thresh*noise_level)]
-        # the indices of the datapoints that are above the threshold
-       
-        # now we add all data points to either side of the spike that are 
-        # above the noise level (but not necessarily the thresh*noise_level)
-        rays = set()
-        for spike in spikes:
-            for side in (-1, 1): # left and right
-                step = 0
-                while 0 <= (coord := spike+(side*step)) <= _len-1:
-                    # staying in the spectrum
-                    
-                    if noise_spectrum[coord] > mean_noise + noise_level:
-                        rays.add(coord)
-                        step += 1
-                    else:
-                        break
-        rays = list(rays) # convert to list for indexing
-        if rays: # if there are any cosmic rays
-            cleaned[rays] = gaussian_filter(cleaned, smooth)[rays]
-            # replace the regions with the smooothed spectrum
-            continue # and repeat, as the smoothed spectrum will still be 
-                     # quite affected by the cosmic ray. 
-                     
-        # until no cosmic rays are found
-        return cleaned
+        mean_noise = noise_spectrum.mean(axis=-1, keepdims=True) # should be == 1
+        above = noise_spectrum > mean_noise + noise_level
+        spikes = above & (noise_spectrum > mean_noise+(thresh*noise_level))
+        # the datapoints that are above the threshold
+
+        # now we add all data points to either side of the spike that are
+        # above the noise level (but not necessarily the thresh*noise_level):
+        # label each run of points above the noise level, and keep the runs
+        # that contain a spike
+        starts = above.copy()
+        starts[:, 1:] &= ~above[:, :-1]
+        runs = np.cumsum(starts.ravel()).reshape(above.shape)
+        has_spike = np.zeros(runs.max(initial=0) + 1, dtype=bool)
+        has_spike[runs[spikes]] = True
+        rays = above & has_spike[runs]
+        has_rays = rays.any(axis=-1)
+        # replace the regions with the smooothed spectrum, and repeat for the
+        # rows that had cosmic rays, as the smoothed spectrum will still be
+        # quite affected by them, until no cosmic rays are found
+        cleaned_rows = rows[active]
+        cleaned_rows[rays] = smoothed[rays]
+        rows[active] = cleaned_rows
+        active = active[has_rays]
     return cleaned
 
 if __name__ ==  '__main__':
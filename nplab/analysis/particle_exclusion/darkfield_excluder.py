@@ -14,26 +14,80 @@ from pathlib import Path
 import matplotlib.pyplot as plt
 import numpy as np
 from nplab.analysis import latest_scan, load_h5, Spectrum
+from nplab.analysis.particle_index import open_index
+from nplab.analysis.particle_exclusion.exclusion_runner import Criterion
 from nplab.analysis.particle_exclusion.utils import load_rejected, save_rejected
 from scipy import ndimage, signal
 from tqdm import tqdm
 
 
 
+def clean_darkfield(spectrum, sigma):
+    '''cleans a DF spectrum and makes it a single spectrum, and smooths it. Returns both'''
+    spec = spectrum.split(450, 950).max(axis=0).remove_cosmic_ray()
+    smoothed_spec = ndimage.gaussian_filter1d(spec, sigma=sigma, axis=0)
+    return spec, smoothed_spec
+
+
+class DarkfieldCriterion(Criterion):
+    '''DarkfieldExcluder as a Criterion for ExclusionRunner. The smoothed spectrum and its peak wavelength are cached,
+    so changing cutoff_wavelength is instantaneous'''
+    name = 'darkfield'
+
+    def __init__(self, DF_name='lab.z_scan0', cutoff_wavelength=650, sigma=6):
+        self.DF_name = DF_name
+        self.cutoff_wavelength = cutoff_wavelength
+        self.sigma = sigma
+
+    def parameters(self):
+        return {'DF_name': self.DF_name, 'sigma': self.sigma}
+
+    def read(self, group):
+        return Spectrum.from_h5(group[self.DF_name])
+
+    def features(self, spectrum):
+        spec, smoothed_spec = clean_darkfield(spectrum, self.sigma)
+        return {'smoothed_spectrum': np.asarray(smoothed_spec),
+                'peak_wavelength': spec.wl[np.argmax(smoothed_spec)]}
+
+    def scores(self, features):
+        return features['peak_wavelength']
+
+    def reject(self, scores):
+        return scores <= self.cutoff_wavelength
+
+
 class DarkfieldExcluder():
     '''excludes particles who's darkfield spectrum peaks below a threshold (set by a user) '''
 
-    def __init__(self, scan, DF_name='lab.z_scan0',cutoff_wavelength=650, sigma=6):
+    def __init__(self, scan, DF_name='lab.z_scan0',cutoff_wavelength=650, sigma=6, index=None):
         # DF_name is the name of the group of the darkfield data,
         # if the global maximum of the darkfield spectrum is below cutoff_wavelength the particle will be excluded
         # sigma is the width of the gaussian filter used for smoothing
+        # index is an optional ParticleScanIndex of the scan (see nplab.analysis.particle_index), used to read the
+        # spectra in batches instead of one particle group at a time
         self.scan = scan
+        self.index = index
         self.DF_name = DF_name
         # the DF maximum should be above this wavelength:
         self.cutoff_wavelength = cutoff_wavelength
         self.sigma = sigma  # smoothing weight
         self.fig_dir = Path() / 'spectra figures'  # may not exist yet
 
+    def criterion(self):
+        '''this excluder as a Criterion, to run it along with others (see exclusion_runner)'''
+        return DarkfieldCriterion(self.DF_name, self.cutoff_wavelength, self.sigma)
+
+    def spectra(self):
+        '''yields (name, DF spectrum) for each particle'''
+        if self.index is not None:
+            for names, batch in self.index.iter_spectra(self.DF_name):
+                yield from zip(names, batch)
+            return
+        for name, group in self.scan.items():
+            if name.startswith('Particle'):
+                yield name, Spectrum.from_h5(group[self.DF_name]) # extracts the DF spectrum from file
+
     def run(self, plot=False, overwrite=True):
         if plot:
             if not self.fig_dir.exists(
@@ -42,15 +96,10 @@ class DarkfieldExcluder():
 
         rejected = set() if overwrite else load_rejected()
         total = len(self.scan)
-        for name, group in tqdm(list(self.scan.items())):
-            if not name.startswith('Particle'):
-                continue
-            temp_spec=Spectrum.from_h5(group[self.DF_name]) # extracts the DF spectrum from file
-            spec= temp_spec.split(450, 950).max(axis=0).remove_cosmic_ray() # cleans and makes a single spectrum
+        for name, temp_spec in tqdm(self.spectra(), total=total):
+            spec, smoothed_spec = clean_darkfield(temp_spec, self.sigma)
             wl=spec.wl # extracts wavelength vector
-            smoothed_spec = ndimage.gaussian_filter1d(spec, sigma=self.sigma,axis=0) # smooth data
-            max_ind=np.where(smoothed_spec==np.max(smoothed_spec))[0] # finds the global maximum
-            wl_max=wl[max_ind] # finds the wavelength of global maximum
+            wl_max=wl[np.argmax(smoothed_spec)] # finds the wavelength of global maximum
             reject_flag=False
             if wl_max <= self.cutoff_wavelength:
                 rejected.add(name)
@@ -71,5 +120,6 @@ class DarkfieldExcluder():
 
 if __name__ == '__main__':
     scan = latest_scan(load_h5())
-    mie = DarkfieldExcluder(scan)
-    mie.run()
+    with open_index(scan, stacked=('lab.z_scan0',)) as index:
+        mie = DarkfieldExcluder(scan, index=index)
+        mie.run()
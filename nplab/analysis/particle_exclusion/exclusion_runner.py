@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+'''
+Runs several particle exclusion criteria in one pass over a scan.
+
+Each criterion is split into an expensive part that doesn't depend on its thresholds (features: e.g. the smoothed DF
+spectrum, or the radial intensity profile around an image's centre of mass), and a cheap, vectorised part that turns
+the features of every particle into scores and decides which particles to reject.
+
+ExclusionRunner reads each particle's data once for all the criteria, computes the features in a pool of worker
+processes, and stores them, the scores and the rejections in an HDF5 group (by default in a sidecar file next to the
+data, data_exclusion.h5, as the data file is usually opened read-only). Features are only computed for particles that
+don't have them yet, so running again with different thresholds - or after more particles have been scanned - only
+does the cheap part, or the new particles.
+
+>>> scan = latest_scan(load_h5())
+>>> runner = ExclusionRunner(scan, [DarkfieldCriterion(), MonotonousImageCriterion()])
+>>> rejected = runner.run()
+>>> runner.criteria[0].cutoff_wavelength = 700
+>>> rejected = runner.run()  # instantaneous
+'''
+import contextlib
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import h5py
+import numpy as np
+
+from nplab.analysis.particle_index import PARTICLE_PREFIX, particle_number, sidecar_path
+from nplab.analysis.particle_exclusion.utils import save_rejected
+
+STRING = h5py.string_dtype()
+
+
+class Criterion():
+    '''base class of exclusion criteria. Subclasses should be picklable (defined at module level) so that features
+    can be computed in worker processes'''
+    name = 'criterion'
+
+    def parameters(self):
+        '''the parameters that the features depend on. Cached features are discarded if these change'''
+        return {}
+
+    def read(self, group):
+        '''read the data this criterion needs from a particle group (runs in the main process)'''
+        raise NotImplementedError
+
+    def features(self, data):
+        '''{name: array} of features computed from what read() returned (runs in a worker process). Each feature
+        should have the same shape for every particle'''
+        raise NotImplementedError
+
+    def scores(self, features):
+        '''an array of scores, one per particle, given {name: array of features stacked for every particle}'''
+        raise NotImplementedError
+
+    def reject(self, scores):
+        '''boolean array, True for the particles to reject'''
+        raise NotImplementedError
+
+
+_criteria = None  # the criteria of a worker process, see _init_worker
+
+
+def _init_worker(criteria):
+    global _criteria
+    _criteria = criteria
+
+
+def _extract(data):
+    '''the features of one particle, for each criterion that needs them'''
+    return [None if d is None else c.features(d) for c, d in zip(_criteria, data)]
+
+
+def _append(group, name, values, dtype=None):
+    values = np.asarray(values)
+    if name not in group:
+        group.create_dataset(name, shape=(0,) + values.shape[1:], maxshape=(None,) + values.shape[1:],
+                             dtype=values.dtype if dtype is None else dtype,
+                             chunks=(64 if values.ndim > 1 else 1024,) + values.shape[1:])
+    dset = group[name]
+    n = len(dset)
+    dset.resize(n + len(values), axis=0)
+    dset[n:] = values
+
+
+class ExclusionRunner():
+    '''runs a list of criteria over the particles of a scan, caching their features'''
+
+    def __init__(self, scan, criteria, store=None, processes=None, batch_size=256):
+        '''
+        scan: the ParticleScannerScan group
+        criteria: list of Criterion instances (with different names)
+        store: writable HDF5 group for the features and results. Defaults to a group in the sidecar file, which is
+            only open while the runner is using it (self.store is None otherwise)
+        processes: number of worker processes (defaults to the number of CPUs). 0 or 1 computes features in this
+            process, as happens anyway if the criteria can't be pickled
+        batch_size: number of particles read and sent to the workers at a time
+        '''
+        self.scan = scan
+        self.criteria = list(criteria)
+        self.store = store
+        self.processes = os.cpu_count() if processes is None else processes
+        self.batch_size = batch_size
+
+    @contextlib.contextmanager
+    def _open_store(self):
+        '''the store, opening the sidecar file (and closing it afterwards) if it isn't open already'''
+        if self.store is not None:
+            yield self.store
+            return
+        with h5py.File(sidecar_path(self.scan, 'exclusion'), 'a') as f:
+            self.store = f.require_group(self.scan.name.strip('/'))
+            try:
+                yield self.store
+            finally:
+                self.store = None
+
+    def _criterion_group(self, criterion):
+        '''the group of cached features of a criterion, emptied if its parameters have changed'''
+        parameters = repr(sorted(criterion.parameters().items()))
+        if criterion.name in self.store and self.store[criterion.name].attrs.get('parameters') != parameters:
+            del self.store[criterion.name]
+        group = self.store.require_group(criterion.name)
+        group.attrs['parameters'] = parameters
+        group.require_group('features')
+        return group
+
+    def _cached_names(self, group):
+        return set(group['name'].asstr()[()]) if 'name' in group else set()
+
+    def particle_names(self):
+        return sorted((name for name in self.scan.keys() if name.startswith(PARTICLE_PREFIX)), key=particle_number)
+
+    def _pool(self):
+        if self.processes > 1:
+            try:
+                pickle.dumps(self.criteria)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                print('the criteria can\'t be pickled, so the features are computed in this process')
+            else:
+                return ProcessPoolExecutor(self.processes, initializer=_init_worker, initargs=(self.criteria,))
+        _init_worker(self.criteria)
+        return None
+
+    def update_features(self):
+        '''compute the features of every particle that doesn't have them yet, for every criterion, in one pass'''
+        with self._open_store():
+            groups = [self._criterion_group(c) for c in self.criteria]
+            cached = [self._cached_names(g) for g in groups]
+            names = [n for n in self.particle_names() if any(n not in c for c in cached)]
+            if not names:
+                return
+            pool = self._pool()
+            try:
+                for start in range(0, len(names), self.batch_size):
+                    batch = names[start:start + self.batch_size]
+                    data = [[None if name in cache else c.read(self.scan[name])
+                             for c, cache in zip(self.criteria, cached)] for name in batch]
+                    if pool is None:
+                        features = list(map(_extract, data))
+                    else:
+                        features = list(pool.map(_extract, data,
+                                                 chunksize=max(1, len(batch) // (4 * self.processes))))
+                    for i, group in enumerate(groups):
+                        done = [(name, f[i]) for name, f in zip(batch, features) if f[i] is not None]
+                        if not done:
+                            continue
+                        _append(group, 'name', np.array([name for name, _ in done], dtype=object), dtype=STRING)
+                        for key in done[0][1]:
+                            _append(group['features'], key, np.array([f[key] for _, f in done]))
+                    self.store.file.flush()
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+
+    def features(self, criterion):
+        '''(names, {name: array}) of the cached features of a criterion (or its name)'''
+        with self._open_store():
+            if isinstance(criterion, str):
+                criterion = next(c for c in self.criteria if c.name == criterion)
+            group = self.store[criterion.name]
+            names = group['name'].asstr()[()] if 'name' in group else np.array([], dtype=object)
+            return names, {key: dset[()] for key, dset in group['features'].items()}
+
+    def run(self, save_txt=False, path=None):
+        '''compute any missing features, then the scores and rejections of every criterion, which are saved in the
+        store. Returns the set of particles rejected by any criterion, which is also saved to rejected.txt (see
+        utils.save_rejected) if save_txt'''
+        with self._open_store():
+            self.update_features()
+            rejected = set()
+            for criterion in self.criteria:
+                names, features = self.features(criterion)
+                scores = np.asarray(criterion.scores(features))
+                reject = np.asarray(criterion.reject(scores), dtype=bool)
+                group = self.store[criterion.name]
+                for key, values in (('score', scores), ('rejected', reject)):
+                    if key in group:
+                        del group[key]
+                    group[key] = values
+                group.attrs['rejected_fraction'] = reject.mean() if len(reject) else 0
+                rejected.update(names[reject])
+                print(f'{criterion.name}: {reject.mean() * 100 if len(reject) else 0:.1f}% rejected')
+            if 'rejected' in self.store:
+                del self.store['rejected']
+            self.store.create_dataset('rejected', data=np.array(sorted(rejected, key=particle_number), dtype=object),
+                                      dtype=STRING)
+            self.store.file.flush()
+            if save_txt:
+                save_rejected(rejected, path=path, overwrite=True)
+            return rejected
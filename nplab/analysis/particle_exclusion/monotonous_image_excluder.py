@@ -10,6 +10,7 @@ import cv2
 import matplotlib.pyplot as plt
 import numpy as np
 from nplab.analysis import latest_scan, load_h5
+from nplab.analysis.particle_exclusion.exclusion_runner import Criterion
 from nplab.analysis.particle_exclusion.utils import load_rejected, save_rejected
 from scipy import ndimage, signal
 from tqdm import tqdm
@@ -26,6 +27,75 @@ def center_of_mass(grey_image, circle_position, radius):
     return com(XX), com(YY)
 
 
+def radial_profile(image, exclusion_radius, sigma):
+    '''the 95th percentile of the smoothed intensity in rings around the center
+    of mass of the middle of an image. Returns the center of mass, the radii,
+    the profile and the smoothed image'''
+    im_center = tuple(np.array(image.shape)[:2] // 2)
+    grey_image = image.sum(axis=-1)
+    smoothed_image = ndimage.gaussian_filter(grey_image, sigma)
+
+    com = center_of_mass(grey_image, im_center, exclusion_radius)
+    YY, XX = np.meshgrid(*list(map(range, grey_image.shape)),
+                         indexing='ij')  # np coords
+    dist_from_center = np.sqrt((XX - com[0])**2 + (YY - com[1])**2)
+
+    radially_averaged = []
+    radii = np.arange(exclusion_radius)
+    for inner, outer in zip(radii, radii[1:]):
+        mask = np.logical_and(dist_from_center <= outer,
+                              dist_from_center > inner)
+        radially_averaged.append(
+            np.percentile(smoothed_image[mask], 95))
+    radially_averaged.append(0)
+    # so if the intensity was increasing at the edge of the plot,
+    # it's recognized as a local maximum, and rejected.
+    return com, radii, radially_averaged, smoothed_image
+
+
+class MonotonousImageCriterion(Criterion):
+    '''MonotonousImageExcluder as a Criterion for ExclusionRunner. The center of
+    mass and radial profile are cached, so changing maxima_region_fraction is
+    instantaneous'''
+    name = 'monotonous_image'
+
+    def __init__(self,
+                 image_name='CWL.thumb_image_0',
+                 exclusion_radius=13,  # pixels
+                 maxima_region_fraction=0.5,
+                 sigma=2):
+        self.image_name = image_name
+        self.exclusion_radius = exclusion_radius
+        self.maxima_region_fraction = maxima_region_fraction
+        self.sigma = sigma
+
+    def parameters(self):
+        return {'image_name': self.image_name,
+                'exclusion_radius': self.exclusion_radius,
+                'sigma': self.sigma}
+
+    def read(self, group):
+        return group[self.image_name][()]
+
+    def features(self, image):
+        com, _, radially_averaged, _ = radial_profile(
+            image, self.exclusion_radius, self.sigma)
+        return {'center_of_mass': np.array(com),
+                'radial_profile': np.array(radially_averaged)}
+
+    def scores(self, features):
+        '''the number of maxima in each radial profile'''
+        profiles = features['radial_profile']
+        if not len(profiles):
+            return np.zeros(0, dtype=int)
+        start = int(self.exclusion_radius*self.maxima_region_fraction)
+        rows, _ = signal.argrelextrema(profiles[:, start:], np.greater, axis=1)
+        return np.bincount(rows, minlength=len(profiles))
+
+    def reject(self, scores):
+        return scores > 0
+
+
 class MonotonousImageExcluder():
     '''the idea is that if a particle is isolated, a plot of image intensity vs.
     radius should decrease monotonously. This rejects a particle if it doesn't'''
@@ -45,6 +115,11 @@ class MonotonousImageExcluder():
         self.sigma = sigma  # smoothing weight
         self.fig_dir = Path() / 'exclusion figures'  # may not exist yet
 
+    def criterion(self):
+        '''this excluder as a Criterion, to run it along with others (see exclusion_runner)'''
+        return MonotonousImageCriterion(self.image_name, self.exclusion_radius,
+                                        self.maxima_region_fraction, self.sigma)
+
     def run(self, plot=False, overwrite=True):
         if plot:
             if not self.fig_dir.exists(
@@ -57,25 +132,8 @@ class MonotonousImageExcluder():
             if not name.startswith('Particle'):
                 continue
             im = group[self.image_name]
-            im_center = tuple(np.array(im.shape)[:2] // 2)
-            grey_image = im[()].sum(axis=-1)
-            smoothed_image = ndimage.gaussian_filter(grey_image, self.sigma)
-
-            com = center_of_mass(grey_image, im_center, self.exclusion_radius)
-            YY, XX = np.meshgrid(*list(map(range, grey_image.shape)),
-                                 indexing='ij')  # np coords
-            dist_from_center = np.sqrt((XX - com[0])**2 + (YY - com[1])**2)
-
-            radially_averaged = []
-            radii = np.arange(self.exclusion_radius)
-            for inner, outer in zip(radii, radii[1:]):
-                mask = np.logical_and(dist_from_center <= outer,
-                                      dist_from_center > inner)
-                radially_averaged.append(
-                    np.percentile(smoothed_image[mask], 95))
-            radially_averaged.append(0)
-            # so if the intensity was increasing at the edge of the plot,
-            # it's recognized as a local maximum, and rejected.
+            com, radii, radially_averaged, smoothed_image = radial_profile(
+                im[()], self.exclusion_radius, self.sigma)
 
             maxima = signal.argrelextrema(
                 np.array(radially_averaged)[
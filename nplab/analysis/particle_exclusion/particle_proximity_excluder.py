@@ -9,15 +9,61 @@ import numpy as np
 import pyqtgraph as pg
 import qdarkstyle
 from nplab.analysis import latest_scan, load_h5
+from nplab.analysis.particle_exclusion.exclusion_runner import Criterion
 from nplab.analysis.particle_exclusion.utils import distance, save_rejected
 from nplab.ui.ui_tools import QuickControlBox
-from nplab.utils.image_filter_box import Image_Filter_box
+from nplab.utils.image_filter_box import (Image_Filter_box,
+                                         STBOC_with_size_filter)
 from nplab.utils.notified_property import (DumbNotifiedProperty,
                                            register_for_property_changes)
 from PyQt5 import QtWidgets
 from tqdm import tqdm
 
 
+FILTER_SETTINGS = ('bin_fac', 'bilat_size', 'bilat_height', 'threshold',
+                   'min_size', 'max_size', 'morph_kernel_size')
+
+
+class ProximityCriterion(Criterion):
+    '''ParticleProximityExcluder as a Criterion for ExclusionRunner. The gap
+    between the central particle and its nearest neighbour is cached, so
+    changing exclusion_radius is instantaneous'''
+    name = 'proximity'
+
+    def __init__(self, filter_settings, image_name='CWL.thumb_image_0',
+                 exclusion_radius=13):
+        # filter_settings are the keyword arguments of
+        # image_filter_box.STBOC_with_size_filter, see FILTER_SETTINGS
+        self.filter_settings = dict(filter_settings)
+        self.image_name = image_name
+        self.exclusion_radius = exclusion_radius
+
+    def parameters(self):
+        return {'image_name': self.image_name, **self.filter_settings}
+
+    def read(self, group):
+        return group[self.image_name][()]
+
+    def features(self, image):
+        im_center = tuple(np.array(image.shape)[:2] // 2)
+        centers_radii = STBOC_with_size_filter(
+            image, return_centers_and_radii=True, **self.filter_settings)
+        gap = np.inf  # between the edges of the central particle and its nearest neighbour
+        if centers_radii is not None and len(centers_radii[0]) > 1:
+            particles = list(zip(*centers_radii))
+            center, radius = min(particles,
+                                 key=lambda c: distance(c[0], im_center))
+            gap = min(distance(c, center) - r - radius
+                      for c, r in particles if c is not center)
+        return {'gap': gap}
+
+    def scores(self, features):
+        return features['gap']
+
+    def reject(self, scores):
+        return scores < self.exclusion_radius
+
+
 class ParticleProximityExcluder(QtWidgets.QWidget):
     '''the general idea is that this widget identifies the particles in each 
     thumb image, and if any of them are too close to the central particle, 
@@ -80,6 +126,13 @@ class ParticleProximityExcluder(QtWidgets.QWidget):
                                 (255, 255, 255), 1)
         self.img_widget.setImage(im)
 
+    def criterion(self):
+        '''this excluder, with the current filter settings, as a Criterion to
+        run it along with others (see exclusion_runner)'''
+        settings = {k: getattr(self.filter_box, k) for k in FILTER_SETTINGS}
+        return ProximityCriterion(settings, self.image_name,
+                                  self.exclusion_radius)
+
     def run(self, path=None, overwrite=False):
         rejected = set()
         for name, group in tqdm(list(self.scan.items())):
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+'''
+Columnar index of a ParticleScannerScan.
+
+A particle scan stores each particle in its own group (Particle_0, Particle_1...), so anything that needs one dataset
+from every particle has to open thousands of groups and datasets, one at a time. ParticleScanIndex walks the scan once
+and stores what was found as columns (one row per particle) in a separate HDF5 group - by default in a sidecar file
+next to the data, so the data file can stay read-only:
+
+    particle_id, name                 - the particle number and group name
+    datasets/<name>/path, shape       - where each dataset is, and its shape (shape is -1 where it's missing)
+    datasets/<name>/attrs/<attr>      - selected attributes (e.g. background, reference); stored once, as an attribute,
+                                        if every particle has the same value
+    datasets/<name>/data              - optionally, the data of every particle stacked into one chunked array
+
+Calling update() again only indexes particles that have been added since. Spectra are then served in batches (as 2D
+or 3D Spectrum arrays, background-subtracted and referenced like Spectrum.from_h5), read from the stacked column if
+there is one, and otherwise straight from each dataset's path, without enumerating the scan again.
+
+>>> scan = latest_scan(load_h5())
+>>> with open_index(scan, stacked=('lab.z_scan0',)) as index:  # closes the sidecar file afterwards
+>>>     for names, spectra in index.iter_spectra('lab.z_scan0', batch_size=256):
+            ...
+'''
+from pathlib import Path
+
+import h5py
+import numpy as np
+
+from nplab.analysis import Spectrum
+
+PARTICLE_PREFIX = 'Particle_'
+SPECTRUM_ATTRS = ('wavelengths', 'background', 'reference')
+STRING = h5py.string_dtype()
+
+
+def particle_number(name):
+    '''Particle_12 -> 12'''
+    return int(name.split('_')[-1])
+
+
+def sidecar_path(scan, suffix='index'):
+    '''the default index file for a scan: data.h5 -> data_index.h5, in the same folder'''
+    path = Path(scan.file.filename)
+    return path.with_name(f'{path.stem}_{suffix}.h5')
+
+
+def open_index(scan, path=None, update=True, **kwargs):
+    '''open (or create) the index of a scan in a sidecar file, and bring it up to date.
+    kwargs are passed to ParticleScanIndex. The file is closed by the index's close(), or at the end of a with block'''
+    index_file = h5py.File(sidecar_path(scan) if path is None else path, 'a')
+    try:
+        index = ParticleScanIndex(scan, index_file.require_group(scan.name.strip('/')), **kwargs)
+        index._file = index_file
+        if update:
+            index.update()
+    except Exception:
+        index_file.close()
+        raise
+    return index
+
+
+def _take(dataset, rows):
+    '''dataset[rows], reading a single slice if the rows are consecutive'''
+    if rows[-1] - rows[0] + 1 == len(rows):
+        return dataset[rows[0]:rows[-1] + 1]
+    return dataset[rows]
+
+
+def _same(a, b):
+    return np.shape(a) == np.shape(b) and np.array_equal(a, b)
+
+
+class ParticleScanIndex:
+    '''Columnar index of the particles in a scan, stored in an HDF5 group (see module docstring)'''
+
+    def __init__(self, scan, group, stacked=(), attrs=SPECTRUM_ATTRS, chunk_rows=64):
+        '''
+        scan: the ParticleScannerScan group
+        group: the (writable) HDF5 group to store the index in. Can be inside the scan's file, or a sidecar
+        stacked: names of datasets (relative to each particle group) whose data should be copied into the index
+        attrs: names of the dataset attributes to index
+        chunk_rows: number of particles per chunk of the stacked data
+        '''
+        self.scan = scan
+        self.group = group
+        self.stacked = tuple(stacked)
+        self.attrs = tuple(attrs)
+        self.chunk_rows = chunk_rows
+        self.group.attrs['scan'] = scan.name
+        self.group.attrs['file'] = str(scan.file.filename)
+        self._file = None  # the sidecar file, if open_index opened it
+
+    def close(self):
+        '''close the sidecar file opened by open_index (an index in a group given to the constructor is left open)'''
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.group['particle_id']) if 'particle_id' in self.group else 0
+
+    @property
+    def names(self):
+        return self.group['name'].asstr()[()] if 'name' in self.group else np.array([], dtype=object)
+
+    @property
+    def particle_ids(self):
+        return self.group['particle_id'][()] if 'particle_id' in self.group else np.array([], dtype=int)
+
+    @property
+    def dataset_names(self):
+        return list(self.group['datasets'].keys()) if 'datasets' in self.group else []
+
+    def row(self, name):
+        '''the row of the index of a particle (given its name or number)'''
+        number = particle_number(name) if isinstance(name, str) else int(name)
+        rows = np.flatnonzero(self.particle_ids == number)
+        if not len(rows):
+            raise KeyError(f'{name} is not in the index')
+        return int(rows[0])
+
+    # building
+    def update(self):
+        '''index any particles that aren't in the index yet. Returns the number added'''
+        known = set(self.particle_ids.tolist())
+        new_names = sorted((name for name in self.scan.keys()
+                            if name.startswith(PARTICLE_PREFIX) and particle_number(name) not in known),
+                           key=particle_number)
+        if not new_names:
+            return 0
+        start = len(self)
+        rows = [self._walk(self.scan[name]) for name in new_names]
+        self._append('particle_id', np.array([particle_number(n) for n in new_names]))
+        self._append('name', np.array(new_names, dtype=object), dtype=STRING)
+        all_datasets = set(self.dataset_names).union(*(row.keys() for row in rows))
+        for dataset_name in sorted(all_datasets):
+            self._add_dataset_rows(dataset_name, start, [row.get(dataset_name) for row in rows])
+        self.group.file.flush()
+        return len(new_names)
+
+    def _walk(self, particle_group):
+        '''{relative path: dataset} for every dataset in a particle group'''
+        datasets = {}
+
+        def visit(name, obj):
+            if isinstance(obj, h5py.Dataset):
+                datasets[name] = obj
+        particle_group.visititems(visit)
+        return datasets
+
+    def _append(self, column, values, dtype=None, group=None):
+        group = self.group if group is None else group
+        values = np.asarray(values)
+        if column not in group:
+            group.create_dataset(column, shape=(0,) + values.shape[1:], maxshape=(None,) + values.shape[1:],
+                                 dtype=values.dtype if dtype is None else dtype,
+                                 chunks=(self.chunk_rows if values.ndim > 1 else 1024,) + values.shape[1:])
+        dset = group[column]
+        n = len(dset)
+        dset.resize(n + len(values), axis=0)
+        dset[n:] = values
+
+    def _add_dataset_rows(self, dataset_name, start, datasets):
+        '''add a row for each new particle to the columns of one dataset.
+        datasets has one entry (a Dataset or None) for each new particle'''
+        g = self.group.require_group('datasets').require_group(dataset_name.replace('/', '\\'))
+        if 'path' not in g:  # a dataset that earlier particles didn't have
+            self._append('path', np.full(start, '', dtype=object), dtype=STRING, group=g)
+        self._append('path', np.array([d.name if d is not None else '' for d in datasets], dtype=object),
+                     dtype=STRING, group=g)
+        ndim = max(len(d.shape) for d in datasets if d is not None) if any(datasets) else 0
+        ndim = max(ndim, g['shape'].shape[1] if 'shape' in g else 0)
+        shapes = np.full((len(datasets), ndim), -1)
+        for i, d in enumerate(datasets):
+            if d is not None:
+                shapes[i, :len(d.shape)] = d.shape
+        if 'shape' not in g:
+            self._append('shape', np.full((start, ndim), -1), group=g)
+        elif g['shape'].shape[1] < ndim:  # more dimensions than before: rewrite the column
+            old = g['shape'][()]
+            del g['shape']
+            self._append('shape', np.pad(old, ((0, 0), (0, ndim - old.shape[1])), constant_values=-1), group=g)
+        self._append('shape', shapes, group=g)
+        for attr in self.attrs:
+            self._add_attr_rows(g, attr, start, [d.attrs.get(attr) if d is not None else None for d in datasets])
+        if dataset_name in self.stacked:
+            self._add_stacked_rows(g, start, datasets)
+
+    def _add_attr_rows(self, g, attr, start, values):
+        '''attributes are stored once (as an attribute of the attrs group) while every particle has the same value,
+        and as a column (one row per particle) once they differ'''
+        attrs = g.require_group('attrs')
+        present = [v for v in values if v is not None]
+        if attr in attrs:  # already a column
+            fill = attrs[attr][-1] if len(attrs[attr]) else present[0]
+            new_rows = [v if v is not None else fill for v in values]
+        else:
+            if not present:
+                return
+            constant = attrs.attrs[attr] if attr in attrs.attrs else present[0]
+            if all(_same(v, constant) for v in present):
+                attrs.attrs[attr] = constant
+                return
+            # the values differ between particles, so expand the constant into a column
+            new_rows = [constant] * start + [v if v is not None else constant for v in values]
+        if len(set(np.shape(v) for v in new_rows)) > 1:
+            return  # values of different shapes can't be stored as a column
+        if attr in attrs.attrs:
+            del attrs.attrs[attr]
+        self._append(attr, np.array(new_rows), group=attrs)
+
+    def _add_stacked_rows(self, g, start, datasets):
+        shape = next((d.shape for d in datasets if d is not None), None)
+        if 'data' in g:
+            shape = g['data'].shape[1:]
+        elif shape is None:
+            return
+        else:
+            g.create_dataset('data', shape=(start,) + shape, maxshape=(None,) + shape, dtype='f4',
+                             chunks=(self.chunk_rows,) + shape, fillvalue=np.nan)
+            g.create_dataset('stacked', shape=(start,), maxshape=(None,), dtype=bool, chunks=(1024,))
+        data, stacked = g['data'], g['stacked']
+        n = len(data)
+        data.resize(n + len(datasets), axis=0)
+        stacked.resize(n + len(datasets), axis=0)
+        block = np.full((len(datasets),) + shape, np.nan, dtype='f4')
+        flags = np.zeros(len(datasets), dtype=bool)
+        for i, d in enumerate(datasets):
+            if d is not None and d.shape == shape:
+                d.read_direct(block, dest_sel=np.s_[i])
+                flags[i] = True
+        data[n:] = block  # particles whose shape didn't match are read from the data file instead
+        stacked[n:] = flags
+
+    # loading
+    def _dataset_group(self, dataset_name):
+        return self.group['datasets'][dataset_name.replace('/', '\\')]
+
+    def has(self, dataset_name):
+        '''boolean mask of the particles that have a given dataset'''
+        if 'datasets' not in self.group or dataset_name.replace('/', '\\') not in self.group['datasets']:
+            return np.zeros(len(self), dtype=bool)
+        return self._dataset_group(dataset_name)['shape'][:, 0] >= 0
+
+    def shapes(self, dataset_name):
+        return self._dataset_group(dataset_name)['shape'][()]
+
+    def attr(self, dataset_name, attr, rows=slice(None)):
+        '''values of an indexed attribute: a single value if it's the same for every particle, else one per row'''
+        attrs = self._dataset_group(dataset_name)['attrs']
+        if attr in attrs.attrs:
+            return attrs.attrs[attr]
+        return attrs[attr][rows]
+
+    def read(self, rows, dataset_name):
+        '''the raw data of a dataset for a particle (a row number or particle name) or, given a slice or an array of
+        (increasing) rows, a list with the data of each'''
+        if isinstance(rows, str):
+            rows = self.row(rows)
+        g = self._dataset_group(dataset_name)
+        single = np.isscalar(rows)
+        rows = np.array([rows]) if single else np.arange(len(self))[rows]
+        if 'data' in g and len(rows):
+            stacked, block = _take(g['stacked'], rows), _take(g['data'], rows)
+        else:
+            stacked = np.zeros(len(rows), dtype=bool)
+        paths = _take(g['path'].asstr(), rows) if len(rows) else []
+        data = [block[i] if stacked[i] else (self.scan.file[paths[i]][()] if paths[i] else None)
+                for i in range(len(rows))]
+        return data[0] if single else data
+
+    def spectra(self, dataset_name, rows=slice(None), spectrum_class=Spectrum):
+        '''Spectrum of a dataset for a range of rows, background-subtracted and referenced like Spectrum.from_h5.
+        All the particles must have the dataset, with the same shape'''
+        rows = np.arange(len(self))[rows]
+        data = np.array(self.read(rows, dataset_name), dtype=float)
+        attrs = {attr: self.attr(dataset_name, attr, rows) if self._has_attr(dataset_name, attr) else None
+                 for attr in SPECTRUM_ATTRS}
+        bg = 0 if attrs['background'] is None else np.asarray(attrs['background'])
+        ref = 1 if attrs['reference'] is None else np.asarray(attrs['reference'])
+        if np.ndim(bg) == 2:  # one per particle: broadcast across any extra dimensions of the data
+            bg = bg.reshape((len(rows),) + (1,) * (data.ndim - 2) + bg.shape[1:])
+        if np.ndim(ref) == 2:
+            ref = ref.reshape((len(rows),) + (1,) * (data.ndim - 2) + ref.shape[1:])
+        wavelengths = attrs['wavelengths']
+        if np.ndim(wavelengths) == 2:
+            wavelengths = wavelengths[0]
+        return spectrum_class((data - bg) / (ref - bg), wavelengths)
+
+    def _has_attr(self, dataset_name, attr):
+        attrs = self._dataset_group(dataset_name).get('attrs')
+        return attrs is not None and (attr in attrs.attrs or attr in attrs)
+
+    def iter_spectra(self, dataset_name, batch_size=256):
+        '''yields (names, Spectrum) for batches of the particles that have a given dataset'''
+        rows = np.flatnonzero(self.has(dataset_name))
+        names = self.names
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            yield names[batch], self.spectra(dataset_name, batch)
@@ -8,11 +8,9 @@ import sys
 from scipy.signal import resample
 from nplab import datafile as df 
 from nplab.analysis.signal_alignment import correlation_align
+from nplab.experiment.fiber_raman.spectrum_stitcher import SpectrumStitcher, interpolate_invalid_shifts
 from scipy.signal import find_peaks_cwt, argrelmax,correlate
-from nplab.analysis.wavelets import SUREShrink
-from nplab.analysis.smoothing import convex_smooth
 from scipy.interpolate import interp1d
-from nplab.analysis.smoothing import convex_smooth
 	
 
 # def find_index_closest_to_value(value, array):
@@ -100,50 +98,25 @@ def min_fun(column):
 
 	
 def compute_shifts(spectra,threshold=-105,debug=0):
-	shifts = []
-	for i in range(1,len(spectra)):
-		ys0 = spectra[i-1]
-		ys1 = spectra[i]
-
-		shift,_ = correlation_align(ys0,ys1,upsampling=1.0, return_integer_shift = True)
-		shifts.append(shift)
-	#threshold - some shifts fail when there are no spectral features	
-	shifts = np.array(shifts)
-	inds = np.where(shifts <= threshold)
-	inds = inds[0]
-
-
-	xs_interp = list(range(0,np.max(inds)+1))
-	f0 = interp1d(inds, shifts[inds])
-	ys_interp = [f0(x) for x in xs_interp]
-	pad_length = 5
-	smoothed_shifts,_,_ = convex_smooth([ys_interp[0]]*pad_length+ys_interp,0.0,"quadratic")
-	smoothed_shifts= smoothed_shifts[pad_length:]
-	end_pad_length = len(shifts) - len(smoothed_shifts) 
-	# print end_pad_length
-	padded_smoothed_shifts = np.concatenate([smoothed_shifts,([smoothed_shifts[-1]]*end_pad_length)])
-	padded_smoothed_shifts = [0] + list(padded_smoothed_shifts)
-	outp = np.array(np.round(padded_smoothed_shifts),dtype=int)
-	assert(len(inds) == len(shifts[inds]))
-	N = len(outp)
+	#same as correlation_align on each consecutive pair, but each spectrum is only Fourier transformed once
+	stitcher = SpectrumStitcher(threshold=threshold)
+	for ys in spectra:
+		stitcher.add(None,ys,merge=False)
+	shifts = np.array(stitcher.raw_shifts)
+	#threshold - some shifts fail when there are no spectral features, so they are interpolated from the valid ones
+	inds = np.where(shifts <= threshold)[0]
+	outp = interpolate_invalid_shifts(shifts, threshold)
 	
 	if debug > 0:
 		fig, ax = plt.subplots(1)
 		ax.set_title("fname:compute_shifts, debug plot")
 		ax.plot(inds, shifts[inds],"o",label="Threshold shifts [threshold value: {}".format(threshold))
-		# ax.plot(inds[0], smoothed,"-",label="Threshold shifts [threshold value: {}".format(threshold))
-		ax.plot(list(range(len(shifts))), shifts,"x-",label="Raw shift values".format(threshold))
-
-		ax.plot(xs_interp, ys_interp ,"x-",label="Linearly interpolated shift values".format(threshold))
-		ax.plot(xs_interp, smoothed_shifts ,"x-",label="Smoothed shift values".format(threshold))
-		print(len(shifts), len(padded_smoothed_shifts))
-
-		ax.plot(padded_smoothed_shifts,"x-",label="Smoothed shift values with end-padding")
-		ax.plot(outp,label="Final output")
+		ax.plot(list(range(len(shifts))), shifts,"x-",label="Raw shift values")
+		ax.plot(list(range(len(shifts))), outp[1:],"x-",label="Interpolated shift values")
 		ax.legend()
 		plt.show()
 
-	assert(len(padded_smoothed_shifts)==len(spectra))
+	assert(len(outp)==len(spectra))
 	return inds,outp
 
 def peak_threshold(peaks,sf=1.0):
@@ -292,6 +265,7 @@ def rescale_reference(xs,ys,max_size,N,debug=0):
 	
 
 	#Smooth the reference and resample to the same length as the stitched spectrum
+	from nplab.analysis.wavelets import SUREShrink #needs pywt, which the rest of the module doesn't
 	ys = SUREShrink(ys)
 	ys = resample(ys,N)
 
@@ -388,11 +362,11 @@ def main(debug=0):
 	#handcrafted truncation to "valid range" where we can see peaks & that matches the reference spectrum
 	signal_spectrum = signal_spectrum[1550:10570]
 	#Apply smoothing to the measured signal - want to eliminate most false peaks
+	from nplab.analysis.wavelets import SUREShrink
 	signal_spectrum = SUREShrink(signal_spectrum)
-	signal_spectrum,_,_ = convex_smooth(signal_spectrum,1.0)
 
 	#rescale the reference and fit a line to the wavelength range [nm]
- 	ref_xs,ref_ys, gradient, offset = rescale_reference(xs=ref_xs,ys=ref_ys,max_size=np.nanmax(signal_spectrum),N=len(signal_spectrum),debug=1)
+	ref_xs,ref_ys, gradient, offset = rescale_reference(xs=ref_xs,ys=ref_ys,max_size=np.nanmax(signal_spectrum),N=len(signal_spectrum),debug=1)
 	
 
 	#Get peaks from the signal, with thresholding to eliminate low order maxima/minima
@@ -485,4 +459,5 @@ def main(debug=0):
 	return mapper
 
 
-mapper = main(1)
+if __name__ == "__main__":
+	mapper = main(1)
@@ -0,0 +1,137 @@
+"""
+Incremental version of the stitching in spectrum_aligner: each spectrum is aligned with the previous one as soon as it
+is acquired, and the merged spectrum (the median of the nonzero values of every spectrum covering each point, as in
+spectrum_aligner.median_spectrum) is updated in place, only where the new spectrum lands.
+
+The shift between consecutive spectra is the peak of their cross-correlation (as correlation_align), computed with
+FFTs. The FFT of each spectrum is cached when it's added, so each spectrum is only transformed once.
+As in compute_shifts, shifts above the threshold (which happens when there are no spectral features) are replaced by
+interpolating between the valid ones. The raw shifts and spectra are kept, so the threshold can be changed and the
+spectrum restitched without recomputing any correlation, or reloading any data:
+
+>>> stitcher = SpectrumStitcher(threshold=-105)
+>>> for center_wavelength in center_wavelengths:
+>>> 	spectrum, wavelengths = pacton.get_spectrum(center_wavelength)
+>>> 	stitcher.add(center_wavelength, spectrum)
+>>> 	plt.plot(stitcher.merged)
+>>> stitcher.set_threshold(-90)
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+from builtins import object
+import numpy as np
+from scipy import fft
+
+
+def interpolate_invalid_shifts(shifts, threshold):
+	#Shifts above the threshold are linearly interpolated from the valid ones (and the first or last valid value is
+	#held beyond them). Returns the integer shift of every spectrum, with 0 for the first one, like compute_shifts
+	shifts = np.asarray(shifts, dtype=float)
+	valid = np.where(shifts <= threshold)[0]
+	if len(valid) == 0:
+		interpolated = np.zeros(len(shifts))
+	else:
+		interpolated = np.interp(np.arange(len(shifts)), valid, shifts[valid])
+	return np.concatenate([[0], np.round(interpolated)]).astype(int)
+
+
+class SpectrumStitcher(object):
+	def __init__(self, threshold=-105, n_pixels=None):
+		#threshold - shifts above this are treated as failed alignments (see interpolate_invalid_shifts)
+		#n_pixels - length of each spectrum. Taken from the first spectrum if None
+		self.threshold = threshold
+		self.n_pixels = n_pixels
+		self.center_wavelengths = []
+		self.spectra = []
+		self.raw_shifts = []  #shift of each spectrum relative to the previous one, before thresholding
+		self.offsets = np.zeros(0, dtype=int)  #position of each spectrum in the merged spectrum
+		self.merged = np.zeros(0)
+		self._layers = np.full((0, 0), np.nan)  #each spectrum at its offset, NaN where it has no (nonzero) value
+		self._last_window = None  #cached FFT of the last spectrum
+
+	def _fft_length(self):
+		return fft.next_fast_len(2*self.n_pixels - 1, real=True)
+
+	def _window(self, spectrum):
+		return fft.rfft(spectrum, self._fft_length())
+
+	def correlation_shift(self, window_0, window_1):
+		#The shift which signal_1 must be moved by to align it with signal_0, given their FFTs.
+		#The same as correlation_align: the argmax of correlate(signal_0, signal_1, mode="same")
+		N = self.n_pixels
+		circular = fft.irfft(window_0*np.conj(window_1), self._fft_length())
+		#correlate(mode="same")[j] is the correlation at lag j + (N-1)//2 - (N-1)
+		lags = np.arange(N) + (N - 1)//2 - (N - 1)
+		return int(np.round(np.round(N/2.0) - np.argmax(circular[lags])))
+
+	def add(self, center_wavelength, spectrum, merge=True):
+		#Align a new spectrum with the last one, and merge it. Spectra should be added in order of center wavelength.
+		#Returns its offset in the merged spectrum. With merge=False only the shift is computed (see raw_shifts), and
+		#the spectrum is merged by the next call that merges
+		spectrum = np.asarray(spectrum, dtype=float)
+		if self.n_pixels is None:
+			self.n_pixels = len(spectrum)
+		assert len(spectrum) == self.n_pixels, "All the spectra should have the same length"
+		window = self._window(spectrum)
+		if self._last_window is not None:
+			self.raw_shifts.append(self.correlation_shift(self._last_window, window))
+		self._last_window = window
+		self.center_wavelengths.append(center_wavelength)
+		self.spectra.append(spectrum)
+		if merge:
+			self._update()
+			return self.offsets[-1]
+
+	def add_all(self, data):
+		#data - list of (center_wavelength, xs, ys), as returned by spectrum_aligner.load_measured_data
+		for center_wavelength, _, ys in data:
+			self.add(center_wavelength, ys)
+
+	def set_threshold(self, threshold):
+		#Restitch with a different threshold, using the stored shifts and spectra
+		self.threshold = threshold
+		self._update()
+
+	def _update(self):
+		shifts = interpolate_invalid_shifts(self.raw_shifts, self.threshold)
+		offsets = np.cumsum(np.abs(shifts))
+		#spectra whose offsets haven't changed don't need to be moved
+		unchanged = min(len(self.offsets), len(offsets))
+		moved = np.where(self.offsets[:unchanged] != offsets[:unchanged])[0]
+		first = moved[0] if len(moved) else unchanged
+		if first == len(offsets):
+			return  #no spectrum moved and there are no new ones, so nothing changes
+		length = offsets[-1] + self.n_pixels
+		self._resize(len(offsets), length)
+		if first < len(self.offsets):
+			self._layers[first:] = np.nan
+		for i in range(first, len(offsets)):
+			layer = self._layers[i, offsets[i]:offsets[i] + self.n_pixels]
+			layer[:] = self.spectra[i]
+			layer[self.spectra[i] <= 0] = np.nan
+		#only the columns covered by a spectrum that moved (before or after) change
+		start = min(offsets[first], self.offsets[first] if first < len(self.offsets) else length)
+		self.offsets = offsets
+		self.merged = self.merged[:length]
+		columns = self._layers[:len(offsets), start:length]
+		covered = np.any(~np.isnan(columns), axis=0)
+		merged = np.zeros(columns.shape[1])
+		merged[covered] = np.nanmedian(columns[:, covered], axis=0)
+		self.merged[start:length] = merged
+
+	def _resize(self, rows, columns):
+		#grow the layers (by doubling, so spectra can be added without copying everything each time) and the merged
+		#spectrum
+		if rows > self._layers.shape[0] or columns > self._layers.shape[1]:
+			layers = np.full((max(rows, 2*self._layers.shape[0]), max(columns, 2*self._layers.shape[1])), np.nan)
+			layers[:self._layers.shape[0], :self._layers.shape[1]] = self._layers
+			self._layers = layers
+		if columns > len(self.merged):
+			self.merged = np.concatenate([self.merged, np.zeros(columns - len(self.merged))])
+
+	def pixel_to_index(self, center_wavelength, pixel_index):
+		#The index in the merged spectrum of a pixel of the spectrum at a given center wavelength
+		#(mapper_1 of spectrum_aligner.median_spectrum)
+		offset = int(np.round(np.interp(center_wavelength, self.center_wavelengths, self.offsets)))
+		return offset + pixel_index
@@ -3,6 +3,7 @@
 from nplab.utils.gui import QtWidgets, QtCore, uic, QtGui
 from nplab.instrument.camera.camera_scaled_roi import CameraRoiScale
 from nplab.instrument.camera.Andor.andor_sdk import AndorBase
+from nplab.instrument.camera.track_extraction import TrackExtractor, multi_tracks, random_tracks
 from nplab.utils.notified_property import register_for_property_changes
 import nplab.datafile as df
 
@@ -16,15 +17,19 @@ import time
 
 class Andor(CameraRoiScale, AndorBase):
     metadata_property_names = ('Exposure', 'x_axis', 'CurrentTemperature',)
+    hardware_roi = True  # roi and binning set the Image parameter
+    inclusive_roi = True
 
-    def __init__(self, settings_filepath=None, camera_index=None, **kwargs):
+    def __init__(self, settings_filepath=None, camera_index=None, dll=None, **kwargs):
         super(Andor, self).__init__()
-        self.start(camera_index)
+        self.start(camera_index, dll)
 
         self.CurImage = None
         self.background = None
         self.backgrounded = False
         self.keep_shutter_open = False
+        self.tracks = None  # list of track_extraction.Track, for extract_tracks
+        self._track_extractor = None
         if settings_filepath is not None:
             self.load_params_from_file(settings_filepath)
         self.isAborted = False
@@ -59,15 +64,15 @@ class Andor(CameraRoiScale, AndorBase):
             if self.keep_shutter_open:
                 i = self.Shutter  # initial shutter settings
                 self.Shutter = (i[0], 1, i[2], i[3])
-            imageArray, num_of_images, image_shape = self.capture()
+            images, num_of_images, image_shape = self.capture()
             if self.keep_shutter_open:
                 self.Shutter = i
             # The image is reversed depending on whether you read in the conventional CCD register or the EM register,
             # so we reverse it back
             if self._parameters['OutAmp']:
-                reshaped = np.reshape(imageArray, (num_of_images,) + image_shape)[..., ::-1]
+                reshaped = images[..., ::-1]
             else:
-                reshaped = np.reshape(imageArray, (num_of_images,) + image_shape)
+                reshaped = images
             if num_of_images == 1:
                 reshaped = reshaped[0]
             self.CurImage = self.bundle_metadata(reshaped)
@@ -75,6 +80,27 @@ class Andor(CameraRoiScale, AndorBase):
         except Exception as e:
             self._logger.warn("Couldn't Capture because %s" % e)
 
+    def extract_tracks(self, images=None, tracks=None):
+        """Spectra of several tracks from Image read mode frames, as the MultiTrack and RandomTrack read modes would
+        give, but in software (so the tracks can have weights and smile corrections, and the full frame is kept).
+
+        :param images: (rows, columns) frame or (n, rows, columns) stack read with the current Image parameter.
+            Defaults to the last frame taken
+        :param tracks: list of track_extraction.Track, in detector rows. Defaults to self.tracks, which the multi-track
+            and random-track controls of the GUI set
+        :return: (tracks, columns) or (n, tracks, columns) array
+        """
+        if images is None:
+            images = self.CurImage
+        if tracks is None:
+            tracks = self.tracks
+        assert tracks, 'No tracks to extract'
+        image = self._parameters['Image']
+        shape = np.shape(images)[-2:]
+        if self._track_extractor is None or not self._track_extractor.matches(tracks, shape, image[4] - 1, image[1]):
+            self._track_extractor = TrackExtractor(tracks, shape, image[4] - 1, image[1])
+        return self._track_extractor.extract(images)
+
     def Capture(self):
         """takes a spectrum, and displays it"""
         return self.raw_image(update_latest_frame=True)
@@ -113,6 +139,15 @@ class Andor(CameraRoiScale, AndorBase):
         image = self._parameters['Image']
         self.Image = value + image[2:]
 
+    @property
+    def horizontal_readout(self):
+        """(binning, (first, last)) of the pixels read out along x with the current read mode, 0-based and inclusive.
+        The pixel range is None if the whole width of the detector is read out"""
+        if self._parameters['ReadMode'] == 4:
+            image = self._parameters['Image']
+            return image[0], (image[2] - 1, image[3] - 1)
+        return self._parameters['FVBHBin'], None
+
     def get_control_widget(self):
         return AndorUI(self)
     
@@ -189,12 +224,15 @@ class AndorUI(QtWidgets.QWidget, UiTools):
     
     def set_multitrack(self):
         self.Andor.MultiTrack = self.spinBoxTracks.value(), self.spinBoxHeight.value(), self.spinBoxOffset.value()
+        self.Andor.tracks = multi_tracks(self.spinBoxTracks.value(), self.spinBoxHeight.value(),
+                                         self.spinBoxOffset.value(), self.Andor.DetectorShape[1])
     def randomtrack_pixels(self):
         numbers = [i  for i in re.split(r',| ', self.randomtrack_pixels_lineEdit.text()) if i]
         pixels = list(map(int, numbers))
         assert not len(pixels) % 2, 'must be even number of inputs'
         tracks = len(pixels)//2
         self.Andor.RandomTracks = tracks, pixels
+        self.Andor.tracks = random_tracks(pixels)
 
         
     def init_gui(self):
@@ -223,6 +261,10 @@ class AndorUI(QtWidgets.QWidget, UiTools):
     def temperature_gui(self):
         if self.sender() == self.read_temperature_pushButton:
                 self.temperature_display_thread.single_shot = True
+        elif self.live_temperature_checkBox.isChecked():
+            self.Andor.status_poller.start()
+        else:
+            self.Andor.status_poller.stop()
         self.temperature_display_thread.start()
 
     def update_temperature_display(self, temperature):
@@ -473,17 +515,16 @@ class DisplayThread(QtCore.QThread):
         self.refresh_rate = 1.  # every second
 
     def run(self):
-        t0 = time.time()
         while self.parent.live_temperature_checkBox.isChecked() or self.single_shot:
-            T = self.parent.get_temperature()
-            if time.time()-t0 < 1./self.refresh_rate:
-                continue
-            else:
-                t0 = time.time()
-            self.ready.emit(T)
             if self.single_shot:
-                self.single_shot = False               
+                self.ready.emit(self.parent.get_temperature())
+                self.single_shot = False
                 break
+            # the Andor's status poller reads the temperature in the background, this only displays it
+            T = self.parent.Andor.status_poller.values.get('CurrentTemperature')
+            if T is not None:
+                self.ready.emit(T)
+            time.sleep(1./self.refresh_rate)
         self.finished.emit()
 
 
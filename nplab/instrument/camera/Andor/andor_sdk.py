@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
 from nplab.instrument.camera import CameraParameter
 from nplab.utils.thread_utils import locked_action
+from nplab.utils.status_poller import StatusPoller
 from nplab.utils.log import create_logger
 import nplab.datafile as df
 import os
 import platform
 import time
+from collections import Counter
 from ctypes import *
 import numpy as np
 import tempfile
@@ -40,6 +42,50 @@ class AndorCapabilities(Structure):
                 ("ulFTReadModes", c_ulong)]
 
 
+class ImageRingBuffer(object):
+    """Preallocated store for the latest images of a kinetic series, and their indices in the series
+
+    The SDK writes images straight into the frames array (see AndorBase.stream_kinetic_series), so nothing is allocated
+    or copied per image.
+    """
+    def __init__(self, capacity, image_shape, dtype=np.int32):
+        self.capacity = capacity
+        self.frames = np.zeros((capacity, ) + tuple(image_shape), dtype)
+        self.indices = np.full(capacity, -1)
+        self.count = 0  # total number of images ever stored, the latest is at (count - 1) % capacity
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def next_slots(self, n):
+        """View of the slots the next n images go in, stopping at the end of the frames array so that it's contiguous"""
+        start = self.count % self.capacity
+        return self.frames[start:start + min(n, self.capacity - start)]
+
+    def commit(self, first_index, n):
+        """Marks the first n of the next slots as filled, with images first_index, first_index + 1..."""
+        start = self.count % self.capacity
+        self.indices[start:start + n] = np.arange(first_index, first_index + n)
+        self.count += n
+
+    def latest(self):
+        """Returns a copy of the newest image and its index, or (None, None) if the buffer is empty"""
+        if self.count == 0:
+            return None, None
+        index = (self.count - 1) % self.capacity
+        return np.copy(self.frames[index]), self.indices[index]
+
+    def get_all(self):
+        """Returns copies of all the stored images and their indices, oldest first"""
+        indices = np.arange(self.count - len(self), self.count) % self.capacity
+        return self.frames[indices], self.indices[indices]
+
+
+def c_buffer(array):
+    """A ctypes array sharing the memory of a contiguous int32 numpy array, so that the SDK can write into it"""
+    return (c_int * array.size).from_buffer(array)
+
+
 class AndorWarning(Warning):
     def __init__(self, code, msg, reply):
         super(AndorWarning, self).__init__()
@@ -89,12 +135,31 @@ class AndorBase(object):
     Some parameters, like VSSpeed, HSSpeed..., require inputs to get outputs, so the user must say, e.g.,
         Andor.GetParameter('VSSpeed', 0)
     Which does not return the current VSSpeed, but the VSSpeed (in microseconds) of the setting 0.
+
+    Values read from the camera are cached (keyed by the inputs of the Get call), since most of them only change when we
+    set something: setting a parameter writes its value through to the cache, and invalidates the cached values that
+    depend on it (see INVALIDATES). Parameters with a max_age in the parameters dictionary (e.g. CurrentTemperature)
+    are re-read once their cached value is older than that. invalidate_parameters clears the cache by hand, and
+    self.cache_parameters = False disables it.
+    DLL calls are counted by function name in self.dll_calls, and self.last_frame_dll_calls is the number of calls
+    made between the last two captures (i.e. the overhead of everything done per frame, such as bundling metadata).
+
+    The temperature can be polled in the background by self.status_poller (a StatusPoller, started with
+    self.status_poller.start()), which publishes it in self.status_poller.values for GUIs to read without calling the
+    DLL. While it runs, CurrentTemperature is read from the cache it keeps up to date, and it pauses during captures.
     """
-    def start(self, camera_index=None):
+    def start(self, camera_index=None, dll=None):
+        """Loads the SDK library and initializes the camera
+
+        :param camera_index: which camera to use, if there's more than one
+        :param dll: an already loaded library to use instead of the SDK (e.g. mock_dll.MockAndorDLL, for testing)
+        """
         if not hasattr(self, '_logger'):
             self._logger = LOGGER
 
-        if platform.system() == 'Windows':
+        if dll is not None:
+            self.dll = dll
+        elif platform.system() == 'Windows':
             directory = os.path.dirname(__file__)
             bitness = platform.architecture()[0][:2]  # either 32 or 64
             original_file = "%s/atmcd%sd.dll" % (directory, bitness)
@@ -110,6 +175,12 @@ class AndorBase(object):
             self.dll = cdll.LoadLibrary(original_file)
         else:
             raise Exception("Cannot detect operating system for Andor")
+        self.image_ring = None
+        self.cache_parameters = True
+        self._parameter_cache = dict()  # {(param_loc, inputs): (value, time read)}
+        self.dll_calls = Counter()
+        self.last_frame_dll_calls = None
+        self._dll_calls_at_last_frame = 0
         self.parameters = parameters
         self._parameters = dict()
         for key, value in list(parameters.items()):
@@ -118,6 +189,8 @@ class AndorBase(object):
             else:
                 self._parameters[key] = None
 
+        self.status_poller = StatusPoller(dict(CurrentTemperature=lambda: self.refresh_parameter('CurrentTemperature')),
+                                          interval=2., logger=self._logger)
         self._initialized_cameras = []
         if camera_index is None:
             if self.get_andor_parameter('AvailableCameras') > 1:
@@ -128,15 +201,16 @@ class AndorBase(object):
 
     def end(self):
         """ Safe shutdown procedure """
+        self.status_poller.stop()
         for camera in self._initialized_cameras:
             self.CurrentCamera = camera
             # If the camera is a Classic or iCCD, wait for the temperature to be higher than -20 before shutting down
             if self.Capabilities['CameraType'] in [3, 4]:
                 if self.cooler:
                     self.cooler = 0
-                while self.CurrentTemperature < -20:
-                    print('Waiting')
-                    time.sleep(1)
+                self.status_poller.interval = 1.
+                self.status_poller.wait_until(lambda values: values.get('CurrentTemperature', -273) >= -20,
+                                              callback=lambda values: print('Waiting'))
             self._logger.info('Shutting down %s' % camera)
             self._dll_wrapper('ShutDown')
 
@@ -152,7 +226,8 @@ class AndorBase(object):
         :param reverse:     bool. whether to have the inputs first or the outputs first when calling the dll
         :return:
         """
-        self._logger.debug('DLL call: %s, %s, %s' % (funcname, inputs, outputs))
+        self._logger.debug('DLL call: %s, %s, %s', funcname, inputs, outputs)
+        self.dll_calls[funcname] += 1
         dll_input = ()
         if reverse:
             for output in outputs:
@@ -182,7 +257,7 @@ class AndorBase(object):
             return return_values
 
     def _error_handler(self, error, funcname='', *args):
-        self._logger.debug("[%s]: %s %s" % (funcname, ERROR_CODE[error], str(args)))
+        self._logger.debug("[%s]: %s %s", funcname, ERROR_CODE[error], args)
         if funcname == 'GetTemperature':
             return
         if error != 20002:
@@ -231,6 +306,10 @@ class AndorBase(object):
                 else:
                     self.parameters[param_loc]['value'] = inputs
                     self._parameters[param_loc] = inputs
+                self._invalidate_dependents(param_loc)
+                if 'Get' in self.parameters[param_loc] and 'Inputs' not in self.parameters[param_loc]['Get'] and \
+                        len(inputs) == len(self.parameters[param_loc]['Get']['Outputs']):
+                    self._cache_value(param_loc, (), self._parameters[param_loc])
 
                 if 'Finally' in self.parameters[param_loc]:
                     self.get_andor_parameter(self.parameters[param_loc]['Finally'])
@@ -285,6 +364,14 @@ class AndorBase(object):
                     form_in += ({'value': getattr(self, input_param[0]), 'type': input_param[1]},)
             for ii in range(len(inputs)):
                 form_in += ({'value': inputs[ii], 'type': func['Inputs'][ii]},)
+            key = (param_loc, tuple(inpt['value'] for inpt in form_in))
+            if self.cache_parameters and key in self._parameter_cache:
+                vals, read_time = self._parameter_cache[key]
+                max_age = self._max_age(param_loc)
+                if max_age is None or time.time() - read_time < max_age:
+                    self.parameters[param_loc]['value'] = vals
+                    self._parameters[param_loc] = vals
+                    return vals
             if 'Iterator' not in list(func.keys()):
                 vals = self._dll_wrapper(func['cmdName'], inputs=form_in, outputs=form_out)
             else:
@@ -292,6 +379,7 @@ class AndorBase(object):
                 for i in range(getattr(self, func['Iterator'])):
                     form_in_iterator = form_in + ({'value': i, 'type': c_int},)
                     vals += (self._dll_wrapper(func['cmdName'], inputs=form_in_iterator, outputs=form_out),)
+            self._cache_value(param_loc, key[1], vals)
             self.parameters[param_loc]['value'] = vals
             self._parameters[param_loc] = vals
             return vals
@@ -314,15 +402,75 @@ class AndorBase(object):
             self._logger.info('The ' + param_loc + ' has not previously been set!')
             return None
 
+    def _max_age(self, param_loc):
+        """How long a cached value stays valid for. Values the status poller keeps up to date (while it runs) are valid
+        until the poller is overdue"""
+        max_age = self.parameters[param_loc].get('max_age')
+        if max_age is not None and param_loc in self.status_poller.readers and self.status_poller.running:
+            max_age = max(max_age, 2 * self.status_poller.interval)
+        return max_age
+
+    def refresh_parameter(self, param_loc, *inputs):
+        """Reads a parameter from the camera, rather than the cache"""
+        self.invalidate_parameters(param_loc)
+        return self.get_andor_parameter(param_loc, *inputs)
+
+    def _cache_value(self, param_loc, inputs, value):
+        if self.cache_parameters:
+            self._parameter_cache[(param_loc, inputs)] = (value, time.time())
+
+    def _invalidate_dependents(self, param_loc):
+        """Clears the cached values that setting param_loc may have changed"""
+        dependents = INVALIDATES.get(param_loc, ())
+        if dependents == ALL:
+            self.invalidate_parameters()
+        else:
+            self.invalidate_parameters('AcquisitionTimings', *dependents)
+
+    def invalidate_parameters(self, *names):
+        """Clears the cached values of the given parameters (of all of them if none are given), so that they are read
+        from the camera the next time"""
+        if len(names) == 0:
+            self._parameter_cache.clear()
+        else:
+            for key in [key for key in self._parameter_cache if key[0] in names]:
+                del self._parameter_cache[key]
+
+    @locked_action
+    def snapshot_parameters(self, names=None, refresh=False):
+        """Values of several parameters at once, taking the lock only once
+
+        Values are taken from the cache where possible, so in steady state this doesn't call the DLL at all (except for
+        parameters with a max_age, like CurrentTemperature, once in a while).
+
+        :param names: iterable of parameter names. Defaults to all the parameters
+        :param refresh: if True, the cache is cleared first so that every value is read from the camera
+        :return: dict of parameter names and values
+        """
+        if refresh:
+            self.invalidate_parameters()
+        if names is None:
+            names = list(self.parameters.keys())
+        snapshot = dict()
+        for name in names:
+            parameter = self.parameters[name]
+            if 'Get' in parameter or 'Get_from_fixed_prop' in parameter or \
+                    ('Get_from_prop' in parameter and hasattr(self, '_' + name)):
+                try:
+                    snapshot[name] = self.get_andor_parameter(name)
+                except (AndorWarning, AttributeError) as e:
+                    self._logger.debug('Could not get %s because %s', name, e)
+                    snapshot[name] = None
+            else:
+                snapshot[name] = self._parameters[name]  # the last value set
+        return snapshot
+
     def get_andor_parameters(self):
         """Gets all the parameters that can be gotten
 
         :return: an up to date parameters dict containing only values and names
         """
-        param_dict = dict()
-        for param in self.parameters:
-            param_dict[param] = getattr(self, param)
-        return
+        return self.snapshot_parameters()
 
     def set_andor_parameters(self, parameter_dictionary):
         """Sets all parameters tha can be set
@@ -453,6 +601,7 @@ class AndorBase(object):
         if self.CurrentCamera not in self._initialized_cameras:
             self._initialized_cameras += [self.CurrentCamera]
             self._dll_wrapper('Initialize', outputs=(c_char(),))
+            self.invalidate_parameters()
         self.channel = 0
         self.set_andor_parameter('ReadMode', 4)
         self.set_andor_parameter('AcquisitionMode', 1)
@@ -470,77 +619,168 @@ class AndorBase(object):
             self.set_andor_parameter('OutAmp', 0)
         self.cooler = 1
 
+    def _image_shape(self):
+        """Shape of each image acquired with the current read mode and binning"""
+        if self._parameters['AcquisitionMode'] == 4:
+            image_shape = (self._parameters['FastKinetics'][-1], self._parameters['DetectorShape'][0])
+        elif self._parameters['ReadMode'] == 0:
+            if self._parameters['IsolatedCropMode'][0]:
+                image_shape = (self._parameters['IsolatedCropMode'][2] // self._parameters['IsolatedCropMode'][4], )
+            else:
+                image_shape = (self._parameters['DetectorShape'][0] // self._parameters['FVBHBin'], )
+        elif self._parameters['ReadMode'] == 1:  # random track
+            image_shape = (self.MultiTrack[0], self._parameters['DetectorShape'][0] // self._parameters['FVBHBin'])
+        elif self._parameters['ReadMode'] == 2:
+            image_shape = ( self.RandomTracks[0], self._parameters['DetectorShape'][0]// self._parameters['FVBHBin'])
+
+        elif self._parameters['ReadMode'] == 3:
+            image_shape = (self._parameters['DetectorShape'][0],)
+        elif self._parameters['ReadMode'] == 4:
+            # if self._parameters['IsolatedCropMode'][0]:
+            #     image_shape = (
+            #         self._parameters['IsolatedCropMode'][1] / self._parameters['IsolatedCropMode'][3],
+            #         self._parameters['IsolatedCropMode'][2] / self._parameters['IsolatedCropMode'][4])
+            # else:
+            image_shape = (
+                (self._parameters['Image'][5] - self._parameters['Image'][4] + 1) // self._parameters['Image'][1],
+                (self._parameters['Image'][3] - self._parameters['Image'][2] + 1) // self._parameters['Image'][0],)
+        else:
+            raise NotImplementedError('Read Mode %g' % self._parameters['ReadMode'])
+        return tuple([int(x) for x in image_shape])
+
     @locked_action
-    def capture(self):
+    def capture(self, out=None):
         """Capture an image
 
         Wraps the three steps required for a camera acquisition: StartAcquisition, WaitForAcquisition and
         GetAcquiredData. The function also takes care of ensuring that the correct shape of array is passed to the
         GetAcquiredData call, according to the currently set parameters of the camera.
 
+        The SDK writes the images straight into a numpy array, so there is no per-pixel Python work. Status polling
+        (see status_poller) is paused meanwhile.
+
+        :param out: optional int32 array with num_of_images * prod(image_shape) elements (e.g. the output of a previous
+            capture, to reuse it) to write the images into. A new array is allocated if None or of the wrong size
         :return:
-            np.array    2D or 3D array of the captured image(s)
+            np.array    int32 array of the captured image(s), of shape (num_of_images,) + image_shape
             int         number of images taken
             tuple       shape of the images taken
         """
-        self._dll_wrapper('StartAcquisition')
-        self._dll_wrapper('WaitForAcquisition')
-        self.wait_for_driver()
-        if self._parameters['AcquisitionMode'] == 4:
-            num_of_images = 1  # self.parameters['FastKinetics']['value'][1]
-            image_shape = (self._parameters['FastKinetics'][-1], self._parameters['DetectorShape'][0])
-        else:
-            if self._parameters['AcquisitionMode'] == 1:
-                num_of_images = 1
-            elif self._parameters['AcquisitionMode'] == 2:
-                num_of_images = 1
+        with self.status_poller.paused():  # no status polls delaying the readout
+            self._dll_wrapper('StartAcquisition')
+            self._dll_wrapper('WaitForAcquisition')
+            self.wait_for_driver()
+            if self._parameters['AcquisitionMode'] in [1, 2, 4]:
+                num_of_images = 1  # self.parameters['FastKinetics']['value'][1]
             elif self._parameters['AcquisitionMode'] == 3:
                 num_of_images = self._parameters['NKin']
             else:
                 raise NotImplementedError('Acquisition Mode %g' % self._parameters['AcquisitionMode'])
+            image_shape = self._image_shape()
 
-            if self._parameters['ReadMode'] == 0:
-                if self._parameters['IsolatedCropMode'][0]:
-                    image_shape = (self._parameters['IsolatedCropMode'][2] // self._parameters['IsolatedCropMode'][4], )
-                else:
-                    image_shape = (self._parameters['DetectorShape'][0] // self._parameters['FVBHBin'], )
-            elif self._parameters['ReadMode'] == 1:  # random track
-                image_shape = (self.MultiTrack[0], self._parameters['DetectorShape'][0] // self._parameters['FVBHBin'])
-            elif self._parameters['ReadMode'] == 2:
-                image_shape = ( self.RandomTracks[0], self._parameters['DetectorShape'][0]// self._parameters['FVBHBin'])
-                 
-            elif self._parameters['ReadMode'] == 3:
-                image_shape = (self._parameters['DetectorShape'][0],)
-            elif self._parameters['ReadMode'] == 4:
-                # if self._parameters['IsolatedCropMode'][0]:
-                #     image_shape = (
-                #         self._parameters['IsolatedCropMode'][1] / self._parameters['IsolatedCropMode'][3],
-                #         self._parameters['IsolatedCropMode'][2] / self._parameters['IsolatedCropMode'][4])
-                # else:
-                image_shape = (
-                    (self._parameters['Image'][5] - self._parameters['Image'][4] + 1) // self._parameters['Image'][1],
-                    (self._parameters['Image'][3] - self._parameters['Image'][2] + 1) // self._parameters['Image'][0],)
-            else:
-                raise NotImplementedError('Read Mode %g' % self._parameters['ReadMode'])
+            dim = int(num_of_images * np.prod(image_shape))
+            if out is None or out.size != dim or out.dtype != np.int32 or not out.flags.c_contiguous:
+                out = np.empty(dim, dtype=np.int32)
+            images = out.reshape((num_of_images,) + image_shape)
+            self._logger.debug('Getting AcquiredData for %i images with dimension %s' % (num_of_images, image_shape))
+            try:
+                self._dll_wrapper('GetAcquiredData', inputs=({'type': c_int, 'value': dim},), outputs=(c_buffer(out),),
+                                  reverse=True)
+            except RuntimeWarning as e:
+                self._logger.warn('Had a RuntimeWarning: %s' % e)
+                images[:] = 0
+
+        total_calls = sum(self.dll_calls.values())
+        self.last_frame_dll_calls = total_calls - self._dll_calls_at_last_frame
+        self._dll_calls_at_last_frame = total_calls
+        return images, num_of_images, image_shape
 
-        image_shape = tuple([int(x) for x in image_shape])
-        dim = num_of_images * np.prod(image_shape)
-        cimageArray = c_int * dim
-        cimage = cimageArray()
-        self._logger.debug('Getting AcquiredData for %i images with dimension %s' % (num_of_images, image_shape))
+    @locked_action
+    def _new_images(self):
+        """Indices (starting at 1) of the first and last images acquired but not yet read, or (None, None)"""
+        first = c_long()
+        last = c_long()
+        self.dll_calls['GetNumberNewImages'] += 1
+        error = self.dll.GetNumberNewImages(byref(first), byref(last))
+        if ERROR_CODE[error] == 'DRV_NO_NEW_DATA':
+            return None, None
+        self._error_handler(error, 'GetNumberNewImages')
+        return first.value, last.value
+
+    @locked_action
+    def _get_images(self, first, last, out):
+        """Reads images first to last (starting at 1) of the current acquisition into out. Returns the indices of the
+        first and last images actually read"""
+        valid_first = c_long()
+        valid_last = c_long()
+        self.dll_calls['GetImages'] += 1
+        error = self.dll.GetImages(c_long(first), c_long(last), byref(c_buffer(out)), c_ulong(out.size),
+                                   byref(valid_first), byref(valid_last))
+        self._error_handler(error, 'GetImages', first, last)
+        return valid_first.value, valid_last.value
+
+    def stream_kinetic_series(self, ring_size=16, poll_interval=0.005, timeout=None):
+        """Generator of the images of a series as they are acquired, instead of waiting until the whole series ends
+
+        Starts an acquisition and polls the SDK for new images, which are read (as many as are available in one call)
+        straight into self.image_ring, an ImageRingBuffer of the latest ring_size images. Each iteration yields
+        (index, images): the index in the series of the first image, and a view into the ring buffer of one or more
+        consecutive images, which is only valid until the next iteration. As in Andor.raw_snapshot, images read through
+        the EM register are flipped. Status polling (see status_poller) is paused until the series ends.
+        In kinetic mode (AcquisitionMode 3) the generator ends after NKin images, in run till abort mode (5) it runs
+        until it's closed (e.g. by breaking out of the loop), which aborts the acquisition.
+
+        >>> for index, images in andor.stream_kinetic_series():
+        >>>     plt.plot(images.sum(axis=1)[-1])
+
+        :param ring_size: number of images kept in the ring buffer
+        :param poll_interval: time in seconds between polls when no new image is available
+        :param timeout: maximum time in seconds to wait for a new image, raising an AndorWarning after. None waits forever
+        """
+        if self._parameters['AcquisitionMode'] == 3:
+            n_images = self._parameters['NKin']
+        elif self._parameters['AcquisitionMode'] == 5:
+            n_images = None
+        else:
+            raise NotImplementedError('Streaming in acquisition Mode %g' % self._parameters['AcquisitionMode'])
+        image_shape = self._image_shape()
+        if self.image_ring is None or self.image_ring.capacity != ring_size or \
+                self.image_ring.frames.shape[1:] != image_shape:
+            self.image_ring = ImageRingBuffer(ring_size, image_shape)
+        self.image_ring.count = 0
+        flip = bool(self._parameters['OutAmp'])
+
+        self.status_poller.pause()
+        self._dll_wrapper('StartAcquisition')
+        finished = False
         try:
-            self._dll_wrapper('GetAcquiredData', inputs=({'type': c_int, 'value': dim},), outputs=(cimage,),
-                              reverse=True)
-            imageArray = []
-            for i in range(len(cimage)):
-                imageArray.append(cimage[i])
-        except RuntimeWarning as e:
-            self._logger.warn('Had a RuntimeWarning: %s' % e)
-            imageArray = []
-            for i in range(len(cimage)):
-                imageArray.append(0)
-
-        return imageArray, num_of_images, image_shape
+            read = 0  # the number of images read so far, which is also the index of the next one
+            last_image_time = time.time()
+            while n_images is None or read < n_images:
+                first, last = self._new_images()
+                if first is None:
+                    if timeout is not None and time.time() - last_image_time > timeout:
+                        raise AndorWarning(20024, 'GetNumberNewImages', 'Timed out waiting for image %d' % read)
+                    time.sleep(poll_interval)
+                    continue
+                if first > read + 1:
+                    self._logger.warn('Images %d to %d were overwritten in the SDK buffer before being read' %
+                                      (read, first - 2))
+                first = max(first, read + 1)
+                while first <= last:
+                    slots = self.image_ring.next_slots(last - first + 1)
+                    valid_first, valid_last = self._get_images(first, first + len(slots) - 1, slots)
+                    n = valid_last - valid_first + 1
+                    self.image_ring.commit(valid_first - 1, n)
+                    read = valid_last
+                    first = valid_last + 1
+                    yield valid_first - 1, slots[:n, ..., ::-1] if flip else slots[:n]
+                last_image_time = time.time()
+            finished = True
+        finally:
+            if not finished:
+                self.abort()
+            self.status_poller.resume()
 
     @property
     def Image(self):
@@ -635,6 +875,7 @@ class AndorBase(object):
             self._dll_wrapper('CoolerON')
         else:
             self._dll_wrapper('CoolerOFF')
+        self.invalidate_parameters('CurrentTemperature')
 
     def get_series_progress(self):
         acc = c_long()
@@ -714,7 +955,7 @@ parameters = dict(
     FanMode=dict(Set=dict(cmdName='SetFanMode', Inputs=(c_int,)), value=None),
     ImageFlip=dict(Set=dict(cmdName='SetImageFlip', Inputs=(c_int,) * 2), value=None),
     ImageRotate=dict(Set=dict(cmdName='SetImageRotate', Inputs=(c_int,)), value=None),
-    CurrentTemperature=dict(Get=dict(cmdName='GetTemperature', Outputs=(c_int,)), value=None),
+    CurrentTemperature=dict(Get=dict(cmdName='GetTemperature', Outputs=(c_int,)), value=None, max_age=1),
     SetTemperature=dict(Set=dict(cmdName='SetTemperature', Inputs=(c_int,)), value=None),
     OutAmp=dict(Set=dict(cmdName='SetOutputAmplifier', Inputs=(c_int,))),
     FrameTransferMode=dict(Set=dict(cmdName='SetFrameTransferMode', Inputs=(c_int,)), value=None),
@@ -740,6 +981,20 @@ parameters = dict(
     ADChannel=dict(Set=dict(cmdName='SetADChannel', Inputs=(c_int,))),
     BitDepth=dict(Get=dict(cmdName='GetBitDepth', Inputs=(c_int,), Outputs=(c_int,), Iterator='NumADChannels'))
 )
+# Cached values (see AndorBase) that setting each parameter invalidates, besides its own and AcquisitionTimings (which
+# depends on nearly every acquisition setting). Values read with inputs (e.g. HSSpeeds, which depends on channel and
+# OutAmp) are cached separately for each set of inputs, so they don't need invalidating
+ALL = 'all'
+INVALIDATES = dict(
+    CurrentCamera=ALL,
+    OutAmp=('EMGain', 'EMGainRange'),
+    EMMode=('EMGain', 'EMGainRange'),
+    EMAdvancedGain=('EMGain', 'EMGainRange'),
+    SetTemperature=('CurrentTemperature', 'EMGainRange'),
+    CoolerMode=('CurrentTemperature', ),
+    ADChannel=('NumHSSpeed', 'HSSpeeds'),
+)
+
 for param_name in parameters:
     if param_name != 'Image':
         setattr(AndorBase, param_name, AndorParameter(param_name))
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""Stand-in for the Andor SDK library, at the ctypes level, so that AndorBase can be run without a camera:
+
+>>> camera = AndorBase()
+>>> camera.start(dll=MockAndorDLL())
+
+Functions take the same ctypes arguments as the real library (values, and byref() of outputs and buffers) and return
+its error codes. Set* calls are recorded in self.settings, and every call in self.calls.
+
+Acquired images are deterministic: pixel p of image k of an acquisition has the value p + k * IMAGE_STEP. By default
+an acquisition is complete as soon as it starts. With frames_per_poll, every status poll (GetStatus,
+WaitForAcquisition, GetNumberNewImages...) acquires that many more images instead, as a real series would over time.
+"""
+import numpy as np
+
+from nplab.instrument.camera.Andor.andor_sdk import ERROR_CODE
+
+CODES = {name: code for code, name in ERROR_CODE.items()}
+IMAGE_STEP = 1000000
+
+
+def _value(arg):
+    """The value of a ctypes argument, or of the object referenced by a byref() argument"""
+    if hasattr(arg, '_obj'):
+        arg = arg._obj
+    return arg.value if hasattr(arg, 'value') else arg
+
+
+def _array(ref):
+    """numpy view of the ctypes array referenced by a byref() argument"""
+    return np.ctypeslib.as_array(ref._obj)
+
+
+class MockAndorDLL(object):
+    def __init__(self, detector_shape=(1024, 256), frames_per_poll=None, buffer_size=64):
+        """
+        :param detector_shape: (x, y) number of pixels
+        :param frames_per_poll: number of images acquired per status poll, or None to acquire them all at once
+        :param buffer_size: number of images kept by the driver's circular buffer
+        """
+        self.detector_shape = detector_shape
+        self.frames_per_poll = frames_per_poll
+        self.buffer_size = buffer_size
+        self.calls = []
+        self.settings = dict(SetAcquisitionMode=(1, ), SetNumberKinetics=(1, ), SetExposureTime=(0.1, ))
+        self.cooler = 0
+        self.acquiring = False
+        self.n_images = 0  # number of images in the current acquisition (None for run till abort)
+        self.acquired = 0  # number of images acquired so far
+        self.retrieved = 0  # number of images read with GetImages
+
+    def __getattr__(self, name):
+        if name.startswith('Set'):
+            def setter(*args):
+                self.calls.append(name)
+                self.settings[name] = tuple(_value(arg) for arg in args)
+                return CODES['DRV_SUCCESS']
+            return setter
+        raise AttributeError(name)
+
+    def image(self, index, size):
+        return np.arange(size, dtype=np.int32) + index * IMAGE_STEP
+
+    def _advance(self):
+        if self.acquiring:
+            if self.n_images is None:
+                self.acquired += self.frames_per_poll or 1
+            else:
+                self.acquired = min(self.n_images, self.acquired + (self.frames_per_poll or self.n_images))
+                self.acquiring = self.acquired < self.n_images
+
+    def _return(self, name, *outputs):
+        """Records the call and writes the given values into the byref() outputs"""
+        self.calls.append(name)
+        for ref, value in outputs:
+            ref._obj.value = value
+        return CODES['DRV_SUCCESS']
+
+    def Initialize(self, directory):
+        return self._return('Initialize')
+
+    def ShutDown(self):
+        return self._return('ShutDown')
+
+    def GetAvailableCameras(self, number):
+        return self._return('GetAvailableCameras', (number, 1))
+
+    def GetCameraHandle(self, index, handle):
+        return self._return('GetCameraHandle', (handle, 100 + _value(index)))
+
+    def GetCurrentCamera(self, handle):
+        return self._return('GetCurrentCamera', (handle, self.settings.get('SetCurrentCamera', (100, ))[0]))
+
+    def GetCapabilities(self, capabilities):
+        capabilities._obj.ulAcqModes = 0b1111111
+        capabilities._obj.ulReadModes = 0b111111
+        capabilities._obj.ulCameraType = 13  # iKon
+        return self._return('GetCapabilities')
+
+    def GetDetector(self, x, y):
+        return self._return('GetDetector', (x, self.detector_shape[0]), (y, self.detector_shape[1]))
+
+    def GetPixelSize(self, x, y):
+        return self._return('GetPixelSize', (x, 26.), (y, 26.))
+
+    def GetCameraSerialNumber(self, number):
+        return self._return('GetCameraSerialNumber', (number, 12345))
+
+    def GetSoftwareVersion(self, *versions):
+        return self._return('GetSoftwareVersion', *[(version, 1) for version in versions])
+
+    def GetEMCCDGain(self, gain):
+        return self._return('GetEMCCDGain', (gain, self.settings.get('SetEMCCDGain', (0, ))[0]))
+
+    def GetEMCCDGainRange(self, low, high):
+        return self._return('GetEMCCDGainRange', (low, 1), (high, 300 if self.cooler else 100))
+
+    def GetNumberVSSpeeds(self, number):
+        return self._return('GetNumberVSSpeeds', (number, 3))
+
+    def GetVSSpeed(self, index, speed):
+        return self._return('GetVSSpeed', (speed, 4. * 2 ** _value(index)))
+
+    def GetNumberHSSpeeds(self, channel, amplifier, number):
+        return self._return('GetNumberHSSpeeds', (number, 2 + _value(amplifier)))
+
+    def GetHSSpeed(self, channel, amplifier, index, speed):
+        return self._return('GetHSSpeed', (speed, 0.05 * (_value(amplifier) + 1) * 2 ** _value(index)))
+
+    def GetNumberPreAmpGains(self, number):
+        return self._return('GetNumberPreAmpGains', (number, 2))
+
+    def GetPreAmpGain(self, index, gain):
+        return self._return('GetPreAmpGain', (gain, 1. + _value(index)))
+
+    def GetNumberADChannels(self, number):
+        return self._return('GetNumberADChannels', (number, 1))
+
+    def GetBitDepth(self, channel, depth):
+        return self._return('GetBitDepth', (depth, 16))
+
+    def GetAcquisitionTimings(self, exposure, accumulate, kinetic):
+        exposure_time = self.settings['SetExposureTime'][0]
+        return self._return('GetAcquisitionTimings', (exposure, exposure_time), (accumulate, exposure_time),
+                            (kinetic, exposure_time))
+
+    def GetTemperature(self, temperature):
+        self._return('GetTemperature', (temperature, -80 if self.cooler else 20))
+        return CODES['DRV_TEMP_STABILIZED' if self.cooler else 'DRV_TEMP_OFF']
+
+    def CoolerON(self):
+        self.cooler = 1
+        return self._return('CoolerON')
+
+    def CoolerOFF(self):
+        self.cooler = 0
+        return self._return('CoolerOFF')
+
+    def IsCoolerOn(self, status):
+        return self._return('IsCoolerOn', (status, self.cooler))
+
+    def StartAcquisition(self):
+        self.calls.append('StartAcquisition')
+        if self.acquiring:
+            return CODES['DRV_ACQUIRING']
+        mode = self.settings['SetAcquisitionMode'][0]
+        self.n_images = {3: self.settings['SetNumberKinetics'][0], 5: None}.get(mode, 1)
+        self.acquired = 0
+        self.retrieved = 0
+        self.acquiring = True
+        if self.frames_per_poll is None:
+            self._advance()
+        return CODES['DRV_SUCCESS']
+
+    def AbortAcquisition(self):
+        self.calls.append('AbortAcquisition')
+        if not self.acquiring:
+            return CODES['DRV_IDLE']
+        self.acquiring = False
+        return CODES['DRV_SUCCESS']
+
+    def WaitForAcquisition(self):
+        self._advance()
+        return self._return('WaitForAcquisition')
+
+    def GetStatus(self, status):
+        self._advance()
+        return self._return('GetStatus', (status, CODES['DRV_ACQUIRING' if self.acquiring else 'DRV_IDLE']))
+
+    def GetAcquisitionProgress(self, accumulations, series):
+        self._advance()
+        return self._return('GetAcquisitionProgress', (accumulations, 0), (series, self.acquired))
+
+    def GetAcquiredData(self, buffer, size):
+        self.calls.append('GetAcquiredData')
+        if self.acquiring:
+            return CODES['DRV_ACQUIRING']
+        size = _value(size)
+        image_size = size // self.n_images
+        data = _array(buffer)
+        for index in range(self.n_images):
+            data[index * image_size:(index + 1) * image_size] = self.image(index, image_size)
+        return CODES['DRV_SUCCESS']
+
+    def GetNumberNewImages(self, first, last):
+        self._advance()
+        oldest = max(self.retrieved, self.acquired - self.buffer_size) + 1
+        if oldest > self.acquired:
+            self.calls.append('GetNumberNewImages')
+            return CODES['DRV_NO_NEW_DATA']
+        return self._return('GetNumberNewImages', (first, oldest), (last, self.acquired))
+
+    def GetImages(self, first, last, buffer, size, valid_first, valid_last):
+        first, last, size = _value(first), _value(last), _value(size)
+        if first < max(1, self.acquired - self.buffer_size + 1) or last > self.acquired or last < first:
+            self.calls.append('GetImages')
+            return CODES['DRV_P2INVALID']
+        image_size = size // (last - first + 1)
+        data = _array(buffer)
+        for index in range(first, last + 1):
+            data[(index - first) * image_size:(index - first + 1) * image_size] = self.image(index - 1, image_size)
+        self.retrieved = max(self.retrieved, last)
+        return self._return('GetImages', (valid_first, first), (valid_last, last))
@@ -20,6 +20,11 @@
 
 Development notes:
     * API for DLL: Picam 5.x Programmers Manual, 4411-0161, Issue 5, August 2018
+    * GetCurrentFrame sets up a whole acquisition (Picam_Acquire) for each frame. For a stream of frames, use
+        continuous acquisition instead: StartContinuousAcquisition gives the library a circular buffer (allocated
+        here, as a numpy array) to read frames into, WaitForReadouts returns the new ones as numpy views into it, and
+        StopContinuousAcquisition ends it. continuous_frames wraps the three.
+    * simulated_picam.SimulatedPicam stands in for the DLL, for testing: Pixis(dll=SimulatedPicam())
     
 """
 
@@ -27,6 +32,8 @@ import ctypes as ct
 import numpy as np
 from matplotlib import pyplot as plt
 from nplab.instrument.camera import Camera
+from nplab.instrument.camera.track_extraction import Track, TrackExtractor
+from nplab.utils.status_poller import StatusPoller
 import sys,os, time
 
 from .picam_constants import PicamSensorTemperatureStatus,PicamParameter,PicamValueType,PicamError,transpose_dictionary,PI_V,PicamConstraintType
@@ -40,12 +47,35 @@ class clsPicamReadoutStruct(ct.Structure):
                 ("intCount", ct.c_int64)]
 
 
+class clsPicamAcquisitionBuffer(ct.Structure):
+    _fields_ = [("memory", ct.c_void_p),
+                ("memory_size", ct.c_int64)]
+
+
+class clsPicamAcquisitionStatus(ct.Structure):
+    _fields_ = [("running", ct.c_int),
+                ("errors", ct.c_int),
+                ("readout_rate", ct.c_double)]
+
+
+PicamAcquisitionErrorsMask_DataLost = 0x01
+
+
 class Pixis(Camera):
-    def __init__(self,with_start_up = False,debug=0):
+    def __init__(self,with_start_up = False,debug=0,dll=None):
         self.debug = debug
         self.bolRunning = False
+        self.bolContinuous = False
         self.y_max = 0
         self.x_max = 0
+        self.dll = dll
+        self.readout_stats = None
+        self._track_extractor = None
+        self._mean_track = None
+        # temperature polling, in the background once started. Paused during acquisitions
+        self.status_poller = StatusPoller(dict(temperature=self.GetSensorTemperatureReading,
+                                               temperature_status=self.GetTemperatureStatus), interval=1.)
+        self._status_paused = False
         if with_start_up == True:
             self.StartUp()
             self.SetExposureTime(10)
@@ -85,15 +115,33 @@ class Pixis(Camera):
 
     def get_spectrum(self, x_min=0, x_max = None, y_min=0,y_max = None,with_boundary_cut = True, suppress_errors=False):    
         roi_image = self.get_roi(x_min,x_max,y_min,y_max,suppress_errors)
-        #cut edge values from raw spectrum - remove edge effects
-        raw_spectrum = np.mean(roi_image,axis=0)
+        #the mean of the rows of the roi, as a single averaging track
+        height = roi_image.shape[0]
+        if self._mean_track is None or self._mean_track.last_row != height - 1:
+            self._mean_track = Track(0, height - 1, weights=np.full(height, 1. / height))
+        raw_spectrum = self.extract_tracks(roi_image, [self._mean_track])[0]
         pixel_offsets = np.array(list(range(0,len(raw_spectrum))))-int(self.FrameWidth/2)
+        #cut edge values from raw spectrum - remove edge effects
         if with_boundary_cut == True:
             return raw_spectrum[self.boundary_cut:-self.boundary_cut], pixel_offsets[self.boundary_cut:-self.boundary_cut]
 
         else:
             return raw_spectrum,pixel_offsets
 
+    def extract_tracks(self, frames, tracks):
+        """
+        Spectra of several tracks (e.g. one per fibre) from frames, in one pass. The weights of the tracks are
+        computed once, and kept for as long as the same tracks are extracted from frames of the same shape
+
+        frames : (rows, columns) frame, or (n, rows, columns) stack of frames, e.g. from continuous_frames
+        tracks : list of track_extraction.Track, in rows of the frames
+        returns : (tracks, columns) or (n, tracks, columns) array
+        """
+        shape = np.shape(frames)[-2:]
+        if self._track_extractor is None or not self._track_extractor.matches(tracks, shape):
+            self._track_extractor = TrackExtractor(tracks, shape)
+        return self._track_extractor.extract(frames)
+
     def get_parameter(self,parameter_name, label="unknown"):
         """
         Perform GetParameterIntegerValue calls to DLL
@@ -147,7 +195,7 @@ class Pixis(Camera):
         temp =  {
             "PicamValueType_Integer" : ct.c_int(),
             "PicamValueType_Boolean" : ct.c_bool(),
-            "PicamValueType_LargeInteger" : ct.c_long(),
+            "PicamValueType_LargeInteger" : ct.c_int64(),
 
             "PicamValueType_FloatingPoint" : ct.c_double(),
 
@@ -211,7 +259,7 @@ class Pixis(Camera):
         temp =  {
             "PicamValueType_Integer" : ct.c_int,
             "PicamValueType_Boolean" : ct.c_bool,
-            "PicamValueType_LargeInteger" : ct.c_long,
+            "PicamValueType_LargeInteger" : ct.c_int64,
             "PicamValueType_FloatingPoint" : ct.c_double, #WARNING - THIS SHOULD BE A DOUBLE (64bit), NOT FLOAT (32bit) [for 32bit change to float]
             "PicamValueType_Enumeration": ct.c_int, #Maybe an int 
             "PicamValueType_Rois": None, #TODO
@@ -228,7 +276,7 @@ class Pixis(Camera):
 
             response = setter(self.CameraHandle,param_id, value)
             if response != 0:
-                print(("Could not SET value of parameter {0} [label:{1}]".format(parameter,label)))
+                print(("Could not SET value of parameter {0}".format(parameter_name)))
                 print(("[Code:{0}] {1}".format(response, PicamError[response])))
                 return np.nan
             #check if commit failed
@@ -262,12 +310,15 @@ class Pixis(Camera):
     def StartUp(self):
         cint_temp = ct.c_int()
         # Find DLL
-        try:
-            self.picam = ct.WinDLL(os.path.normpath('{}/picam_64bit.dll'.format(PARENT_DIR)))
-        except Exception as e:
-            logging.warning("Error:",e)
-            logging.info("Could not find picam dll")
-            return
+        if self.dll is not None:
+            self.picam = self.dll
+        else:
+            try:
+                self.picam = ct.WinDLL(os.path.normpath('{}/picam_64bit.dll'.format(PARENT_DIR)))
+            except Exception as e:
+                logging.warning("Error:",e)
+                logging.info("Could not find picam dll")
+                return
         # Initialise library
         bolInitialised = ct.c_bool(False)
         if self.picam.Picam_InitializeLibrary() != 0:
@@ -293,6 +344,9 @@ class Pixis(Camera):
     def ShutDown(self):
         if self.bolRunning == False:
             return
+        self.status_poller.stop()
+        if self.bolContinuous:
+            self.StopContinuousAcquisition()
         if self.picam.Picam_CloseCamera(self.CameraHandle) != 0:
             print("Could not close camera")
             return
@@ -310,16 +364,31 @@ class Pixis(Camera):
 
     def SetTemperatureWithLock(self,temperature):
         self.__SetSensorTemperatureSetPoint(temperature)
-        status_code = p.GetTemperatureStatus()
-        while PicamSensorTemperatureStatus[status_code] != "PicamSensorTemperatureStatus_Locked":
-            print("TemperatureStatus: {3}[{2}] (current: {0}, target:{1})".format(p.GetSensorTemperatureReading(), temperature,status_code, PicamSensorTemperatureStatus[status_code]))
-            time.sleep(0.5)
-            status_code = p.GetTemperatureStatus()
 
-        status_code = p.GetTemperatureStatus()
+        def locked(values):
+            status_code = values.get('temperature_status')  # missing if it hasn't been read successfully yet
+            return PicamSensorTemperatureStatus.get(status_code) == "PicamSensorTemperatureStatus_Locked"
+
+        def report(values):
+            if not locked(values) and 'temperature_status' in values:
+                status_code = values['temperature_status']
+                print("TemperatureStatus: {3}[{2}] (current: {0}, target:{1})".format(values.get('temperature'), temperature,status_code, PicamSensorTemperatureStatus[status_code]))
+
+        values = self.status_poller.wait_until(locked, callback=report)
+        status_code = values['temperature_status']
         print("TemperatureStatus: {0} [{1}]".format(PicamSensorTemperatureStatus[status_code], status_code))
         return
 
+    def _pause_status_polling(self):
+        if not self._status_paused:
+            self.status_poller.pause()
+            self._status_paused = True
+
+    def _resume_status_polling(self):
+        if self._status_paused:
+            self.status_poller.resume()
+            self._status_paused = False
+
 
     def GetSensorTemperatureReading(self):
         param_name = "PicamParameter_SensorTemperatureReading"
@@ -366,22 +435,128 @@ class Pixis(Camera):
         structReadout = clsPicamReadoutStruct()
         intErrorMask = ct.c_int()
         
-        # Read in pointer to image buffer
-        if self.picam.Picam_Acquire(self.CameraHandle, 1, -1, 
-                ct.byref(structReadout), ct.byref(intErrorMask)) != 0:
+        # Read in pointer to image buffer, with no status polls during the acquisition
+        with self.status_poller.paused():
+            response = self.picam.Picam_Acquire(self.CameraHandle, 1, -1, 
+                    ct.byref(structReadout), ct.byref(intErrorMask))
+        if response != 0:
             print("Image acquisition failed")
             return
         if intErrorMask.value != 0:
             print("Image acquisition returned an error")
             return
         
-        # Get image
-        ctarr = (ct.c_uint16*(self.FrameWidth*self.FrameHeight)) # Create ctypes array
-        ctarr = ctarr.from_address(structReadout.ptr) # Read in array from pointer
-        nparr = np.array(ctarr) # Convert to numpy array
-        nparr = nparr.reshape((self.FrameWidth, self.FrameHeight)) # Reshape numpy array
+        # Get image. The buffer belongs to the library and is reused by the next acquisition, so it's copied
+        ptr = ct.cast(structReadout.ptr, ct.POINTER(ct.c_uint16))
+        nparr = np.ctypeslib.as_array(ptr, shape=(self.FrameHeight, self.FrameWidth)).copy() # frames are row-major
         
         return nparr
+
+    def StartContinuousAcquisition(self, buffer_frames=64):
+        """
+        Starts acquiring frames until StopContinuousAcquisition, into a circular buffer of buffer_frames readouts.
+
+        The buffer is a numpy array owned by this object (self.frame_buffer, of shape (buffer_frames, FrameHeight,
+        FrameWidth)), which the library writes into directly. Use WaitForReadouts to get the new frames. Status
+        polling is paused until the acquisition stops.
+        """
+        if self.bolRunning == False:
+            self.StartUp()
+        if self.bolContinuous:
+            self.StopContinuousAcquisition()
+        self._pause_status_polling()
+        self.set_parameter(parameter_name="PicamParameter_ReadoutCount", parameter_value=0)  # 0 means until stopped
+        stride = int(self.get_parameter(parameter_name="PicamParameter_ReadoutStride", label="readout stride"))
+        # a readout can hold metadata after the frame, so frames are strided views into the raw buffer
+        self._raw_buffer = np.zeros(buffer_frames * stride, dtype=np.uint8)
+        self.frame_buffer = np.ndarray((buffer_frames, self.FrameHeight, self.FrameWidth), dtype=np.uint16,
+                                       buffer=self._raw_buffer, strides=(stride, 2 * self.FrameWidth, 2))
+        self._readout_stride = stride
+        structBuffer = clsPicamAcquisitionBuffer(self._raw_buffer.ctypes.data, self._raw_buffer.nbytes)
+        if self.picam.PicamAdvanced_SetAcquisitionBuffer(self.CameraHandle, ct.byref(structBuffer)) != 0:
+            raise RuntimeError("Could not set the acquisition buffer")
+        response = self.picam.Picam_StartAcquisition(self.CameraHandle)
+        if response != 0:
+            raise RuntimeError("Could not start acquisition [Code:{0}] {1}".format(response, PicamError[response]))
+        self.bolContinuous = True
+        self.readout_stats = dict(readouts=0, elapsed=0., rate=0., camera_rate=0., errors=0, updates=0)
+        self._continuous_start = time.time()
+
+    def WaitForReadouts(self, timeout=1000, copy=False):
+        """
+        Waits for new frames of a continuous acquisition, for up to timeout (in ms).
+
+        Returns the new frames, as an array of shape (n, FrameHeight, FrameWidth) with n >= 0. Unless copy is True,
+        this is a view into the circular buffer, which is only valid until the library has read buffer_frames more
+        readouts. Also updates self.readout_stats: the number of readouts, the time since the start of the
+        acquisition, the measured readout rate and the one reported by the camera (both in Hz), and the errors mask
+        of every update OR'ed together.
+        """
+        structAvailable = clsPicamReadoutStruct()
+        structStatus = clsPicamAcquisitionStatus()
+        response = self.picam.Picam_WaitForAcquisitionUpdate(self.CameraHandle, int(timeout),
+                                                             ct.byref(structAvailable), ct.byref(structStatus))
+        if response != 0 and PicamError[response] not in ("PicamError_TimeOutOccurred",
+                                                          "PicamError_AcquisitionNotInProgress"):
+            raise RuntimeError("Acquisition update failed [Code:{0}] {1}".format(response, PicamError[response]))
+        if not structStatus.running:
+            self.bolContinuous = False
+            self._resume_status_polling()
+        count = int(structAvailable.intCount) if response == 0 else 0
+        if count > 0:
+            first = (structAvailable.ptr - self._raw_buffer.ctypes.data) // self._readout_stride
+            last = first + count
+            if last <= len(self.frame_buffer):
+                frames = self.frame_buffer[first:last]
+            else:  # the new readouts wrap around the end of the buffer
+                frames = np.concatenate([self.frame_buffer[first:], self.frame_buffer[:last - len(self.frame_buffer)]])
+        else:
+            frames = self.frame_buffer[:0]
+        stats = self.readout_stats
+        stats['readouts'] += count
+        stats['updates'] += 1
+        stats['elapsed'] = time.time() - self._continuous_start
+        stats['rate'] = stats['readouts'] / stats['elapsed'] if stats['elapsed'] > 0 else 0.
+        stats['camera_rate'] = structStatus.readout_rate
+        stats['errors'] |= structStatus.errors
+        if structStatus.errors & PicamAcquisitionErrorsMask_DataLost:
+            logging.warning("Pixis: readouts were lost, the circular buffer is too small or isn't read fast enough")
+        return np.array(frames) if copy else frames
+
+    def StopContinuousAcquisition(self):
+        """Stops a continuous acquisition, and waits for it to end"""
+        self.picam.Picam_StopAcquisition(self.CameraHandle)
+        running = ct.c_int(1)
+        self.picam.Picam_IsAcquisitionRunning(self.CameraHandle, ct.byref(running))
+        while running.value:
+            # readouts still arriving have to be collected for the acquisition to finish
+            self.WaitForReadouts(timeout=100)
+            self.picam.Picam_IsAcquisitionRunning(self.CameraHandle, ct.byref(running))
+        self.bolContinuous = False
+        self._resume_status_polling()
+
+    def continuous_frames(self, n_frames=None, buffer_frames=64, timeout=1000, copy=False):
+        """
+        Generator of the frames of a continuous acquisition, one at a time, as they arrive. The acquisition stops
+        after n_frames (or when the generator is closed, if n_frames is None).
+        Frames are views into the circular buffer unless copy is True (see WaitForReadouts).
+
+        >>> for frame in pixis.continuous_frames(100):
+        >>>     spectrum = frame.mean(axis=0)
+        """
+        self.StartContinuousAcquisition(buffer_frames)
+        n = 0
+        try:
+            while n_frames is None or n < n_frames:
+                frames = self.WaitForReadouts(timeout, copy)
+                for frame in frames[:None if n_frames is None else n_frames - n]:
+                    yield frame
+                    n += 1
+                if not self.bolContinuous:  # stopped by the camera
+                    break
+        finally:
+            if self.bolContinuous:
+                self.StopContinuousAcquisition()
         
 if __name__ == "__main__":
     
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Simulated Picam library, standing in for picam_64bit.dll so that Pixis can be run without a camera:
+
+    p = Pixis(dll=SimulatedPicam(), with_start_up=True)
+
+Functions take the same ctypes arguments as the library (pointer() or byref() for outputs) and return Picam error
+codes. Parameters are stored by id, and frames are deterministic: pixel i (counting row by row) of the k-th readout
+since the start of an acquisition is (i + k) % 65536.
+In a continuous acquisition, each Picam_WaitForAcquisitionUpdate produces readouts_per_update new readouts in the
+acquisition buffer, as the camera would between two updates.
+"""
+
+import ctypes as ct
+import numpy as np
+
+from .picam_constants import PicamParameter, PicamError, PI_V, transpose_dictionary
+
+ERROR_CODES = transpose_dictionary(PicamError)
+
+
+def _parameter_id(name):
+    return PI_V(*PicamParameter[name])
+
+
+def _target(arg):
+    """The ctypes object an output argument (made with pointer() or byref()) refers to"""
+    return arg._obj if hasattr(arg, '_obj') else arg.contents
+
+
+class SimulatedPicam(object):
+    def __init__(self, width=1340, height=100, readouts_per_update=1, readout_rate=100.):
+        self.readouts_per_update = readouts_per_update
+        self.readout_rate = readout_rate
+        self.parameters = {
+            _parameter_id("PicamParameter_SensorActiveWidth"): width,
+            _parameter_id("PicamParameter_SensorActiveHeight"): height,
+            _parameter_id("PicamParameter_ReadoutStride"): width * height * 2,
+            _parameter_id("PicamParameter_ReadoutCount"): 1,
+            _parameter_id("PicamParameter_ExposureTime"): 10.,
+            _parameter_id("PicamParameter_SensorTemperatureSetPoint"): -80.,
+            _parameter_id("PicamParameter_SensorTemperatureReading"): -80.,
+            _parameter_id("PicamParameter_SensorTemperatureStatus"): 2,  # locked
+        }
+        self.calls = []
+        self.running = False
+        self.acquisition_buffer = None
+        self.readouts = 0  # readouts of the current acquisition
+        self._acquire_buffer = None
+
+    def frame(self, index):
+        width = self.parameters[_parameter_id("PicamParameter_SensorActiveWidth")]
+        height = self.parameters[_parameter_id("PicamParameter_SensorActiveHeight")]
+        return ((np.arange(width * height) + index) % 65536).astype(np.uint16)
+
+    def _record(self, name):
+        self.calls.append(name)
+        return ERROR_CODES["PicamError_None"]
+
+    def Picam_InitializeLibrary(self):
+        return self._record("Picam_InitializeLibrary")
+
+    def Picam_IsLibraryInitialized(self, initialized):
+        _target(initialized).value = True
+        return self._record("Picam_IsLibraryInitialized")
+
+    def Picam_UninitializeLibrary(self):
+        return self._record("Picam_UninitializeLibrary")
+
+    def Picam_OpenFirstCamera(self, handle):
+        _target(handle).value = 1
+        return self._record("Picam_OpenFirstCamera")
+
+    def Picam_CloseCamera(self, handle):
+        return self._record("Picam_CloseCamera")
+
+    def PicamAdvanced_RefreshParametersFromCameraDevice(self, handle):
+        return self._record("PicamAdvanced_RefreshParametersFromCameraDevice")
+
+    def _get(self, handle, parameter, value):
+        if parameter not in self.parameters:
+            return ERROR_CODES["PicamError_ParameterDoesNotExist"]
+        _target(value).value = self.parameters[parameter]
+        return self._record("Picam_GetParameter")
+
+    def _set(self, handle, parameter, value):
+        self.parameters[parameter] = value.value
+        return self._record("Picam_SetParameter")
+
+    Picam_GetParameterIntegerValue = _get
+    Picam_GetParameterLargeIntegerValue = _get
+    Picam_GetParameterFloatingPointValue = _get
+    Picam_SetParameterIntegerValue = _set
+    Picam_SetParameterLargeIntegerValue = _set
+    Picam_SetParameterFloatingPointValue = _set
+
+    def Picam_CommitParameters(self, handle, failed_parameters, failed_count):
+        _target(failed_count).value = 0
+        return self._record("Picam_CommitParameters")
+
+    def Picam_AreParametersCommitted(self, handle, committed):
+        _target(committed).value = True
+        return self._record("Picam_AreParametersCommitted")
+
+    def Picam_Acquire(self, handle, readout_count, timeout, available, errors):
+        self._acquire_buffer = self.frame(0)  # owned by the library, like the real one
+        _target(available).ptr = self._acquire_buffer.ctypes.data
+        _target(available).intCount = 1
+        _target(errors).value = 0
+        return self._record("Picam_Acquire")
+
+    def PicamAdvanced_SetAcquisitionBuffer(self, handle, buffer):
+        buffer = _target(buffer)
+        if self.running:
+            return ERROR_CODES["PicamError_AcquisitionInProgress"]
+        self.acquisition_buffer = np.ctypeslib.as_array((ct.c_uint8 * buffer.memory_size).from_address(buffer.memory))
+        return self._record("PicamAdvanced_SetAcquisitionBuffer")
+
+    def Picam_StartAcquisition(self, handle):
+        if self.running:
+            return ERROR_CODES["PicamError_AcquisitionInProgress"]
+        stride = self.parameters[_parameter_id("PicamParameter_ReadoutStride")]
+        if self.acquisition_buffer is None or len(self.acquisition_buffer) < stride:
+            return ERROR_CODES["PicamError_InvalidAcquisitionBuffer"]
+        self.running = True
+        self.readouts = 0
+        return self._record("Picam_StartAcquisition")
+
+    def Picam_StopAcquisition(self, handle):
+        self.running = False
+        return self._record("Picam_StopAcquisition")
+
+    def Picam_IsAcquisitionRunning(self, handle, running):
+        _target(running).value = int(self.running)
+        return self._record("Picam_IsAcquisitionRunning")
+
+    def Picam_WaitForAcquisitionUpdate(self, handle, timeout, available, status):
+        self.calls.append("Picam_WaitForAcquisitionUpdate")
+        available = _target(available)
+        status = _target(status)
+        status.readout_rate = self.readout_rate
+        status.errors = 0
+        if not self.running:
+            available.intCount = 0
+            status.running = 0
+            return ERROR_CODES["PicamError_AcquisitionNotInProgress"]
+        stride = self.parameters[_parameter_id("PicamParameter_ReadoutStride")]
+        n_slots = len(self.acquisition_buffer) // stride
+        total = self.parameters[_parameter_id("PicamParameter_ReadoutCount")]
+        first_slot = self.readouts % n_slots
+        # new readouts are contiguous: any that would wrap around the end of the buffer come with the next update
+        count = min(self.readouts_per_update, n_slots - first_slot)
+        if total:
+            count = min(count, total - self.readouts)
+        for slot in range(first_slot, first_slot + count):
+            frame = self.frame(self.readouts).view(np.uint8)
+            self.acquisition_buffer[slot * stride:slot * stride + len(frame)] = frame
+            self.readouts += 1
+        available.ptr = self.acquisition_buffer.ctypes.data + first_slot * stride
+        available.intCount = count
+        if total and self.readouts >= total:
+            self.running = False
+        status.running = int(self.running)
+        return ERROR_CODES["PicamError_None"]
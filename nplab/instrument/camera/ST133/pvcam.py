@@ -1380,6 +1380,7 @@ class PvcamSdk(object):
 
 class Pvcam(CameraRoiScale, PvcamSdk):
     metadata_property_names = ('exposure', 'binning', 'roi')
+    hardware_roi = True  # roi and binning set the image rectangle and binning of the acquisition
 
     def __init__(self, device, **kwargs):
         # super(Pvcam, self).__init__(device, logger=self._logger)
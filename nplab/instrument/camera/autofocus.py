@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive autofocus
+==================
+
+`CameraWithLocation.autofocus` visits every point of a fixed list of Z positions.  The `AutofocusEngine` here instead
+chooses where to measure next based on what it has already seen, so it can find the focus with fewer stage moves
+(and fewer settling times and images), or more accurately with as many:
+
+``brent``
+    Brent's bounded minimisation (golden-section steps with parabolic interpolation), from scipy.
+``golden``
+    Plain golden-section search, which only assumes the merit function has a single peak in the search range.
+``parabola``
+    Model-based: fit a Gaussian (a parabola to the log of the merit function) to the best point and its neighbours,
+    measure at its peak, and repeat until the points around the peak are closer together than the tolerance.
+
+It can also focus "on the fly" (`AutofocusEngine.sweep`): Z is swept at a constant velocity while frames are taken
+continuously (from the live view if it's running), and the stage then goes straight to the best position.  This
+sends many small position commands, so it's only worthwhile where the stage streams them cheaply.
+
+To make each measurement cheaper, the merit function is evaluated on a central region of the image, binned down.
+The number of moves, images and the time taken by each focus are recorded in ``history`` (and logged), so that
+methods can be compared - see `benchmark`, which uses a `DummyCamera` whose images blur as a `DummyStage` moves in Z.
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import object
+from builtins import range
+import threading
+import time
+import numpy as np
+from scipy import ndimage
+from scipy.optimize import minimize_scalar
+from nplab.instrument.camera import merit_functions
+
+GOLDEN_RATIO = (np.sqrt(5) - 1) / 2
+
+
+class AutofocusEngine(object):
+    """Finds the focus of a `CameraWithLocation` with as few stage moves as possible."""
+    def __init__(self, camera_with_location, merit_function='squared_laplacian', roi_size=(256, 256), binning=2):
+        """
+        :param camera_with_location: the CameraWithLocation to focus
+        :param merit_function: the name of one of `merit_functions.METRICS`, or a function taking a float32 stack of
+            images and returning a focus score for each, which we maximise
+        :param roi_size: (rows, columns) of the central region of the image used to measure focus, or None for all of it
+        :param binning: int. The region is downsampled by averaging blocks of binning x binning pixels
+        """
+        self.cwl = camera_with_location
+        self.merit_function = merit_function
+        self.roi_size = roi_size
+        self.binning = binning
+        self.history = []  # a dictionary for each focus, with the method, number of moves, images, time, etc.
+        self._moves = 0
+        self._images = 0
+
+    def merit(self, image):
+        """The merit function, evaluated on the binned central region of an image"""
+        roi = None if self.roi_size is None else merit_functions.centred_roi(np.shape(image), self.roi_size)
+        return merit_functions.merit(image, self.merit_function, roi=roi, binning=self.binning)
+
+    def _move_z(self, z):
+        position = np.array(self._here, dtype=float)
+        position[2] = z
+        self.cwl.stage.move(position)
+        self._moves += 1
+
+    def measure(self, z):
+        """Move to a Z position (keeping X and Y where they were at the start of the focus) and measure focus there.
+
+        Each position is only measured once per focus: repeated requests return the earlier measurement.
+        """
+        if z in self._measurements:
+            return self._measurements[z]
+        self._move_z(z)
+        self.cwl.settle()
+        self._images += 1
+        merit = self.merit(self.cwl.camera.raw_image(update_latest_frame=True))
+        self._measurements[z] = merit
+        self._last_z = z
+        return merit
+
+    def _start(self):
+        self._here = np.array(self.cwl.stage.position, dtype=float)
+        self._moves = 0
+        self._images = 0
+        self._measurements = {}
+        self._last_z = self._here[2]
+        self._start_time = time.time()
+
+    def _finish(self, method, best_z, **extra):
+        if best_z != self._last_z:
+            self._move_z(best_z)
+        record = {'method': method, 'moves': self._moves, 'images': self._images,
+                  'duration': time.time() - self._start_time, 'z': best_z, 'shift': best_z - self._here[2]}
+        record.update(extra)
+        self.history.append(record)
+        self.cwl.log("Autofocus ({method}) moved by {shift:.3g} using {moves} moves and {images} images "
+                     "in {duration:.2f}s".format(**record))
+        return record
+
+    def _results(self, record):
+        """Return values in the same form as CameraWithLocation.autofocus"""
+        z = np.array(sorted(self._measurements))
+        positions = np.tile(self._here, (len(z), 1))
+        positions[:, 2] = z
+        powers = np.array([self._measurements[zi] for zi in z])
+        new_position = np.array(self._here)
+        new_position[2] = record['z']
+        return new_position - self._here, positions, powers
+
+    def focus(self, method="brent", search_range=None, tolerance=None, max_measurements=20):
+        """Find the best focus within a range of Z positions centred on the current one, and move there.
+
+        :param method: "brent", "golden" or "parabola" (see the module docstring)
+        :param search_range: total Z range to search.  Defaults to the range of CameraWithLocation.autofocus.
+        :param tolerance: how precisely to find the focus.  Defaults to half the CameraWithLocation's step size, which
+            is about as precise as its fixed-step autofocus.
+        :param max_measurements: int. Give up refining after this many measurements.
+        :return: (shift, positions, powers), like CameraWithLocation.autofocus
+        """
+        if search_range is None:
+            search_range = self.cwl.af_steps * self.cwl.af_step_size
+        if tolerance is None:
+            tolerance = self.cwl.af_step_size / 2.
+        self._start()
+        lower, upper = self._here[2] - search_range / 2., self._here[2] + search_range / 2.
+        if method == "brent":
+            result = minimize_scalar(lambda z: -self.measure(z), bounds=(lower, upper), method="bounded",
+                                     options={'xatol': tolerance, 'maxiter': max_measurements})
+            best_z = result.x
+        elif method == "golden":
+            best_z = self._golden_section(lower, upper, tolerance, max_measurements)
+        elif method == "parabola":
+            best_z = self._parabola(lower, upper, tolerance, max_measurements)
+        else:
+            raise ValueError("Unknown autofocus method '{}'".format(method))
+        if best_z - lower < tolerance or upper - best_z < tolerance:
+            self.cwl.log("The best focus was at the edge of the autofocus range.", level="warn")
+        return self._results(self._finish(method, best_z))
+
+    def _golden_section(self, lower, upper, tolerance, max_measurements):
+        a, b = lower, upper
+        c, d = b - GOLDEN_RATIO * (b - a), a + GOLDEN_RATIO * (b - a)
+        fc, fd = self.measure(c), self.measure(d)
+        while b - a > tolerance and len(self._measurements) < max_measurements:
+            if fc > fd:  # the peak is in [a, d]
+                b, d, fd = d, c, fc
+                c = b - GOLDEN_RATIO * (b - a)
+                fc = self.measure(c)
+            else:  # the peak is in [c, b]
+                a, c, fc = c, d, fd
+                d = a + GOLDEN_RATIO * (b - a)
+                fd = self.measure(d)
+        return c if fc > fd else d
+
+    def _parabola(self, lower, upper, tolerance, max_measurements):
+        for z in (lower, (lower + upper) / 2., upper):
+            self.measure(z)
+        while True:
+            z = np.array(sorted(self._measurements))
+            merits = np.array([self._measurements[zi] for zi in z])
+            i = int(np.clip(np.argmax(merits), 1, len(z) - 2))
+            # Fit to the best point and its neighbours, so that far-off points (in the tails of the peak) don't bias it.
+            # Sharpness usually falls off like a Gaussian, so it's the logarithm of the merit that's fitted.
+            y = np.log(merits[i - 1:i + 2]) if np.all(merits[i - 1:i + 2] > 0) else merits[i - 1:i + 2]
+            c = np.polyfit(z[i - 1:i + 2], y, deg=2)
+            vertex = -c[1] / (2 * c[0]) if c[0] < 0 else z[np.argmax(merits)]
+            vertex = float(np.clip(vertex, lower, upper))
+            if z[i + 1] - z[i - 1] < 4 * tolerance or len(self._measurements) >= max_measurements:
+                return vertex
+            if np.min(np.abs(z - vertex)) < tolerance:
+                # The model is confirming a point we've already measured, so check its neighbourhood instead,
+                # halving the larger of the gaps either side of it.
+                best = int(np.argmax(merits))
+                neighbours = [j for j in (best - 1, best + 1) if 0 <= j < len(z)]
+                far = max(neighbours, key=lambda j: abs(z[j] - z[best]))
+                vertex = (z[best] + z[far]) / 2.
+            self.measure(vertex)
+
+    def sweep(self, search_range=None, sweep_time=2.0, update_interval=0.01, noise_floor=0.3):
+        """Focus by sweeping Z at a constant velocity while measuring focus on every frame that arrives.
+
+        The stage moves to one end of the range, then a background thread steps it through the range in small,
+        equally-timed increments (use a stage's own constant-velocity move instead if it has one).  Meanwhile frames are
+        taken as fast as the camera delivers them - from the video stream if live view is running, so the preview isn't
+        interrupted - and each is labelled with the Z position at the time it was taken, interpolated from the times the
+        position commands were sent (so the stage isn't queried while it's being moved).  Every position command
+        counts as a move.  Finally the stage moves to the centre of mass of the merit function (above the noise floor,
+        as in CameraWithLocation.autofocus).
+
+        :param search_range: total Z range to sweep through.  Defaults to the range of CameraWithLocation.autofocus.
+        :param sweep_time: float. Time to take over the sweep, in seconds
+        :param update_interval: float. Time between position updates while sweeping, in seconds
+        :param noise_floor: fraction of the range of merit values below which points are ignored
+        :return: (shift, positions, powers), like CameraWithLocation.autofocus
+        """
+        if search_range is None:
+            search_range = self.cwl.af_steps * self.cwl.af_step_size
+        self._start()
+        lower, upper = self._here[2] - search_range / 2., self._here[2] + search_range / 2.
+        camera = self.cwl.camera
+        self._move_z(lower)
+        self.cwl.settle()
+        n_steps = max(int(sweep_time / update_interval), 1)
+        # the commanded trajectory: the time each position command was sent, and its Z position
+        trajectory_times, trajectory_z = [time.time()], [lower]
+
+        def move_at_constant_velocity():
+            start = time.time()
+            for i in range(1, n_steps + 1):
+                time.sleep(max(start + i * update_interval - time.time(), 0))
+                position = np.array(self._here, dtype=float)
+                position[2] = lower + (upper - lower) * i / n_steps
+                self.cwl.stage.move(position)
+                trajectory_times.append(time.time())
+                trajectory_z.append(position[2])
+        mover = threading.Thread(target=move_at_constant_velocity)
+        mover.start()
+        frame_times, merits = [], []
+        while mover.is_alive():
+            time_before = time.time()
+            if camera.live_view:
+                frame = camera.get_next_frame(raw=True)
+            else:
+                frame = camera.raw_image()
+            frame_times.append((time_before + time.time()) / 2.)
+            merits.append(self.merit(frame))
+            self._images += 1
+        mover.join()
+        self._last_z = upper
+        stage_commands = len(trajectory_z) - 1
+        self._moves += stage_commands
+        z = np.interp(frame_times, trajectory_times, trajectory_z)
+        merits = np.array(merits)
+        self._measurements = dict(zip(z, merits))
+        weights = merits - (merits.min() + (merits.max() - merits.min()) * noise_floor)
+        weights[weights < 0] = 0
+        if len(z) == 0 or np.sum(weights) == 0:
+            self.cwl.log("Autofocus sweep didn't find a peak, returning to the initial position.", level="warn")
+            best_z = self._here[2]
+        else:
+            best_z = np.dot(weights, z) / np.sum(weights)
+        return self._results(self._finish("sweep", best_z, stage_commands=stage_commands))
+
+    def moves_per_focus(self):
+        """The mean number of moves (and images) taken by each method, over the focuses recorded in ``history``
+
+        :return: dict of method: (mean moves, mean images)
+        """
+        summary = {}
+        for method in set(record['method'] for record in self.history):
+            records = [r for r in self.history if r['method'] == method]
+            summary[method] = (np.mean([r['moves'] for r in records]), np.mean([r['images'] for r in records]))
+        return summary
+
+
+def benchmark(methods=("brent", "golden", "parabola", "sweep"), repeats=5, search_range=7, tolerance=None):
+    """Compare the number of moves needed to focus by each method with that of CameraWithLocation.autofocus.
+
+    This uses a DummyCamera and a 3-axis DummyStage, with a simulated sample that blurs in proportion to its distance
+    from Z=0.  Each focus starts from a random Z position within the search range.  Moves are counted on the stage
+    itself, for every method alike, and the RMS error of the final position is reported alongside them so the methods
+    can be compared at matched accuracy.  The fixed-step scan uses a step of 1, and the adaptive methods by default
+    the same tolerance as `AutofocusEngine.focus` (half a step).
+
+    :return: dict of method: (mean moves, mean images, RMS focus error)
+    """
+    from nplab.instrument.camera import DummyCamera
+    from nplab.instrument.stage import DummyStage
+    from nplab.instrument.camera.camera_with_location import CameraWithLocation
+
+    stage = DummyStage()
+    stage.axis_names = ('x', 'y', 'z')
+    stage._position = np.zeros(3)
+    sample = ndimage.gaussian_filter(np.random.RandomState(0).rand(240, 320), 1)
+    stage_moves = [0]
+    images = [0]
+    move = stage.move
+
+    def counted_move(*args, **kwargs):
+        stage_moves[0] += 1
+        return move(*args, **kwargs)
+    stage.move = counted_move
+
+    class DefocusingCamera(DummyCamera):
+        def raw_snapshot(self):
+            images[0] += 1
+            blurred = ndimage.gaussian_filter(sample, 0.5 + 2 * abs(stage.position[2]))
+            image = (blurred - sample.min()) / (sample.max() - sample.min()) * 255
+            return True, np.repeat(image[:, :, np.newaxis], 3, axis=2).astype(np.uint8)
+
+    cwl = CameraWithLocation(DefocusingCamera(), stage)
+    cwl.af_step_size = 1
+    cwl.af_steps = search_range
+    engine = AutofocusEngine(cwl, roi_size=(128, 128), binning=2)
+    rng = np.random.RandomState(1)
+    starts = rng.uniform(-search_range / 3., search_range / 3., repeats)
+
+    def run(focus):
+        moves, n_images, errors = [], [], []
+        for z in starts:
+            move([0, 0, z])  # not counted
+            stage_moves[0] = images[0] = 0
+            focus()
+            moves.append(stage_moves[0])
+            n_images.append(images[0])
+            errors.append(stage.position[2])
+        return np.mean(moves), np.mean(n_images), np.sqrt(np.mean(np.square(errors)))
+
+    results = {'fixed steps': run(lambda: cwl.autofocus(
+        dz=np.arange(-(search_range // 2), search_range // 2 + 1) * cwl.af_step_size))}
+    for method in methods:
+        if method == "sweep":
+            results[method] = run(lambda: engine.sweep(search_range=search_range, sweep_time=0.5))
+        else:
+            results[method] = run(lambda: engine.focus(method, search_range=search_range, tolerance=tolerance))
+    print("{:>12} {:>8} {:>8} {:>10}".format("method", "moves", "images", "RMS error"))
+    for method, (moves, n_images, error) in results.items():
+        print("{:>12} {:>8.1f} {:>8.1f} {:>10.3f}".format(method, moves, n_images, error))
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
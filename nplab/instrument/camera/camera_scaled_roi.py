@@ -30,6 +30,7 @@ class CameraRoiScale(Camera):
         self._roi = (0, 1000, 0, 1000)
         self.detector_shape = (1000, 1000)
         self.crosshair_origin = crosshair_origin
+        self._roi_axes_cache = dict()
 
     @property
     def x_axis(self):
@@ -47,6 +48,15 @@ class CameraRoiScale(Camera):
     def y_axis(self, value):
         self.axis_values['left'] = value
 
+    hardware_roi = False
+    """Whether the camera crops (and bins) its frames itself when roi (and binning) are set. Subclasses that
+    overwrite the roi and binning properties to set them in the hardware should set this to True. Otherwise, frames are
+    cropped and binned in software by the filter function, using strided views of the full frame"""
+
+    inclusive_roi = False
+    """Whether xmax and ymax are the last pixels in the ROI (as for the Andor Image parameter), rather than one past
+    them (as in slicing)"""
+
     @property
     def roi(self):
         """
@@ -63,10 +73,8 @@ class CameraRoiScale(Camera):
 
         :return: 4-tuple of integers. Pixel positions xmin, xmax, ymin, ymax
         """
-        self._roi = value
-        def fltr(img):
-            return img[self._roi[2]:self._roi[3], self._roi[0]:self._roi[1]]
-        setattr(self, 'filter_function', fltr)
+        self._roi = tuple(value)
+        self._update_filter()
 
     @property
     def gui_roi(self):
@@ -80,17 +88,91 @@ class CameraRoiScale(Camera):
             if lims is None: lims = (0,1,0,1)
         return lims
 
+    def apply_gui_roi(self):
+        """Sets the ROI to the rectangle selected with the crosshairs, in the hardware if the camera supports it"""
+        self.roi = self.gui_roi
+
     @property
     def binning(self):
         """
         The binning property is passed to the display widgets to keep the scaling and units constant, independent of
         binning.
 
-        By default, it is assumed the camera does not support binning, so the property returns (1, 1) and has no setter.
-        A subclass should overwrite this if the camera supports binnig
-        :return:
+        By default, it is assumed the camera does not support binning, so frames are binned in software by the filter
+        function (summing the binned pixels). A subclass should overwrite this if the camera supports binning
+        :return: 2-tuple of integers. x, y binning
+        """
+        return getattr(self, '_binning', (1, 1))
+
+    @binning.setter
+    def binning(self, value):
+        if not isinstance(value, tuple):
+            value = (value, value)
+        self._binning = value
+        self._update_filter()
+
+    def _update_filter(self):
+        """Crops and bins frames in software, unless the camera does it in hardware"""
+        if self.hardware_roi:
+            self.filter_function = None
+        else:
+            self.filter_function = self.crop_and_bin
+
+    def crop_and_bin(self, img):
+        """
+        Crops a full frame to the ROI, and bins it. Cropping is a strided view of the frame, and so is splitting the
+        binned pixels into their own axes, so the only copy made is the (smaller) binned frame
+
+        :param img: (y, x) or (y, x, colour) image, or 1D (x) spectrum
+        :return: view of img if there is no binning, new array otherwise
+        """
+        xmin, xmax, ymin, ymax = self._roi
+        if self.inclusive_roi:
+            xmax, ymax = xmax + 1, ymax + 1
+        binning = self.binning
+        if img.ndim == 1:
+            view = img[xmin:xmax]
+            binning = (binning[0], 1)  # only the x binning applies
+            view = view[np.newaxis]
+        else:
+            view = img[ymin:ymax, xmin:xmax]
+        if binning == (1, 1):
+            return view if img.ndim > 1 else view[0]
+        xbin, ybin = binning
+        height, width = view.shape[0] // ybin, view.shape[1] // xbin
+        view = view[:height * ybin, :width * xbin]
+        binned = view.reshape((height, ybin, width, xbin) + view.shape[2:]).sum(axis=(1, 3))
+        return binned if img.ndim > 1 else binned[0]
+
+    def roi_axes(self):
+        """
+        The x and y axis values of the pixels of the current frames, i.e. x_axis and y_axis cropped to the ROI and
+        averaged over the binned pixels. Cached for each ROI and binning, for as long as x_axis and y_axis return the
+        same arrays
+
+        :return: 2-tuple of arrays, or None for an axis that has no values
         """
-        return 1, 1
+        roi, binning = tuple(self.roi), tuple(self.binning)
+        sources = (self.x_axis, self.y_axis)
+        cached = self._roi_axes_cache.get((roi, binning))
+        if cached is not None and all(a is b for a, b in zip(cached[0], sources)):
+            return cached[1]
+        stop = 1 if self.inclusive_roi else 0
+        axes = []
+        for source, start, end, pixels in zip(sources, roi[::2], roi[1::2], binning):
+            if source is None:
+                axes.append(None)
+                continue
+            values = np.asarray(source, dtype=float)[start:end + stop]
+            n_bins = len(values) // pixels
+            values = values[:n_bins * pixels].reshape(n_bins, pixels).mean(axis=1)
+            values.flags.writeable = False
+            axes.append(values)
+        axes = tuple(axes)
+        if len(self._roi_axes_cache) > 32:
+            self._roi_axes_cache.clear()
+        self._roi_axes_cache[(roi, binning)] = (sources, axes)
+        return axes
 
     def update_widgets(self):
         """
@@ -98,18 +180,26 @@ class CameraRoiScale(Camera):
         :return:
         """
         if self._preview_widgets is not None:
+            roi = tuple(self.roi)
+            binning = tuple(self.binning)
             for widgt in self._preview_widgets:
                 if isinstance(widgt, DisplayWidgetRoiScale):
+                    # The axes and crosshairs only need updating when the ROI, binning or axes change, not every frame
+                    state = (roi, binning, tuple(sorted(self.axis_units.items())), self.live_view)
+                    axes = (self.x_axis, self.y_axis)
+                    if widgt._roi_state == state and all(a is b for a, b in zip(widgt._roi_axes, axes)):
+                        continue
+                    widgt._roi_state, widgt._roi_axes = state, axes
                     # Set the position of the updated image
-                    roi = self.roi
                     widgt._pxl_offset = (roi[0], roi[2])
                     # Set the scaling
-                    widgt._pxl_scale = self.binning
+                    widgt._pxl_scale = binning
                     # Set the axes values and units
                     widgt.axis_values = self.axis_values
                     widgt.axis_units = self.axis_units
                     widgt.x_axis = self.x_axis
                     widgt.y_axis = self.y_axis
+                    widgt.line_x_axis = self.roi_axes()[0]
                     if not self.live_view:  # not sure why it doesn't work in live view
                         widgt.update_axes()
                     widgt.crosshair_moved()
@@ -154,6 +244,9 @@ class DisplayWidgetRoiScale(ExtendedImageView):
 
         self._pxl_scale = scale
         self._pxl_offset = offset
+        self._roi_state = None  # the ROI, binning, units and live view state the axes were last set for by the camera
+        self._roi_axes = (None, None)
+        self.line_x_axis = None  # x axis of the pixels of the frames, used when displaying them as lines
 
         self.LineDisplay = self.ui.roiPlot#creates a PlotWidget instance
         self.LineDisplay.showGrid(x=True, y=True)
@@ -222,13 +315,16 @@ class DisplayWidgetRoiScale(ExtendedImageView):
         scale = self._pxl_scale
         offset = self._pxl_offset
 
+        x_axis = self.x_axis
+        if self.line_x_axis is not None and len(self.line_x_axis) == newimage.shape[-1]:
+            x_axis = self.line_x_axis
         if len(newimage.shape) == 1:
             self.toggle_displays(True)
-            self.plot[0].setData(x=self.x_axis, y=newimage)
+            self.plot[0].setData(x=x_axis, y=newimage)
         elif len(newimage.shape) == 2 and newimage.shape[0] < self._max_num_line_plots:
             self.toggle_displays(True)
             for ii, ydata in enumerate(newimage):
-                self.plot[ii].setData(x=self.x_axis, y=ydata)
+                self.plot[ii].setData(x=x_axis, y=ydata)
         else:
             self.toggle_displays(False)
             self.setImage(newimage.astype(float),
@@ -243,9 +339,19 @@ class DisplayWidgetRoiScale(ExtendedImageView):
 class DummyCameraRoiScale(CameraRoiScale):
     """A Dummy CameraRoiScale camera  """
 
-    def __init__(self, data='spectrum'):
+    def __init__(self, data='spectrum', detector_shape=(1600, 200), hardware_roi=False):
+        """
+        :param data: type of frames returned, see raw_snapshot
+        :param detector_shape: (x, y) number of pixels of 'image' frames
+        :param hardware_roi: if True, 'image' frames are cropped and binned as they are generated, like a camera that
+            sets its ROI in hardware would. Otherwise, full frames are generated and cropped in software
+        """
         super(DummyCameraRoiScale, self).__init__()
         self.data_type = data
+        self.hardware_roi = hardware_roi
+        self.detector_shape = detector_shape
+        self._roi = (0, detector_shape[0], 0, detector_shape[1])
+        self._x_axis = np.arange(1600) + 1
 
     def raw_snapshot(self, update_latest_frame=True):
         """Returns a True, stating a succesful snapshot, followed by a (100,100)
@@ -257,7 +363,12 @@ class DummyCameraRoiScale(CameraRoiScale):
         elif self.data_type == 'time':
             ran = 100 * np.array([np.random.random((200, 1600, 3)) * x for x in np.arange(1, 11)])
         elif self.data_type == 'image':
-            ran = 100 * np.random.random((200, 1600))
+            if self.hardware_roi:
+                xmin, xmax, ymin, ymax = self.roi
+                shape = ((ymax - ymin) // self.binning[1], (xmax - xmin) // self.binning[0])
+            else:
+                shape = self.detector_shape[::-1]
+            ran = 100 * np.random.random(shape)
         elif self.data_type == 'color':
             ran = 100 * np.random.random((200, 1600, 3))
         else:
@@ -267,13 +378,43 @@ class DummyCameraRoiScale(CameraRoiScale):
 
     @property
     def x_axis(self):
-        return np.arange(1600) + 1
+        return self._x_axis
 
     @x_axis.setter
     def x_axis(self, value):
         self.axis_values['bottom'] = value
 
 
+def benchmark(detector_shape=(2048, 2048), roi_sizes=(2048, 1024, 512, 128), repeats=10):
+    """
+    Prints the time taken to acquire and filter a live view frame (as update_widgets does, including the conversion to
+    float for display) with ROIs of different sizes, when cropping in hardware and in software.
+
+    :param detector_shape: (x, y) number of pixels of the DummyCameraRoiScale
+    :param roi_sizes: side lengths of the square ROIs, centred on the detector
+    :param repeats: number of frames averaged over
+    :return: dict of roi_size: (software, hardware) time per frame in seconds
+    """
+    import time
+
+    results = dict()
+    print('{:>10} {:>14} {:>14}'.format('roi size', 'software ROI', 'hardware ROI'))
+    for size in roi_sizes:
+        x0, y0 = (detector_shape[0] - size) // 2, (detector_shape[1] - size) // 2
+        timings = []
+        for hardware in (False, True):
+            camera = DummyCameraRoiScale('image', detector_shape, hardware)
+            camera.roi = (x0, x0 + size, y0, y0 + size)
+            start = time.time()
+            for _ in range(repeats):
+                camera.latest_raw_frame = camera.raw_snapshot()[1]
+                camera.latest_frame.astype(float)
+            timings.append((time.time() - start) / repeats)
+        results[size] = tuple(timings)
+        print('{:>10} {:>11.2f} ms {:>11.2f} ms'.format(size, *[t * 1e3 for t in timings]))
+    return results
+
+
 if __name__ == '__main__':
     import sys
     from nplab.utils.gui import get_qt_app
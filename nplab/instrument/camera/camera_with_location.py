@@ -22,6 +22,10 @@ from nplab.instrument.stage import Stage
 from nplab.instrument import Instrument
 import numpy as np
 from nplab.utils.image_with_location import ImageWithLocation, ensure_3d, ensure_2d, locate_feature_in_image, datum_pixel
+from nplab.utils.image_with_location import FeatureTracker
+from nplab.utils.mosaic import TiledMosaic
+from nplab.instrument.camera.autofocus import AutofocusEngine
+from nplab.instrument.camera import merit_functions
 from nplab.experiment import Experiment, ExperimentStopped
 from nplab.experiment.gui import ExperimentWithProgressBar, run_function_modally
 from nplab.utils.gui import QtCore, QtGui, QtWidgets
@@ -38,15 +42,13 @@ def distance(p1, p2): # between two ndarrays
     return  ((p1-p2)**2).sum()
 
 
-# Autofocus merit functions
+# Autofocus merit functions (see also nplab.instrument.camera.merit_functions, which also works on stacks of images)
 def af_merit_squared_laplacian(image):
-    """Return the mean squared Laplacian of an image - a sharpness metric.
+    """Return the sum of the squared Laplacian of an image - a sharpness metric.
 
     The image will be converted to grayscale if its shape is MxNx3"""
-    if len(image.shape) == 3:
-        image = np.mean(image, axis=2, dtype=image.dtype)
-    assert len(image.shape) == 2, "The image is the wrong shape - must be 2D or 3D"
-    return np.sum(cv2.Laplacian(image, ddepth=cv2.CV_32F) ** 2)
+    assert len(image.shape) in (2, 3), "The image is the wrong shape - must be 2D or 3D"
+    return merit_functions.merit(image, 'squared_laplacian') * image.shape[0] * image.shape[1]
 
 
 class CameraWithLocation(Instrument):
@@ -67,6 +69,7 @@ class CameraWithLocation(Instrument):
     af_step_size = DumbNotifiedProperty(1) # The size of steps to take when autofocusing
     af_steps = DumbNotifiedProperty(7) # The number of steps to take during autofocus
     use_thumbnail = DumbNotifiedProperty(False)
+    autofocus_engine = None # Created on first use by adaptive_autofocus
     def __init__(self, camera=None, stage=None):
         # If no camera or stage is supplied, attempt to retrieve them - but crash with an exception if they don't exist.
         if camera is None:
@@ -205,6 +208,9 @@ class CameraWithLocation(Instrument):
             Once the error between our current position and the feature's position is below this threshold, we stop.
         max_iterations : int (optional)
             The maximum number of moves we make to fine-tune the position.
+
+        The feature is found with a `FeatureTracker`, which is kept as ``self.feature_tracker`` so the quality of the
+        last match can be checked afterwards.
         """
         if (feature.datum_pixel[0]<0 or feature.datum_pixel[0]>np.shape(feature)[0] or 
             feature.datum_pixel[1]<0 or feature.datum_pixel[1]>np.shape(feature)[1]):
@@ -224,17 +230,14 @@ class CameraWithLocation(Instrument):
         assert isinstance(image, ImageWithLocation), "CameraWithLocation should return an ImageWithLocation...?"
 
         last_move = np.infty
+        # With a margin, we only search near the datum pixel (falling back to the whole image if it's not there)
+        tracker = FeatureTracker(feature, search_radius=margin if margin > 0 else None)
+        self.feature_tracker = tracker
         for i in range(max_iterations):
             try:
                 self.settle()
                 image = self.color_image(update_latest_frame=True)
-               # , image_size
-                pixel_position = locate_feature_in_image(image,
-                                                         feature,
-                                                         margin=margin,
-                                                         restrict=(margin > 0))
-             #   pixel_position = locate_feature_in_image(image, feature,margin=margin)
-                
+                pixel_position = tracker.locate(image, predicted_position=image.datum_pixel)
                 new_position = image.pixel_to_location(pixel_position)
                 dist = distance(image.datum_location, new_position)
                 if dist > max_allowed_movement:
@@ -242,7 +245,8 @@ class CameraWithLocation(Instrument):
                     break
                 self.move(new_position)
                 last_move = np.sqrt(np.sum((new_position - image.datum_location)**2)) # calculate the distance moved
-                self.log("Centering on feature, iteration {}, moved by {}".format(i, last_move))
+                self.log("Centering on feature, iteration {}, moved by {} (match quality {:.2f})".format(
+                    i, last_move, tracker.quality))
                 if last_move < tolerance:
                     break
             except Exception as e:
@@ -332,6 +336,23 @@ class CameraWithLocation(Instrument):
         self.camera.exposure = self.camera.exposure*exposure_factor
         return new_position - here, positions, powers
 
+    def adaptive_autofocus(self, method="brent", **kwargs):
+        """Autofocus with as few stage moves as possible, using an `AutofocusEngine`.
+
+        method : str (optional, default "brent")
+            "brent", "golden" or "parabola" choose where to measure based on the measurements so far, and "sweep"
+            sweeps Z at a constant speed while measuring every frame (see `nplab.instrument.camera.autofocus`).
+        Further keyword arguments are passed to `AutofocusEngine.focus` (or `AutofocusEngine.sweep`).  The number of
+        moves and images each autofocus needed is recorded in ``self.autofocus_engine.history``.
+
+        Returns the same as `autofocus`.
+        """
+        if self.autofocus_engine is None:
+            self.autofocus_engine = AutofocusEngine(self)
+        if method == "sweep":
+            return self.autofocus_engine.sweep(**kwargs)
+        return self.autofocus_engine.focus(method, **kwargs)
+
     def quick_autofocus(self, dz=0.5, full_dz = None, trigger_full_af=True, update_progress=lambda p:p, **kwargs):
         """Do a quick 3-step autofocus, performing a full autofocus if needed
 
@@ -378,7 +399,8 @@ class CameraWithLocation(Instrument):
         threshold_shift = w*0.02 # Require a shift of at least 2% of the image's width ,changed s[0] to w
         target_shift = w*0.1 # Aim for a shift of about 10%
         # Swapping images[-1] for starting_image
-        assert np.sum((locate_feature_in_image(starting_image, template) - self.datum_pixel)**2) < 1, "Template's not centred!"
+        tracker = FeatureTracker(template, search_radius=w // 4)
+        assert np.sum((tracker.locate(starting_image) - self.datum_pixel)**2) < 1, "Template's not centred!"
         update_progress(1)
         if step is None:
             # Next, move a small distance until we see a shift, to auto-determine the calibration distance.
@@ -388,7 +410,7 @@ class CameraWithLocation(Instrument):
                 assert step < max_step, "Error, we hit the maximum step before we saw the sample move."
                 self.move(starting_location + np.array([step, 0, 0]))
                 image = self.color_image()
-                shift = locate_feature_in_image(image, template) - image.datum_pixel
+                shift = tracker.locate(image) - image.datum_pixel
                 if np.sqrt(np.sum(shift**2)) > threshold_shift:
                     break
                 else:
@@ -409,7 +431,7 @@ class CameraWithLocation(Instrument):
         #        print 'post move'
             self.settle()
             image = self.color_image(update_latest_frame=True)
-            pixel_shifts.append(-locate_feature_in_image(image, template) + image.datum_pixel)
+            pixel_shifts.append(-tracker.locate(image) + image.datum_pixel)
             images.append(image)
             # NB the minus sign here: we want the position of the image we just took relative to the datum point of
             # the template, not the other way around.
@@ -517,12 +539,27 @@ class AcquireGridOfImages(ExperimentWithProgressBar):
         super(AcquireGridOfImages, self).__init__(**kwargs)
         self.cwl = camera_with_location
         self.completion_function = completion_function
+        self.stitch = False
+        self.mosaic = None
 
     def prepare_to_run(self, n_tiles=None, overlap_pixels = 250,
-                       data_group=None, autofocus = False, *args, **kwargs):
+                       data_group=None, autofocus = False, stitch=False, max_shift=None, *args, **kwargs):
+        """Set up the scan (this runs in the foreground, before `run`).
+
+        stitch : bool (optional, default False)
+            Assemble the tiles into a mosaic (see `nplab.utils.mosaic.TiledMosaic`) as they are acquired.  The
+            mosaic is saved as a pyramid of datasets (``mosaic_0``, ``mosaic_1``...) next to the tiles, and its
+            coarsest level is available as ``self.mosaic.overview`` while the scan runs.
+        max_shift : int (optional)
+            Largest correction, in pixels, that registration may make to the position of each tile.  Defaults to a
+            fifth of the overlap.
+        """
         self.autofocus = autofocus
         self.progress_maximum = n_tiles[0] * n_tiles[1]
         self.overlap_pixels = overlap_pixels
+        self.stitch = stitch
+        self.max_shift = overlap_pixels // 5 if max_shift is None else max_shift
+        self.mosaic = None
         self.dest = self.cwl.create_data_group("tiled_image_%d")  if data_group is None else data_group
 
     def run(self, n_tiles=(1,1), autofocus_args=None):
@@ -533,6 +570,13 @@ class AcquireGridOfImages(ExperimentWithProgressBar):
         self.log("Starting a {} scan with a step size of {}".format(n_tiles, scan_step))
 
         dest = self.dest
+        if self.stitch:
+            # the pixel-to-sample matrix of the first tile, which is the corner of the mosaic
+            corner_matrix = centre_image.pixel_to_sample_matrix.copy()
+            corner_offset = -(np.array(n_tiles) - 1) / 2.0 * scan_step
+            corner_matrix[3, :3] += np.dot(ensure_3d(corner_offset), corner_matrix[:3, :3])
+            self.mosaic = TiledMosaic(dest, centre_image.shape, n_tiles, scan_step, dtype=centre_image.dtype,
+                                      max_shift=self.max_shift, pixel_to_sample_matrix=corner_matrix)
         x_indices = np.arange(n_tiles[0]) - (n_tiles[0] - 1) / 2.0
         y_indices = np.arange(n_tiles[1]) - (n_tiles[1] - 1) / 2.0
         images_acquired = 0
@@ -545,7 +589,11 @@ class AcquireGridOfImages(ExperimentWithProgressBar):
                     if autofocus_args is not None:
                         self.cwl.autofocus(**autofocus_args)
                     self.cwl.settle()  # wait for the camera to be ready/stage to settle
-                    dest.create_dataset("tile_%d",data=self.cwl.color_image())
+                    tile = self.cwl.color_image()
+                    dest.create_dataset("tile_%d", data=tile)
+                    if self.mosaic is not None:
+                        self.mosaic.add_tile(tile, (x_index + (n_tiles[0] - 1) / 2.0,
+                                                    y_index + (n_tiles[1] - 1) / 2.0))
                     dest.file.flush()
                     images_acquired += 1 # TODO: work out why I can't just use dest.count_numbered_items("tile")
                     self.update_progress(images_acquired)
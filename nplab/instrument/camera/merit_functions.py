@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Autofocus merit functions
+=========================
+
+Sharpness metrics for autofocus, which work on a single image (H x W, or H x W x 3 for colour) or on a stack of images
+(N x H x W, or N x H x W x 3) in one vectorised call, returning one value per image.  All of them are larger for
+sharper images.
+
+``laplacian_variance``
+    Variance of the Laplacian.
+``squared_laplacian``
+    Mean square of the Laplacian (what `af_merit_squared_laplacian` computes, up to normalisation).
+``brenner``
+    Brenner's gradient: mean square difference between pixels two columns apart.
+``tenengrad``
+    Mean squared magnitude of the Sobel gradient.
+``normalised_variance``
+    Variance of the intensity divided by its mean.
+
+Images are first reduced with `prepare`: cropped to a region of interest, converted to grayscale (the mean of the
+colour channels, or a weighted sum of them) and binned, one image at a time, straight into a single preallocated float32 stack (if the input is already a float32
+grayscale stack and it's not binned, no copy is made at all).  The filters are OpenCV's, applied to each image in turn
+into a reused float32 buffer, which is considerably faster than whole-stack numpy arithmetic since each image stays
+in the cache.
+
+Run this module to print a table of the time each metric takes, with and without binning (see `benchmark`).
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+import time
+import numpy as np
+import cv2
+
+
+def centred_roi(shape, size):
+    """A region of interest of the given size, centred in an image of the given shape, as a tuple of slices"""
+    start = np.maximum((np.array(shape[:2]) - np.array(size)) // 2, 0)
+    return (slice(start[0], start[0] + size[0]), slice(start[1], start[1] + size[1]))
+
+
+BGR_LUMINANCE = (0.114, 0.587, 0.299)  #: channel weights of OpenCV's BGR to grayscale conversion, for BGR frames
+RGB_LUMINANCE = BGR_LUMINANCE[::-1]
+
+
+def prepare(images, roi=None, binning=1, channel_weights=None):
+    """Reduce an image, or a stack of images, to a float32 grayscale stack ready for the merit functions.
+
+    :param images: array of shape (H, W), (H, W, 3), (N, H, W) or (N, H, W, 3).  NB a 3D array with a last dimension
+        of 3 is taken to be a single colour image.
+    :param roi: a tuple of two slices (rows, columns) selecting the region of each image to use, or None for all of it
+    :param binning: int. Average blocks of binning x binning pixels together
+    :param channel_weights: weight of each colour channel in the grayscale image, e.g. BGR_LUMINANCE. Defaults to the
+        mean of the channels
+    :return: float32 array of shape (N, h, w)
+    """
+    images = np.asarray(images)
+    colour = images.ndim == 4 or (images.ndim == 3 and images.shape[2] == 3)
+    if images.ndim == 2 or (images.ndim == 3 and colour):
+        images = images[np.newaxis, ...]
+    if roi is not None:
+        images = images[(slice(None), ) + tuple(roi)]
+    if not colour and binning <= 1:
+        return images.astype(np.float32, copy=False)
+    n, h, w = images.shape[:3]
+    if binning > 1:
+        h, w = h // binning, w // binning
+        images = images[:, :h * binning, :w * binning, ...]
+    stack = np.empty((n, h, w), dtype=np.float32)
+    if channel_weights is not None:
+        channel_weights = np.asarray(channel_weights, dtype=np.float32)
+    for image, out in zip(images, stack):
+        # converted to float32 first, as OpenCV doesn't take every dtype (e.g. float64 or int32)
+        if colour and channel_weights is None:
+            image = np.mean(image, axis=2, dtype=np.float32)
+        elif colour:
+            image = np.dot(image.astype(np.float32), channel_weights)
+        if binning > 1:
+            image = cv2.resize(image.astype(np.float32, copy=False), (w, h), interpolation=cv2.INTER_AREA)
+        out[...] = image
+    return stack
+
+
+def _sum_of_squares(image):
+    """Sum of the squares of a contiguous float32 image, without making a squared copy"""
+    v = image.ravel()
+    return float(np.dot(v, v))
+
+
+def _filtered(stack, statistic, filter_function):
+    """Apply filter_function(image, buffer) to each image of the stack, and return statistic(buffer) for each"""
+    buffer = np.empty(stack.shape[1:], dtype=np.float32)
+    return np.array([statistic(filter_function(np.ascontiguousarray(image), buffer)) for image in stack])
+
+
+def _laplacian(image, buffer):
+    return cv2.Laplacian(image, cv2.CV_32F, dst=buffer)
+
+
+def laplacian_variance(stack):
+    n = stack.shape[1] * stack.shape[2]
+    return _filtered(stack, lambda lap: _sum_of_squares(lap) / n - (np.sum(lap, dtype=np.float64) / n)**2,
+                     _laplacian)
+
+
+def squared_laplacian(stack):
+    n = stack.shape[1] * stack.shape[2]
+    return _filtered(stack, lambda lap: _sum_of_squares(lap) / n, _laplacian)
+
+
+def brenner(stack):
+    n = stack.shape[1] * stack.shape[2]
+    difference = np.empty((stack.shape[1], stack.shape[2] - 2), dtype=np.float32)
+
+    def horizontal_difference(image, buffer):
+        return np.subtract(image[:, 2:], image[:, :-2], out=difference)
+    return _filtered(stack, lambda d: _sum_of_squares(d) / n, horizontal_difference)
+
+
+def tenengrad(stack):
+    n = stack.shape[1] * stack.shape[2]
+    gy = np.empty(stack.shape[1:], dtype=np.float32)
+
+    def gradient_squared(image, buffer):
+        cv2.Sobel(image, cv2.CV_32F, 1, 0, dst=buffer)
+        cv2.Sobel(image, cv2.CV_32F, 0, 1, dst=gy)
+        return buffer
+
+    return _filtered(stack, lambda gx: (_sum_of_squares(gx) + _sum_of_squares(gy)) / n, gradient_squared)
+
+
+def normalised_variance(stack):
+    n = stack.shape[1] * stack.shape[2]
+
+    def statistic(image):
+        mean = np.sum(image, dtype=np.float64) / n
+        return (_sum_of_squares(image) / n - mean**2) / (mean if mean != 0 else 1)
+    return _filtered(stack, statistic, lambda image, buffer: image)
+
+
+METRICS = {'laplacian_variance': laplacian_variance,
+           'squared_laplacian': squared_laplacian,
+           'brenner': brenner,
+           'tenengrad': tenengrad,
+           'normalised_variance': normalised_variance}
+
+
+def merit(images, metric='laplacian_variance', roi=None, binning=1, channel_weights=None):
+    """Evaluate a focus merit function on an image, or on each image of a stack.
+
+    :param images: array of shape (H, W), (H, W, 3), (N, H, W) or (N, H, W, 3)
+    :param metric: str (one of METRICS) or a function taking a float32 (N, h, w) stack and returning N values
+    :param roi: a tuple of two slices (rows, columns), see `centred_roi`
+    :param binning: int. Average blocks of binning x binning pixels together first
+    :param channel_weights: weight of each colour channel when converting colour images to grayscale, see `prepare`
+    :return: a float for a single image, or an array with one value per image for a stack
+    """
+    function = METRICS[metric] if metric in METRICS else metric
+    single = np.ndim(images) == 2 or (np.ndim(images) == 3 and np.shape(images)[2] == 3)
+    values = function(prepare(images, roi, binning, channel_weights))
+    return float(values[0]) if single else values
+
+
+def benchmark(shape=(16, 1024, 1280), colour=True, binnings=(1, 2, 4), repeats=3):
+    """Print the time taken by each metric, per image, on a random stack of uint8 images.
+
+    The "contrast" column is the ratio of the metric for a sharp image to the same image blurred (with a 5x5 box), as a
+    rough indication of how well each metric discriminates focus.
+
+    :return: dict of (metric, binning): (seconds per image, contrast)
+    """
+    from scipy import ndimage
+    rng = np.random.RandomState(0)
+    sharp = ndimage.gaussian_filter(rng.rand(*shape[1:]), 1.5)
+    sharp = ((sharp - sharp.min()) / (sharp.max() - sharp.min()) * 255).astype(np.uint8)
+    blurred = ndimage.uniform_filter(sharp, 5)
+    stack = np.repeat(sharp[np.newaxis], shape[0], axis=0)
+    if colour:
+        stack = np.repeat(stack[..., np.newaxis], 3, axis=3)
+        sharp, blurred = [np.repeat(im[..., np.newaxis], 3, axis=2) for im in (sharp, blurred)]
+    results = {}
+    print("{:>20} {:>8} {:>14} {:>10}".format("metric", "binning", "ms per image", "contrast"))
+    for name in sorted(METRICS):
+        for binning in binnings:
+            times = []
+            for i in range(repeats):
+                start = time.time()
+                merit(stack, name, binning=binning)
+                times.append((time.time() - start) / shape[0])
+            contrast = merit(sharp, name, binning=binning) / merit(blurred, name, binning=binning)
+            results[(name, binning)] = (min(times), contrast)
+            print("{:>20} {:>8} {:>14.2f} {:>10.1f}".format(name, binning, min(times) * 1e3, contrast))
+    return results
+
+
+if __name__ == '__main__':
+    benchmark()
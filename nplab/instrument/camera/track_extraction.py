@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Extraction of the spectra of several tracks (groups of rows, e.g. one per fibre or particle) from 2D CCD frames, as
+the Andor multi-track and random-track read modes do in hardware, but from image-mode frames - live or saved.
+
+A track is a range of detector rows, with an optional weight per row and an optional smile (curvature) correction:
+a polynomial giving how many rows the track is displaced by at each column, as the image of a straight slit is curved
+by the spectrograph. The weights of every track at every pixel are computed once, by TrackExtractor, so extracting
+the spectra of all the tracks from a stack of frames is a single matrix product, written into a preallocated array:
+
+>>> extractor = TrackExtractor([Track(10, 19), Track(40, 49, smile=[2e-5, 0, 0])], frame_shape=(256, 1024))
+>>> spectra = extractor.extract(frames)                          # (n_frames, 2, 1024), or (2, 1024) for one frame
+>>> extractor.extract(frames, out=spectra)                       # reusing the output
+>>> spectra = extractor.extract_dataset(datafile['kinetic_series'])  # reading an HDF5 dataset in chunks
+
+Frames may have been read out with a vertical ROI and binning (first_row and row_binning): tracks are always given in
+detector rows.
+"""
+from __future__ import division
+from builtins import range
+from builtins import object
+import numpy as np
+
+
+class Track(object):
+    def __init__(self, first_row, last_row, weights=None, smile=None, smile_centre=None):
+        """
+        :param first_row: first detector row of the track (0-based)
+        :param last_row: last detector row of the track, inclusive
+        :param weights: weight of each row of the track. Defaults to 1 for every row, i.e. summing them, as the
+            hardware read modes do. Use 1/n to average them
+        :param smile: coefficients of the polynomial (highest power first, as np.polyval) giving the displacement, in
+            rows, of the track at each column, as a function of the distance (in columns) from smile_centre. Rows
+            displaced by a fraction of a row are shared between neighbouring rows
+        :param smile_centre: column the smile is centred on. Defaults to the middle of the frame
+        """
+        assert last_row >= first_row, 'The last row of a track cannot be before its first'
+        self.first_row = first_row
+        self.last_row = last_row
+        if weights is None:
+            weights = np.ones(last_row - first_row + 1)
+        self.weights = np.asarray(weights, dtype=float)
+        assert len(self.weights) == last_row - first_row + 1, 'There should be one weight per row of the track'
+        self.smile = smile
+        self.smile_centre = smile_centre
+
+    def __repr__(self):
+        return 'Track(%d, %d%s)' % (self.first_row, self.last_row, '' if self.smile is None else ', smile=%s' %
+                                    list(self.smile))
+
+    def shifts(self, width):
+        """Displacement (in rows) of the track at each of width columns"""
+        if self.smile is None:
+            return np.zeros(width)
+        centre = (width - 1) / 2 if self.smile_centre is None else self.smile_centre
+        return np.polyval(self.smile, np.arange(width) - centre)
+
+    def pixel_weights(self, rows, width):
+        """
+        :param rows: detector rows (1D array)
+        :param width: number of columns
+        :return: (len(rows), width) array of the weight of each pixel in the track
+        """
+        # the weight profile is padded with zeros, so that a displaced row shares its weight with the next row out
+        grid = np.arange(self.first_row - 1, self.last_row + 2)
+        profile = np.concatenate([[0.], self.weights, [0.]])
+        return np.interp(np.asarray(rows)[:, np.newaxis] - self.shifts(width)[np.newaxis], grid, profile)
+
+
+def multi_tracks(number, height, offset, detector_height):
+    """
+    Tracks spread evenly over the detector, as the Andor MultiTrack read mode (SetMultiTrack) places them. Tracks
+    that would go past the edges of the detector are moved back onto it
+
+    :param number: number of tracks
+    :param height: height of each track, in rows
+    :param offset: shift of every track from their evenly-spread positions, in rows
+    :param detector_height: number of rows of the detector
+    :return: list of Track
+    """
+    spacing = detector_height / number
+    tracks = []
+    for index in range(number):
+        first = int(round((index + 0.5) * spacing - height / 2)) + offset
+        first = min(max(first, 0), detector_height - height)
+        tracks.append(Track(first, first + height - 1))
+    return tracks
+
+
+def random_tracks(pixels):
+    """
+    Tracks defined as in the Andor RandomTrack read mode (SetRandomTracks)
+
+    :param pixels: first and last row of each track, inclusive and 1-based: [first_1, last_1, first_2, last_2...]
+    :return: list of Track
+    """
+    assert not len(pixels) % 2, 'There should be a first and a last row for each track'
+    return [Track(first - 1, last - 1) for first, last in zip(pixels[::2], pixels[1::2])]
+
+
+class TrackExtractor(object):
+    def __init__(self, tracks, frame_shape, first_row=0, row_binning=1):
+        """
+        :param tracks: list of Track
+        :param frame_shape: (rows, columns) of the frames
+        :param first_row: detector row of the first row of the frames
+        :param row_binning: number of detector rows binned into each row of the frames. The weight of a binned row is
+            the mean of the weights of its detector rows
+        """
+        self.tracks = list(tracks)
+        self.frame_shape = tuple(frame_shape)
+        self.first_row = first_row
+        self.row_binning = row_binning
+        height, width = self.frame_shape
+        rows = first_row + np.arange(height * row_binning)
+        weights = np.stack([track.pixel_weights(rows, width) for track in self.tracks])
+        if row_binning > 1:
+            weights = weights.reshape((len(self.tracks), height, row_binning, width)).mean(axis=2)
+        # only the band of rows some track covers is read from the frames
+        used = np.nonzero(np.any(weights != 0, axis=(0, 2)))[0]
+        self._rows = slice(used[0], used[-1] + 1) if len(used) else slice(0, 0)
+        weights = weights[:, self._rows]
+        self.smile = any(track.smile is not None for track in self.tracks)
+        if self.smile:
+            self._weights = np.ascontiguousarray(weights.transpose(2, 0, 1))  # (columns, tracks, rows)
+        else:
+            self._weights = np.ascontiguousarray(weights[..., 0])  # the same for every column: (tracks, rows)
+
+    def matches(self, tracks, frame_shape, first_row=0, row_binning=1):
+        """Whether this extractor is the one that would be made with these arguments, so it can be reused"""
+        return (len(self.tracks) == len(tracks) and all(a is b for a, b in zip(self.tracks, tracks)) and
+                self.frame_shape == tuple(frame_shape) and (self.first_row, self.row_binning) == (first_row, row_binning))
+
+    @property
+    def output_shape(self):
+        """(tracks, columns): the shape of the spectra extracted from each frame"""
+        return len(self.tracks), self.frame_shape[1]
+
+    def empty(self, n_frames=None):
+        """An output array for the spectra of n_frames frames (or of a single frame if None), to reuse with extract"""
+        if n_frames is None:
+            return np.empty(self.output_shape)
+        return np.empty((n_frames, ) + self.output_shape)
+
+    def extract(self, frames, out=None):
+        """
+        The spectrum of every track, in every frame
+
+        :param frames: (rows, columns) frame, or (n_frames, rows, columns) stack of frames
+        :param out: float array to write the spectra into, e.g. made by empty. Allocated if None
+        :return: (tracks, columns) for a frame, (n_frames, tracks, columns) for a stack
+        """
+        frames = np.asarray(frames)
+        single = frames.ndim == 2
+        if out is None:
+            out = self.empty(None if single else len(frames))
+        if single:
+            frames, stack_out = frames[np.newaxis], out[np.newaxis]
+        else:
+            stack_out = out
+        assert frames.shape[1:] == self.frame_shape, \
+            'Expected frames of shape %s, not %s' % (self.frame_shape, frames.shape[1:])
+        band = frames[:, self._rows]
+        if self.smile:
+            np.einsum('xtr,nrx->ntx', self._weights, band, out=stack_out)
+        else:
+            np.matmul(self._weights, band, out=stack_out)
+        return out
+
+    def extract_dataset(self, dataset, chunk_size=64, out=None):
+        """
+        The spectra of every track in a stack of frames too big to load at once, e.g. an HDF5 dataset, read chunk_size
+        frames at a time into the same buffer
+
+        :param dataset: (n_frames, rows, columns) array-like, indexable along its first axis
+        :param chunk_size: number of frames read at a time
+        :param out: array to write the spectra into, as for extract
+        :return: (n_frames, tracks, columns)
+        """
+        n_frames = len(dataset)
+        if out is None:
+            out = self.empty(n_frames)
+        buffer = np.empty((min(chunk_size, n_frames), ) + self.frame_shape, dtype=dataset.dtype)
+        for start in range(0, n_frames, chunk_size):
+            stop = min(start + chunk_size, n_frames)
+            chunk = buffer[:stop - start]
+            if hasattr(dataset, 'read_direct'):  # h5py
+                dataset.read_direct(chunk, np.s_[start:stop])
+            else:
+                chunk[...] = dataset[start:stop]
+            self.extract(chunk, out=out[start:stop])
+        return out
@@ -7,75 +7,29 @@ from nplab.instrument import Instrument
 import pyqtgraph.dockarea as dockarea
 import numpy as np
 import os
-import math
+import time
+from collections import deque
 from . import gui
 from . import pattern_generators
+from .pattern_generators import zernike_polynomial
+from .phase_compiler import PhaseCompiler
 from scipy.interpolate import interp1d
 
 
-def zernike_polynomial(array_size, n, m, beam_size=1, unit_circle=True):
-    """
-    Creates an image of a Zernike polynomial of order n,m (https://en.wikipedia.org/wiki/Zernike_polynomials)
-    Keep in mind that they are technically only defined inside the unit circle, but the output of this function is a
-    square, so the corners are wrong.
-
-    :param array_size: int
-    :param n: int
-    :param m: int
-    :param beam_size: float
-    :param unit_circle: bool
-    :return:
-    """
-    assert n >= 0
-    if m < 0:
-        odd = True
-        m = np.abs(m)
-    else:
-        odd = False
-    assert n >= m
-
-    if type(array_size) == int:
-        array_size = (array_size, array_size)
-    im_rat = array_size[1]/array_size[0]
-    if im_rat >= 1:
-        _x = np.linspace(-im_rat, im_rat, array_size[1])
-        _y = np.linspace(-1, 1, array_size[0])
-    else:
-        _x = np.linspace(-1, 1, array_size[1])
-        _y = np.linspace(-1/im_rat, 1/im_rat, array_size[0])
-    x, y = np.meshgrid(_x, _y)
-    # By normalising the radius to the beamsize, we can make Zernike polynomials of different sizes
-    rho = old_div(np.sqrt(x**2 + y**2), beam_size)
-    phi = np.arctan2(x, y)
-
-    summ = []
-    for k in range(1 + old_div((n - m), 2)):
-        summ += [old_div(((-1)**k * math.factorial(n - k) * (rho**(n-2*k))),
-                 (math.factorial(k) * math.factorial(old_div((n+m), 2) - k) * math.factorial(old_div((n-m), 2) - k)))]
-    r = np.sum(summ, 0)
-    if (n-m) % 2:
-        r = 0
-
-    # Limiting the polynomial to the unit circle, where it is defined:
-    if unit_circle:
-        r[rho > 1] = 0
-
-    if odd:
-        zernike = r * np.sin(m * phi)
-    else:
-        zernike = r * np.cos(m * phi)
-
-    normalised = zernike / np.sqrt(np.sum(zernike[rho < 1] * zernike[rho < 1]))
-    return normalised
-
-
 class SlmDisplay(QtWidgets.QWidget):
     """Widget for displaying the greyscale holograms on the SLM
-    It is simply a plain window with a QImage + QLabel.setPixmap combination for displaying phase arrays
+
+    It is a plain window that paints a persistent QImage, which wraps a numpy buffer holding the grey levels. The LUT
+    is precomputed into a lookup table over the phase, so converting a phase array into grey levels is a single
+    vectorised indexing step, and frames identical to the one on display are not re-uploaded.
+
+    The time between set_image being called and the frame being painted is kept in self.latencies (see
+    latency_statistics). This does not include the monitor's own refresh and the SLM's liquid-crystal response.
     """
-    update_image = QtCore.Signal(np.ndarray)
+    update_image = QtCore.Signal(np.ndarray, float)
 
-    def __init__(self, shape=(1000, 1000), resolution=(1, 1), bitness=8, hide_border=True, lut=None):
+    def __init__(self, shape=(1000, 1000), resolution=(1, 1), bitness=8, hide_border=True, lut=None,
+                 lut_resolution=None):
         """
         :param shape: 2-tuple of int. Width and height of the SLM panel in pixels
         :param resolution:
@@ -83,17 +37,30 @@ class SlmDisplay(QtWidgets.QWidget):
         :param hide_border: bool. Whether to show the standard window border in your OS. Set to False only for debugging
         :param lut: tuple. Parameters passed to set_lut. The default LUT assumes that the phase goes from 0 to 2 pi, and
         we want to display it from 0 to 256
+        :param lut_resolution: int. Power of two. Number of phase values tabulated in the lookup table. The default
+        (2**16) keeps the quantisation well below one grey level
         """
         super(SlmDisplay, self).__init__()
 
         self._pixels = [int(old_div(x[0], x[1])) for x in zip(shape, resolution)]
         self._bitness = bitness
+        if self._bitness != 8:
+            raise ValueError('Bitness %g is not implemented' % self._bitness)
+        if lut_resolution is None:
+            lut_resolution = 2 ** 16
+        assert lut_resolution & (lut_resolution - 1) == 0, 'lut_resolution needs to be a power of two'
+        self._lut_resolution = lut_resolution
 
+        self._buffer = None
         self._QImage = None
-        self._QLabel = None
+        self._requested_time = None
+        self.latencies = deque(maxlen=100)
+        self.frames_displayed = 0
+        self.frames_skipped = 0
         self._make_gui(hide_border)
 
         self.LUT = None
+        self._lut_table = None
         if lut is None:
             lut = (2**self._bitness, 0)
         self.set_lut(lut)
@@ -101,16 +68,12 @@ class SlmDisplay(QtWidgets.QWidget):
         self.update_image.connect(self._set_image, type=QtCore.Qt.QueuedConnection)
 
     def _make_gui(self, hide_border=True):
-        """Creates and sets the widget layout
+        """Sets the widget size and window flags
         :param hide_border: bool. See __init__
         :return:
         """
-        self._QLabel = QtWidgets.QLabel(self)
-
-        layout = QtWidgets.QHBoxLayout(self)
-        layout.setContentsMargins(0, 0, 0, 0)
-        layout.addWidget(self._QLabel)
-        self.setLayout(layout)
+        self.resize(*self._pixels)
+        self.setAttribute(QtCore.Qt.WA_OpaquePaintEvent)
 
         self.setWindowTitle('SLM Phase')
         if hide_border:
@@ -130,15 +93,36 @@ class SlmDisplay(QtWidgets.QWidget):
             gray_level = lut[1]
             self.LUT = interp1d(phase, gray_level)
 
+        # Tabulating the LUT at the centre of each phase bin, with the same offsets as phase_to_gray_level (going from
+        # -pi to pi). Going through int64 reproduces the wrapping of casting the LUT output directly into uint8
+        phases = (np.arange(self._lut_resolution) + 0.5) * 2 * np.pi / self._lut_resolution
+        phases -= 0.1*np.pi / 2 ** self._bitness + np.pi
+        if isinstance(self.LUT, interp1d):
+            phases = np.clip(phases, np.min(self.LUT.x), np.max(self.LUT.x))
+        self._lut_table = np.asarray(self.LUT(phases)).astype(np.int64).astype(np.uint8)
+
+    def phase_to_gray_level(self, phase):
+        """Wraps the phase into [0, 2 pi) and transforms it into SLM display values using the tabulated LUT
+
+        :param phase: 2D array
+        :return: 2D uint8 array
+        """
+        # Small offset removes floating point errors of phases that should be exact multiples of 2 pi
+        indices = np.floor((phase + 0.1*np.pi / 2 ** self._bitness) * (self._lut_resolution / (2 * np.pi)))
+        indices = np.bitwise_and(indices.astype(np.int64), self._lut_resolution - 1)
+        return self._lut_table[indices]
+
     def set_image(self, phase, slm_monitor=None):
-        # Makes phase go from 0 to 2*pi, and removes floating point errors
-        phase = (phase + 0.1*np.pi / 2 ** self._bitness) % (2 * np.pi) - 0.1*np.pi / 2 ** self._bitness
-        # Makes phase go from -pi to pi
-        phase -= np.pi
-        # Transform into SLM display values
-        phase = self.LUT(phase)
+        """Displays a phase array, which can be called from any thread
 
-        self.update_image.emit(phase)
+        :param phase: 2D array of phases (in radians)
+        :param slm_monitor: int. Optional. If given, it will move the SLM widget to the specified monitor
+        :return: 2D array of the grey levels sent to the SLM
+        """
+        requested_time = time.perf_counter()
+        gray_levels = self.phase_to_gray_level(phase)
+
+        self.update_image.emit(gray_levels, requested_time)
 
         if slm_monitor is not None:
             app = get_qt_app()
@@ -147,23 +131,52 @@ class SlmDisplay(QtWidgets.QWidget):
             assert isinstance(slm_monitor, int)
             assert desktop.screenCount() > slm_monitor >= 0
             self.move(slm_screen.x(), slm_screen.y())
-        return phase
+        return gray_levels
 
-    def _set_image(self, phase):
-        """Sets an array on the QLabel.Pixmap
+    def _set_image(self, gray_levels, requested_time):
+        """Copies the grey levels into the persistent image buffer and schedules a repaint, unless nothing changed
 
-        :param phase: np.array from 0 to 2 pi
-        :param slm_monitor: int. Optional. If given, it will move the SLM widget to the specified monitor
+        :param gray_levels: 2D uint8 array
+        :param requested_time: float. time.perf_counter() when set_image was called
         :return:
         """
-        img = phase.ravel()
-
-        if self._bitness == 8:
-            self._QImage = QtGui.QImage(img.astype(np.uint8), phase.shape[1], phase.shape[0], QtGui.QImage.Format_Grayscale8)
+        if self._buffer is not None and self._buffer.shape == gray_levels.shape:
+            if np.array_equal(self._buffer, gray_levels):
+                self.frames_skipped += 1
+                return
+            np.copyto(self._buffer, gray_levels)
         else:
-            raise ValueError('Bitness %g is not implemented' % self._bitness)
-
-        self._QLabel.setPixmap(QtGui.QPixmap(self._QImage))
+            # A copy, as gray_levels is the array set_image returned, which the caller may keep or change
+            self._buffer = np.array(gray_levels, dtype=np.uint8, order='C', copy=True)
+            height, width = self._buffer.shape
+            # The QImage does not copy the data, so self._buffer needs to be kept alive (and not reallocated)
+            self._QImage = QtGui.QImage(self._buffer.data, width, height, self._buffer.strides[0],
+                                        QtGui.QImage.Format_Grayscale8)
+        self._requested_time = requested_time
+        self.update()
+
+    def paintEvent(self, event):
+        if self._QImage is None:
+            return
+        painter = QtGui.QPainter()
+        painter.begin(self)
+        painter.drawImage(0, 0, self._QImage)
+        painter.end()
+        if self._requested_time is not None:
+            self.latencies.append(time.perf_counter() - self._requested_time)
+            self._requested_time = None
+            self.frames_displayed += 1
+
+    def latency_statistics(self):
+        """Summary of the time (in seconds) between set_image and the frame being painted, over the last 100 frames
+
+        :return: dict
+        """
+        latencies = np.array(self.latencies)
+        if len(latencies) == 0:
+            return dict(frames_displayed=self.frames_displayed, frames_skipped=self.frames_skipped)
+        return dict(mean=np.mean(latencies), median=np.median(latencies), max=np.max(latencies),
+                    frames_displayed=self.frames_displayed, frames_skipped=self.frames_skipped)
 
 
 class Slm(Instrument):
@@ -192,6 +205,7 @@ class Slm(Instrument):
             self._correction = correction_phase
 
         self.phase = None
+        self._compiler = PhaseCompiler(self._shape[::-1])
         self.Display = None
         if display_kwargs is None:
             self.display_kwargs = dict()
@@ -216,7 +230,8 @@ class Slm(Instrument):
         """Creates and returns the phase pattern
 
         Iterates over self.options, getting the correct pattern_generator by name and applying them sequentially to an
-        array initially full of zeros.
+        array initially full of zeros. The terms whose parameters have not changed since the last call are not
+        recomputed (see PhaseCompiler).
 
         :param parameters: dict. Keys correspond to the self.options keys, values are the arguments to be passed to the
         pattern_generators as unnamed arguments
@@ -227,7 +242,7 @@ class Slm(Instrument):
         for option in self.options:
             self._logger.debug('Making phase: %s' % option)
             try:
-                self.phase = getattr(pattern_generators, option)(self.phase, *parameters[option])
+                self.phase = self._compiler.apply(option, self.phase, parameters[option])
             except Exception as e:
                 self._logger.warn('Failed because: %s' % e)
         self._logger.debug('Finished making phases')
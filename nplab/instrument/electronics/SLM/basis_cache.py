@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-bounded cache for the arrays that phase patterns are built from (coordinate grids, Zernike polynomials...)
+
+These only depend on the SLM shape and a few geometric parameters (centre, beam size), so they can be computed once and
+reused every time a pattern is remade. The cached arrays are made read-only, since they are shared by every caller.
+"""
+from builtins import object
+from collections import OrderedDict
+import threading
+import numpy as np
+
+
+class BasisCache(object):
+    """Least-recently-used cache of numpy arrays, bounded by the total number of bytes stored"""
+
+    def __init__(self, max_bytes=512 * 2**20):
+        """
+        :param max_bytes: int. Once the cached arrays take more than this, the least recently used ones are dropped
+        """
+        self.max_bytes = max_bytes
+        self._arrays = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def nbytes(self):
+        return sum(_nbytes(value) for value in self._arrays.values())
+
+    def get(self, key, function, *args, **kwargs):
+        """Returns the cached value for key, calling function(*args, **kwargs) to create it if needed
+
+        :param key: hashable. Should contain everything the array depends on (e.g. the SLM shape)
+        :param function: callable returning an array, or a tuple of arrays
+        :return: read-only array (or tuple of read-only arrays)
+        """
+        with self._lock:
+            if key in self._arrays:
+                self._arrays.move_to_end(key)
+                self.hits += 1
+                return self._arrays[key]
+        value = function(*args, **kwargs)
+        if isinstance(value, tuple):
+            value = tuple(_read_only(v) for v in value)
+        else:
+            value = _read_only(value)
+        with self._lock:
+            self.misses += 1
+            self._arrays[key] = value
+            size = self.nbytes
+            while size > self.max_bytes and len(self._arrays) > 1:
+                _, dropped = self._arrays.popitem(last=False)
+                size -= _nbytes(dropped)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._arrays = OrderedDict()
+
+
+def _read_only(array):
+    array = np.asarray(array)
+    array.flags.writeable = False
+    return array
+
+
+def _nbytes(value):
+    if isinstance(value, tuple):
+        return sum(v.nbytes for v in value)
+    return value.nbytes
+
+
+basis_cache = BasisCache()
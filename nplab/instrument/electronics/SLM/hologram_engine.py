@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Iterative Fourier transform hologram engine
+
+The functions in pattern_generators (mraf, gerchberg_saxton) are convenient one-off calls, but when sweeping many spot
+patterns most of their time goes into rebuilding meshgrids, masks and FFT set-up for an SLM shape that never changes.
+HologramEngine keeps all of that per-shape state alive between calls:
+    - coordinate grids and signal-region masks are cached per SLM shape (and per signal region size)
+    - FFTs go through a plan cache, using pyfftw plans when available, scipy.fft with worker threads otherwise, and
+      falling back to numpy.fft
+    - targets can be batched, i.e. a (N, height, width) stack of target intensities is solved in one go
+    - iterations can stop early once a convergence metric stops improving
+"""
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+from builtins import object
+import collections
+import functools
+import os
+import time
+import numpy as np
+
+try:
+    import pyfftw
+    import pyfftw.builders
+except ImportError:
+    pyfftw = None
+try:
+    import scipy.fft as scipy_fft  # only available from scipy 1.4
+except ImportError:
+    scipy_fft = None
+
+
+def _phasor(field):
+    """Equivalent to np.exp(1j * np.angle(field)), but avoids the (much slower) trigonometric functions"""
+    amplitude = np.abs(field)
+    zeros = amplitude == 0
+    amplitude[zeros] = 1
+    phasor = field / amplitude
+    phasor[zeros] = 1
+    return phasor
+
+
+class FFTPlanCache(object):
+    """Reusable 2D FFTs over the last two axes of an array, keyed by the array shape and dtype
+
+    With pyfftw, the planned FFTW objects are kept and re-executed on new data. Note that in this case the returned
+    array is the plan's internal output buffer, so it is overwritten by the next call to the same plan.
+    """
+    def __init__(self, threads=None, planner_effort='FFTW_MEASURE'):
+        """
+        :param threads: int. Number of threads to use for each transform. Defaults to the number of CPUs
+        :param planner_effort: str. Passed to pyfftw when building plans
+        """
+        if threads is None:
+            threads = os.cpu_count() or 1
+        self.threads = threads
+        self.planner_effort = planner_effort
+        self._plans = dict()
+
+    @property
+    def backend(self):
+        if pyfftw is not None:
+            return 'pyfftw'
+        elif scipy_fft is not None:
+            return 'scipy'
+        else:
+            return 'numpy'
+
+    def _get_plan(self, kind, array):
+        key = (kind, array.shape, array.dtype.str)
+        if key not in self._plans:
+            if pyfftw is not None:
+                builder = getattr(pyfftw.builders, kind)
+                self._plans[key] = builder(pyfftw.empty_aligned(array.shape, array.dtype), axes=(-2, -1),
+                                           threads=self.threads, planner_effort=self.planner_effort)
+            elif scipy_fft is not None:
+                self._plans[key] = functools.partial(getattr(scipy_fft, kind), axes=(-2, -1), workers=self.threads)
+            else:
+                self._plans[key] = functools.partial(getattr(np.fft, kind), axes=(-2, -1))
+        return self._plans[key]
+
+    def fft2(self, array):
+        return self._get_plan('fft2', array)(array)
+
+    def ifft2(self, array):
+        return self._get_plan('ifft2', array)(array)
+
+    def clear(self):
+        self._plans = dict()
+
+
+class HologramEngine(object):
+    """Gerchberg-Saxton and MRAF hologram calculations for a fixed SLM shape
+
+    All the methods accept either a single 2D target intensity, or a 3D stack of targets (N, height, width), in which
+    case the returned phase is also a 3D stack. The returned phases do not include any original_phase, they are what
+    the iterative algorithm found (see pattern_generators.mraf and pattern_generators.gerchberg_saxton).
+
+    After every call, self.iterations_run holds the number of iterations performed and self.convergence the value of
+    the convergence metric at each iteration (only computed if a tolerance was given).
+    """
+    def __init__(self, shape, threads=None, dtype=np.complex128):
+        """
+        :param shape: 2-tuple of int. Number of rows and columns of the SLM (i.e. the shape of the phase arrays)
+        :param threads: int. Number of threads used for the FFTs. See FFTPlanCache
+        :param dtype: complex dtype used for the fields. np.complex64 roughly halves memory and time, at the cost of
+                      precision
+        """
+        self.shape = tuple(int(s) for s in shape)
+        self.dtype = np.dtype(dtype)
+        self.real_dtype = np.finfo(self.dtype).dtype
+        self.fft = FFTPlanCache(threads)
+        self._grids = None
+        self._masks = dict()
+        self._input_fields = dict()
+        self.iterations_run = 0
+        self.convergence = []
+
+    @property
+    def grids(self):
+        """Centered pixel coordinates, following the same convention as the original mraf implementation"""
+        if self._grids is None:
+            x = np.arange(-self.shape[1] // 2, self.shape[1] // 2)
+            y = np.arange(-self.shape[0] // 2, self.shape[0] // 2)
+            self._grids = np.meshgrid(x, y)
+        return self._grids
+
+    def signal_mask(self, signal_region_size):
+        """Boolean circular mask of the MRAF signal region, cached per signal_region_size
+
+        :param signal_region_size: float. Radius of the signal region, as a fraction of the smallest SLM dimension
+        :return: 2D boolean array
+        """
+        if signal_region_size not in self._masks:
+            x, y = self.grids
+            self._masks[signal_region_size] = (x**2 + y**2) < (signal_region_size * np.min(self.shape))**2
+        return self._masks[signal_region_size]
+
+    def default_input_field(self, signal_region_size):
+        """Initial field that focuses a uniform SLM illumination onto the signal region (normalised to unit power)"""
+        if signal_region_size not in self._input_fields:
+            x, y = self.grids
+            input_phase = ((x ** 2 / (self.shape[1] / (signal_region_size * 2 * np.sqrt(2)))) +
+                           (y ** 2 / (self.shape[0] / (signal_region_size * 2 * np.sqrt(2)))))
+            input_field = np.exp(1j * input_phase)
+            input_field /= np.sqrt(np.sum(np.abs(input_field)**2))
+            self._input_fields[signal_region_size] = input_field.astype(self.dtype)
+        return self._input_fields[signal_region_size]
+
+    def _check_target(self, target_intensity):
+        target_intensity = np.asarray(target_intensity, dtype=self.real_dtype)
+        assert target_intensity.shape[-2:] == self.shape, \
+            'Target shape %s does not match the engine shape %s' % (target_intensity.shape, self.shape)
+        assert target_intensity.ndim in [2, 3], 'Targets need to be a 2D array or a 3D stack of 2D arrays'
+        return target_intensity
+
+    def _converged(self, error, tolerance):
+        """Keeps track of the convergence metric, returns True once every target has stopped improving"""
+        self.convergence += [error]
+        if len(self.convergence) < 2:
+            return False
+        return np.all(np.abs(self.convergence[-2] - error) < tolerance)
+
+    def gerchberg_saxton(self, target_intensity, input_field=None, iterations=30, tolerance=None):
+        """Gerchberg Saxton algorithm for continuous patterns
+
+        :param target_intensity: 2D array, or 3D stack of targets
+        :param input_field: complex array broadcastable to the targets. Defaults to a flat, uniform illumination
+        :param iterations: int. Maximum number of iterations
+        :param tolerance: float. If given, stops iterating once the mean absolute difference between the (normalised)
+                          target and output intensities changes by less than this between iterations
+        :return: array of phases, same shape as target_intensity
+        """
+        assert iterations > 0
+        target_intensity = self._check_target(target_intensity)
+        # this matrix is only used in the Fourier plane
+        target_amplitude = np.sqrt(np.fft.fftshift(target_intensity, axes=(-2, -1)))
+        if tolerance is not None:
+            normalised_target = target_amplitude**2 / np.sum(target_amplitude**2, (-2, -1), keepdims=True)
+        if input_field is None:
+            input_amplitude = np.ones(self.shape, self.real_dtype)
+            input_field = np.ones(target_intensity.shape, self.dtype)
+        else:
+            input_amplitude = np.abs(input_field)
+            input_field = np.broadcast_to(input_field, target_intensity.shape).astype(self.dtype)
+
+        self.convergence = []
+        for iteration in range(iterations):
+            self.iterations_run = iteration + 1
+            output_field = self.fft.fft2(input_field)  # don't have to normalise since the intensities are replaced
+            if tolerance is not None:
+                output_intensity = np.abs(output_field)**2
+                output_intensity /= np.sum(output_intensity, (-2, -1), keepdims=True)
+                error = np.mean(np.abs(output_intensity - normalised_target), (-2, -1))
+            output_field = target_amplitude * _phasor(output_field)
+
+            input_phasor = _phasor(self.fft.ifft2(output_field))
+            input_field = input_amplitude * input_phasor
+            if tolerance is not None and self._converged(error, tolerance):
+                break
+        return np.angle(input_phasor)
+
+    def mraf(self, target_intensity, input_field=None, mixing_ratio=0.4, signal_region_size=0.5, iterations=30,
+             tolerance=None):
+        """Mixed-Region Amplitude Freedom algorithm for continuous patterns https://doi.org/10.1364/OE.16.002176
+
+        :param target_intensity: 2D array, or 3D stack of targets
+        :param input_field: complex array broadcastable to the targets. Defaults to default_input_field
+        :param mixing_ratio: float. Fraction of the power sent into the signal region
+        :param signal_region_size: float. Radius of the signal region, as a fraction of the smallest SLM dimension
+        :param iterations: int. Maximum number of iterations
+        :param tolerance: float. If given, stops iterating once the mean absolute difference between the target and
+                          the output intensity in the signal region changes by less than this between iterations
+        :return: array of phases, same shape as target_intensity
+        """
+        assert iterations > 0
+        target_intensity = self._check_target(target_intensity)
+        if input_field is None:
+            input_field = self.default_input_field(signal_region_size)
+        else:
+            # Normalising the input field and target intensity to 1 (doesn't have to be 1, but they have to be equal)
+            input_field = input_field / np.sqrt(np.sum(np.abs(input_field)**2, (-2, -1), keepdims=True))
+        target_intensity = target_intensity / np.sum(target_intensity, (-2, -1), keepdims=True)
+        input_amplitude = np.abs(input_field)
+        input_field = np.broadcast_to(input_field, target_intensity.shape).astype(self.dtype)
+
+        # Instead of shifting the output field back and forth every iteration, the (fixed) regions are shifted once
+        mask = np.fft.ifftshift(self.signal_mask(signal_region_size))
+        signal_amplitude = mixing_ratio * mask * np.sqrt(np.fft.ifftshift(target_intensity, axes=(-2, -1)))
+        noise_region = ((1 - mixing_ratio) * ~mask).astype(self.real_dtype)
+        if tolerance is not None:
+            shifted_target = mixing_ratio * np.fft.ifftshift(target_intensity, axes=(-2, -1))[..., mask]
+        # makes sure power out = power in, so that the distribution of power in signal and noise regions makes sense
+        normalisation = 1 / np.sqrt(np.prod(self.shape))
+
+        self.convergence = []
+        for iteration in range(iterations):
+            self.iterations_run = iteration + 1
+            output_field = self.fft.fft2(input_field) * normalisation
+            if tolerance is not None:
+                error = np.mean(np.abs(np.abs(output_field[..., mask])**2 - shifted_target), -1)
+            mixed_field = signal_amplitude * _phasor(output_field) + noise_region * output_field
+
+            input_phasor = _phasor(self.fft.ifft2(mixed_field))
+            input_field = input_amplitude * input_phasor
+            if tolerance is not None and self._converged(error, tolerance):
+                break
+        return np.angle(input_phasor)
+
+
+_engines = collections.OrderedDict()
+MAX_ENGINES = 4  # each engine keeps full-size grids, fields and FFT plans, so only the most recent shapes are kept
+
+
+def get_engine(shape):
+    """Returns a shared HologramEngine for the given SLM shape, creating it if necessary
+
+    Up to MAX_ENGINES engines are kept; beyond that, the least recently used one is dropped.
+    """
+    shape = tuple(int(s) for s in shape)
+    if shape in _engines:
+        engine = _engines.pop(shape)
+    else:
+        engine = HologramEngine(shape)
+        while len(_engines) >= MAX_ENGINES:
+            _engines.popitem(last=False)
+    _engines[shape] = engine
+    return engine
+
+
+def benchmark(shape=(1152, 1920), n_targets=8, iterations=30, repeats=3):
+    """Compares the time taken by the engine when nothing is reused between targets with the time it takes when it is
+
+    Uses random spot patterns as targets, solved:
+        - new_engine: one at a time, each by a new HologramEngine, so grids, masks and FFT plans are rebuilt for every
+          target (as they were by every call to pattern_generators before it used the engine)
+        - shared_engine: one at a time by the same HologramEngine
+        - batched: all at once by the same HologramEngine, also with complex64 fields
+    Prints and returns a dictionary of the average time (in seconds) per target.
+
+    :param shape: 2-tuple. Defaults to a 1920x1152 SLM
+    :param n_targets: int. Number of targets in the batch
+    :param iterations: int
+    :param repeats: int
+    :return: dict
+    """
+    targets = np.zeros((n_targets, ) + tuple(shape))
+    for target in targets:
+        spots = np.random.randint(0, min(shape) // 4, (10, 2)) - min(shape) // 8
+        target[spots[:, 0] + shape[0] // 2, spots[:, 1] + shape[1] // 2] = 1
+
+    def _time(function):
+        times = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            function()
+            times += [(time.perf_counter() - t0) / n_targets]
+        return np.min(times)
+
+    def unbatched(algorithm, engine=None):
+        for target in targets:
+            getattr(engine if engine is not None else HologramEngine(shape), algorithm)(target, iterations=iterations)
+
+    results = dict()
+    engine = HologramEngine(shape)
+    for algorithm in ['gerchberg_saxton', 'mraf']:
+        results[algorithm + '_new_engine'] = _time(lambda: unbatched(algorithm))
+        results[algorithm + '_shared_engine'] = _time(lambda: unbatched(algorithm, engine))
+        results[algorithm + '_batched'] = _time(lambda: getattr(engine, algorithm)(targets, iterations=iterations))
+        results[algorithm + '_batched_complex64'] = _time(
+            lambda: getattr(HologramEngine(shape, dtype=np.complex64), algorithm)(targets, iterations=iterations))
+    print('FFT backend: %s; shape: %s; %d targets; %d iterations' % (engine.fft.backend, shape, n_targets,
+                                                                   iterations))
+    for name, value in results.items():
+        print('%34s: %.3f s per target' % (name, value))
+    return results
+
+
+if __name__ == "__main__":
+    benchmark()
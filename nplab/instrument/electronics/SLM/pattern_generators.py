@@ -5,10 +5,13 @@ from builtins import zip
 from builtins import range
 from past.utils import old_div
 import numpy as np
+import math
 # import pyfftw
 from scipy import misc
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
+from .hologram_engine import get_engine
+from .basis_cache import basis_cache
 
 
 # TODO: performance quantifiers for IFT algorithms (smoothness, efficiency)
@@ -17,12 +20,20 @@ from matplotlib import gridspec
 
 def _get_coordinate_arrays(image, center=None):
     """Creates coordinate arrays in pixel units
+
+    The arrays are cached (see basis_cache) per shape and center, so they are read-only
     :param image: 2D array
     :param center: two-tuple of floats. If <1, assumes it's a relative center (with the edges of the SLM being at
                                         [-1, 1]. Otherwise, it should be in pixel units
     :return: two 2D arrays of coordinates
     """
     shape = np.shape(image)
+    if center is not None:
+        center = tuple(center)
+    return basis_cache.get(('coordinates', shape, center), _make_coordinate_arrays, shape, center)
+
+
+def _make_coordinate_arrays(shape, center=None):
     if center is None:
         center = [int(old_div(s, 2)) for s in shape]
     elif any(np.array(center) < 1):
@@ -32,6 +43,81 @@ def _get_coordinate_arrays(image, center=None):
     return x, y
 
 
+def _get_polar_arrays(image, center=None):
+    """Cached squared radius and azimuthal angle arrays, see _get_coordinate_arrays
+
+    :return: rho**2 and np.arctan2(y, x), both 2D arrays
+    """
+    x, y = _get_coordinate_arrays(image, center)
+    if center is not None:
+        center = tuple(center)
+    return basis_cache.get(('polar', np.shape(image), center), lambda: (x ** 2 + y ** 2, np.arctan2(y, x)))
+
+
+def zernike_polynomial(array_size, n, m, beam_size=1, unit_circle=True):
+    """
+    Creates an image of a Zernike polynomial of order n,m (https://en.wikipedia.org/wiki/Zernike_polynomials)
+    Keep in mind that they are technically only defined inside the unit circle, but the output of this function is a
+    square, so the corners are wrong.
+
+    The polynomials are cached (see basis_cache), so the returned array is read-only.
+
+    :param array_size: int
+    :param n: int
+    :param m: int
+    :param beam_size: float
+    :param unit_circle: bool
+    :return:
+    """
+    if type(array_size) == int:
+        array_size = (array_size, array_size)
+    array_size = tuple(array_size)
+    return basis_cache.get(('zernike', array_size, n, m, beam_size, unit_circle),
+                           _make_zernike_polynomial, array_size, n, m, beam_size, unit_circle)
+
+
+def _make_zernike_polynomial(array_size, n, m, beam_size=1, unit_circle=True):
+    assert n >= 0
+    if m < 0:
+        odd = True
+        m = np.abs(m)
+    else:
+        odd = False
+    assert n >= m
+
+    im_rat = array_size[1]/array_size[0]
+    if im_rat >= 1:
+        _x = np.linspace(-im_rat, im_rat, array_size[1])
+        _y = np.linspace(-1, 1, array_size[0])
+    else:
+        _x = np.linspace(-1, 1, array_size[1])
+        _y = np.linspace(-1/im_rat, 1/im_rat, array_size[0])
+    x, y = np.meshgrid(_x, _y)
+    # By normalising the radius to the beamsize, we can make Zernike polynomials of different sizes
+    rho = old_div(np.sqrt(x**2 + y**2), beam_size)
+    phi = np.arctan2(x, y)
+
+    summ = []
+    for k in range(1 + old_div((n - m), 2)):
+        summ += [old_div(((-1)**k * math.factorial(n - k) * (rho**(n-2*k))),
+                 (math.factorial(k) * math.factorial(old_div((n+m), 2) - k) * math.factorial(old_div((n-m), 2) - k)))]
+    r = np.sum(summ, 0)
+    if (n-m) % 2:
+        r = 0
+
+    # Limiting the polynomial to the unit circle, where it is defined:
+    if unit_circle:
+        r[rho > 1] = 0
+
+    if odd:
+        zernike = r * np.sin(m * phi)
+    else:
+        zernike = r * np.cos(m * phi)
+
+    normalised = zernike / np.sqrt(np.sum(zernike[rho < 1] * zernike[rho < 1]))
+    return normalised
+
+
 def constant(input_phase, offset):
     return input_phase + offset
 
@@ -87,7 +173,7 @@ def multispot_grating(input_phase, grating_const, n_spot, center=None):
     :return:
     """
     x, y = _get_coordinate_arrays(input_phase, center)
-    theta = np.arctan2(y, x) + np.pi
+    theta = _get_polar_arrays(input_phase, center)[1] + np.pi
 
     phase = np.zeros(x.shape)
     if n_spot > 1:
@@ -109,8 +195,8 @@ def focus(input_phase, curvature=0, center=None):
     :param center: two-tuple of floats. To be passed to _get_coordinate_arrays
     :return:
     """
-    x, y = _get_coordinate_arrays(input_phase, center)
-    phase = curvature * (x ** 2 + y ** 2)
+    rho2, _ = _get_polar_arrays(input_phase, center)
+    phase = curvature * rho2
     return input_phase + phase
 
 
@@ -124,17 +210,25 @@ def astigmatism(input_phase, amplitude=0, angle=0, center=None):
     :return:
     """
     x, y = _get_coordinate_arrays(input_phase, center)
-    rho = np.sqrt(x ** 2 + y ** 2)
-    phi = np.arctan2(x, y)
+    if center is not None:
+        center = tuple(center)
+    cos_term, sin_term = basis_cache.get(('astigmatism', np.shape(input_phase), center), _make_astigmatism_arrays,
+                                         x, y)
 
     horizontal = amplitude * np.cos(angle * np.pi / 180)
     diagonal = amplitude * np.sin(angle * np.pi / 180)
 
-    phase = (horizontal * np.cos(2 * phi) + diagonal * np.sin(2 * phi)) * rho ** 2
+    phase = horizontal * cos_term + diagonal * sin_term
 
     return input_phase + phase
 
 
+def _make_astigmatism_arrays(x, y):
+    rho = np.sqrt(x ** 2 + y ** 2)
+    phi = np.arctan2(x, y)
+    return np.cos(2 * phi) * rho ** 2, np.sin(2 * phi) * rho ** 2
+
+
 def vortexbeam(input_phase, order, angle, center=None):
     """Vortices
 
@@ -153,13 +247,34 @@ def vortexbeam(input_phase, order, angle, center=None):
     # x = np.arange(shape[1]) - center[1]
     # y = np.arange(shape[0]) - center[0]
     # x, y = np.meshgrid(x, y)
-    x, y = _get_coordinate_arrays(input_phase, center)
+    _, theta = _get_polar_arrays(input_phase, center)
 
-    phase = order * (np.angle(x + y * 1j) + angle * np.pi / 180.)
+    phase = order * (theta + angle * np.pi / 180.)
 
     return input_phase + phase
 
 
+def zernike(input_phase, coefficients, beam_size=1):
+    """Sum of Zernike polynomials, e.g. for aberration correction
+
+    Each polynomial is only computed once per shape and beam size (see zernike_polynomial), so changing the
+    coefficients only costs a weighted sum of cached arrays.
+
+    :param input_phase:
+    :param coefficients: dict of {(n, m): amplitude}, or iterable of (n, m, amplitude)
+    :param beam_size: float. See zernike_polynomial
+    :return:
+    """
+    if isinstance(coefficients, dict):
+        coefficients = [(n, m, amplitude) for (n, m), amplitude in coefficients.items()]
+    shape = np.shape(input_phase)
+    phase = np.zeros(shape)
+    for n, m, amplitude in coefficients:
+        if amplitude != 0:
+            phase += amplitude * zernike_polynomial(shape, n, m, beam_size)
+    return input_phase + phase
+
+
 def linear_lut(input_phase, contrast, offset):
     """
 
@@ -194,83 +309,43 @@ def direct_superposition(input_phase, k_vectors, phases=None):
     return input_phase + np.angle(np.fft.fftshift(np.fft.fft2(real_plane)))
 
 
-def mraf(original_phase, target_intensity, input_field=None, mixing_ratio=0.4, signal_region_size=0.5, iterations=30):
+def mraf(original_phase, target_intensity, input_field=None, mixing_ratio=0.4, signal_region_size=0.5, iterations=30,
+         tolerance=None):
     """Mixed-Region Amplitude Freedom algorithm for continuous patterns https://doi.org/10.1364/OE.16.002176
 
+    The calculation is done by the HologramEngine shared by all calls with the same SLM shape, so that the coordinate
+    grids, masks and FFT plans are only created once. target_intensity can also be a (N, height, width) stack of targets
+
     :param original_phase:
     :param target_intensity:
     :param input_field:
     :param mixing_ratio:
     :param signal_region_size:
     :param iterations:
+    :param tolerance: float. If given, stops iterating early once the algorithm has converged (see HologramEngine.mraf)
     :return:
     """
-    shp = target_intensity.shape
-    x, y = np.ogrid[old_div(-shp[1], 2):old_div(shp[1], 2), old_div(-shp[0], 2):old_div(shp[0], 2)]
-    x, y = np.meshgrid(x, y)
+    engine = get_engine(np.shape(target_intensity)[-2:])
+    return original_phase + engine.mraf(target_intensity, input_field, mixing_ratio, signal_region_size, iterations,
+                                        tolerance)
+
 
-    target_intensity = np.asarray(target_intensity, np.float)
-    if input_field is None:
-        # By default, the initial phase focuses a uniform SLM illumination onto the signal region
-        input_phase = ((old_div(x ** 2, (old_div(shp[1], (signal_region_size * 2 * np.sqrt(2)))))) +
-                       (old_div(y ** 2, (old_div(shp[0], (signal_region_size * 2 * np.sqrt(2)))))))
-        input_field = np.exp(1j * input_phase)
-    # Normalising the input field and target intensity to 1 (doesn't have to be 1, but they have to be equal)
-    input_field /= np.sqrt(np.sum(np.abs(input_field)**2))
-    target_intensity /= np.sum(target_intensity)
-
-    # This can leave the center of the SLM one or two pixels
-    mask = (x**2 + y**2) < (signal_region_size * np.min(shp))**2
-    signal_region = np.ones(shp) * mixing_ratio
-    signal_region[~mask] = 0
-    noise_region = np.ones(shp) * (1 - mixing_ratio)
-    noise_region[mask] = 0
-    input_intensity = np.abs(input_field)**2
-
-    for _ in range(iterations):
-        output_field = np.fft.fft2(input_field)
-        # makes sure power out = power in, so that the distribution of power in signal and noise regions makes sense
-        output_field = old_div(output_field, np.sqrt(np.prod(shp)))
-        output_field = np.fft.fftshift(output_field)
-        output_phase = np.angle(output_field)
-
-        mixed_field = signal_region * np.sqrt(target_intensity) * np.exp(1j * output_phase) + noise_region * output_field
-        mixed_field = np.fft.ifftshift(mixed_field)
-
-        input_field = np.fft.ifft2(mixed_field)
-        input_phase = np.angle(input_field)
-        input_field = np.sqrt(input_intensity) * np.exp(1j*input_phase)
-        # print(np.sum(np.abs(input_field)**2), np.sum(target_intensity), np.sum(np.abs(output_field)**2))
-    return original_phase + input_phase
-
-
-def gerchberg_saxton(original_phase, target_intensity, input_field=None, iterations=30):
+def gerchberg_saxton(original_phase, target_intensity, input_field=None, iterations=30, tolerance=None):
     """Gerchberg Saxton algorithm for continuous patterns
 
     Easiest version, where you don't need to keep track of FFT factors, normalising intensities, or FFT shifts since it
-    all gets discarded anyway.
+    all gets discarded anyway. Like mraf, it runs on the HologramEngine shared by all calls with the same SLM shape.
 
     :param original_phase:
     :param target_intensity:
     :param input_field:
     :param iterations:
+    :param tolerance: float. If given, stops iterating early once the algorithm has converged (see
+                      HologramEngine.gerchberg_saxton)
     :return:
     """
-    assert iterations > 0
-    shp = target_intensity.shape
-    target_intensity = np.fft.fftshift(target_intensity)  # this matrix is only used in the Fourier plane
-    if input_field is None:
-        input_field = np.ones(shp) * np.exp(1j * np.zeros(shp))
-    input_intensity = np.abs(input_field) ** 2
-    for _ in range(iterations):
-        output_field = np.fft.fft2(input_field)  # don't have to normalise since the intensities are replaced
-        output_phase = np.angle(output_field)
-        output_field = np.sqrt(target_intensity) * np.exp(1j * output_phase)
-
-        input_field = np.fft.ifft2(output_field)
-        input_phase = np.angle(input_field)
-        input_field = np.sqrt(input_intensity) * np.exp(1j * input_phase)
-    return original_phase + input_phase
+    engine = get_engine(np.shape(target_intensity)[-2:])
+    return original_phase + engine.gerchberg_saxton(target_intensity, input_field, iterations, tolerance)
 
 
 def test_ifft_smoothness(alg_func, *args, **kwargs):
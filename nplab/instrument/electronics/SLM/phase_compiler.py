@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental phase-pattern compiler used by Slm.make_phase
+
+Most pattern_generators simply add a term to the phase they are given (gratings, focus, astigmatism, zernike...).
+The compiler keeps the last term made by each of those, together with the parameters it was made with, so that when a
+single GUI slider moves only that term is recomputed and the rest of the pattern is a sum of cached arrays. Generators
+that transform the whole phase (e.g. linear_lut) are always re-applied, in the same order as before.
+"""
+from builtins import object
+from collections import Counter
+import copy
+import numpy as np
+from . import pattern_generators
+
+
+# Generators for which generator(phase, *args) == phase + generator(0, *args), and that are deterministic
+ADDITIVE_GENERATORS = ('constant', 'gratings', 'multispot_grating', 'focus', 'astigmatism', 'vortexbeam', 'zernike',
+                       'mraf', 'gerchberg_saxton')
+
+
+class PhaseCompiler(object):
+    def __init__(self, shape, additive_generators=ADDITIVE_GENERATORS):
+        """
+        :param shape: 2-tuple of int. Shape of the phase arrays (rows, columns)
+        :param additive_generators: iterable of str. Names of the pattern_generators whose terms can be cached
+        """
+        self.shape = tuple(shape)
+        self.additive_generators = additive_generators
+        self._terms = dict()
+        self.recompute_counts = Counter()  # number of times each term had to be recomputed
+
+    def apply(self, option, phase, parameters):
+        """Equivalent to getattr(pattern_generators, option)(phase, *parameters), reusing cached terms when possible
+
+        :param option: str. Name of a function in pattern_generators
+        :param phase: 2D array
+        :param parameters: iterable. Unnamed arguments for the pattern generator
+        :return: 2D array
+        """
+        generator = getattr(pattern_generators, option)
+        if option not in self.additive_generators:
+            return generator(phase, *parameters)
+        parameters = tuple(parameters)
+        if option in self._terms and _same_parameters(self._terms[option][0], parameters):
+            term = self._terms[option][1]
+        else:
+            term = generator(np.zeros(self.shape), *parameters)
+            # parameters are copied so that arrays modified in-place by the caller are still detected as changes
+            self._terms[option] = (copy.deepcopy(parameters), term)
+            self.recompute_counts[option] += 1
+        return phase + term
+
+    def compile(self, options, parameters):
+        """Applies all the options sequentially to an array initially full of zeros
+
+        :param options: list of str. See Slm.options
+        :param parameters: dict. Keys are the options, values the arguments passed to apply
+        :return: 2D array
+        """
+        phase = np.zeros(self.shape)
+        for option in options:
+            phase = self.apply(option, phase, parameters[option])
+        return phase
+
+    def invalidate(self, option=None):
+        """Forgets the cached term for option, or all of them if option is None"""
+        if option is None:
+            self._terms = dict()
+        else:
+            self._terms.pop(option, None)
+
+
+def _same_parameters(old, new):
+    """Compares two tuples of parameters, which can contain arrays and nested sequences/dictionaries"""
+    if isinstance(old, np.ndarray) or isinstance(new, np.ndarray):
+        return np.shape(old) == np.shape(new) and np.array_equal(old, new)
+    if isinstance(old, dict) and isinstance(new, dict):
+        return old.keys() == new.keys() and all(_same_parameters(old[key], new[key]) for key in old)
+    if isinstance(old, (tuple, list)) and isinstance(new, (tuple, list)):
+        return len(old) == len(new) and all(_same_parameters(o, n) for o, n in zip(old, new))
+    try:
+        return bool(old == new)
+    except Exception:
+        return False
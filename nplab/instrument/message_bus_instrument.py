@@ -14,9 +14,11 @@ from builtins import zip
 from builtins import map
 from builtins import object
 import re
+import math
 import nplab.instrument
 from functools import partial
 import threading
+import time
 import numpy as np
 import types
 
@@ -63,6 +65,7 @@ class MessageBusInstrument(nplab.instrument.Instrument):
     ignore_echo = False
 
     _communications_lock = None
+    _query_latencies = None
 
     @property
     def communications_lock(self):
@@ -96,6 +99,29 @@ class MessageBusInstrument(nplab.instrument.Instrument):
         with self.communications_lock:
             raise NotImplementedError("Subclasses of MessageBusInstrument must override the readline method!")
             
+    def read_binary_block(self, timeout=None):
+        """Read an IEEE 488.2 binary block (#<N><N-digit length><data>) from
+        the underlying bus, returning the data as bytes.  Must be overridden
+        by instruments that send binary data, e.g. oscilloscope traces."""
+        with self.communications_lock:
+            raise NotImplementedError("This instrument can't read binary blocks!")
+
+    def query_binary_block(self, query_string, dtype=None, timeout=None):
+        """
+        Write a string to the instrument and return the binary block it
+        replies with.
+
+        If dtype is given, the data are returned as a numpy array of that
+        type (e.g. '>i2' for big-endian 16-bit integers), otherwise as bytes.
+        """
+        with self.communications_lock:
+            self.flush_input_buffer()
+            self.write(query_string, timeout)
+            block = self.read_binary_block(timeout)
+        if dtype is not None:
+            return np.frombuffer(block, dtype=dtype)
+        return block
+
     def read_multiline(self, termination_line=None, timeout=None):
         """Read one line from the underlying bus.  Must be overriden.
 
@@ -135,6 +161,80 @@ class MessageBusInstrument(nplab.instrument.Instrument):
             else:
                 return self.readline(timeout).strip()  # question: should we strip the final newline?
 
+    def _write_batch(self, commands, delay=0):
+        """Write several commands back to back, waiting delay seconds between
+        each one.  Subclasses may override this to send them all in one go
+        when there's no delay."""
+        for i, command in enumerate(commands):
+            if i > 0 and delay > 0:
+                time.sleep(delay)
+            self._write(command)
+
+    def _read_reply(self, query_string, timeout=None):
+        """Read the reply to a command that has already been written"""
+        self._check_echo(query_string, timeout)
+        return self.readline(timeout).strip()
+
+    def batched_query(self, queries, timeout=None):
+        """
+        Perform several queries at once, returning a list of their responses.
+
+        All the queries are written back to back, and then their responses
+        are read in order, so the instrument can be working on one query while
+        the next is in transit, instead of each one waiting for the previous
+        reply.  The instrument must reply with one line to each query.
+        """
+        with self.communications_lock:
+            self.flush_input_buffer()
+            self._write_batch(queries)
+            return [self._read_reply(q, timeout) for q in queries]
+
+    def send_batch(self, commands, acknowledged=True, timeout=None, block=True, delay=0):
+        """
+        Write several commands back to back, e.g. a move for each axis of a
+        stage, and collect their acknowledgements.
+
+        If acknowledged is False, the commands are just written.  Otherwise
+        the instrument must reply with one line to each, and these are
+        returned as a list.  If block is False, a CommandBatch is returned
+        straight away instead, which collects the acknowledgements in a
+        background thread (the communications lock is held until they're all
+        in) - call its wait() method for the replies.
+
+        delay is the time to wait between writing one command and the next,
+        for instruments that can't take commands back to back.
+        """
+        if not acknowledged:
+            with self.communications_lock:
+                self._write_batch(commands, delay)
+            return []
+        batch = CommandBatch(self, commands, timeout, delay)
+        return batch.wait() if block else batch
+
+    def wait_until_all(self, queries, done, interval=0.01, timeout=None):
+        """
+        Poll several queries at once until every reply satisfies a condition.
+
+        This is meant for waiting for several axes to finish moving: the
+        status of every axis is queried in each round (with batched_query),
+        rather than waiting for one axis after another.
+
+        :param queries: list of query strings
+        :param done: function of a reply, returning True once it's the reply
+            we're waiting for
+        :param interval: seconds between polls
+        :param timeout: maximum seconds to wait, or None to wait for ever.
+        :return: the final replies
+        """
+        start = time.time()
+        while True:
+            replies = self.batched_query(queries)
+            if all(done(reply) for reply in replies):
+                return replies
+            if timeout is not None and time.time() - start > timeout:
+                raise IOError("Timed out waiting for replies to %s (last were %s)" % (queries, replies))
+            time.sleep(interval)
+
     def _check_echo(self, echo_string, timeout=None):
         if self.ignore_echo:
             echo_line = self.readline(timeout).strip()
@@ -180,48 +280,19 @@ class MessageBusInstrument(nplab.instrument.Instrument):
         automatically converted to integer or floating point, otherwise you
         must specify a parsing function (applied to all groups) or a list of
         parsing functions (applied to each group in turn).
-        """
-
-        response_regex = response_string
-        noop = lambda x: x  # placeholder null parse function
-        placeholders = [  # tuples of (regex matching placeholder, regex to replace it with, parse function)
-            (r"%c", r".", noop),
-            (r"%(\\d+)c", r".{\1}", noop),  # TODO support %cn where n is a number of chars
-            (r"%d", r"[-+]?\\d+", int),
-            (r"%[eEfg]", r"[-+]?(?:\\d+(?:\.\\d*)?|\.\\d+)(?:[eE][-+]?\\d+)?", float),
-            # (r"%(\\d+)c",r".{\\1}", noop), #TODO support %cn where n is a number of chars
-            # (r"%d",r"[-+]?\\d+", int),
-            # (r"%[eEfg]",r"[-+]?(?:\\d+(?:\\.\\d*)?|\\.\\d+)(?:[eE][-+]?\\d+)?", float),
-            (r"%i", r"[-+]?(?:0[xX][\\dA-Fa-f]+|0[0-7]*|\\d+)", lambda x: int(x, 0)),  # 0=autodetect base
-            (r"%o", r"[-+]?[0-7]+", lambda x: int(x, 8)),  # 8 means octal
-            (r"%s", r"\\S+", noop),
-            (r"%u", r"\\d+", int),
-            (r"%[xX]", r"[-+]?(?:0[xX])?[\\dA-Fa-f]+", lambda x: int(x, 16)),  # 16 forces hexadecimal
-        ]
-        matched_placeholders = []
-        for placeholder, regex, parse_fun in placeholders:
-            response_regex = re.sub(placeholder, '(' + regex + ')', response_regex)  # substitute regex for placeholder
-            matched_placeholders.extend([(parse_fun, m.start()) for m in re.finditer(placeholder, response_string)])  # save the positions of the placeholders
-        if parse_function is None:
-            parse_function = [f for f, s in sorted(matched_placeholders, key=lambda m: m[1])]  # order parse functions by their occurrence in the original string
-        if not hasattr(parse_function, '__iter__'):
-            parse_function = [parse_function]  # make sure it's a list.
 
+        Templates are compiled once, and reused (see reply_parser).  The time
+        each query takes is recorded in self.query_latencies.
+        """
+        parser = reply_parser(response_string, re_flags, parse_function)
+        start = time.time()
         reply = self.query(query_string, **kwargs)  # do the query
-        res = re.search(response_regex, reply, flags=re_flags)
-        if res is None:
-            raise ValueError("Stage response to '%s' ('%s') wasn't matched by /%s/ (generated regex /%s/" % (query_string, reply, response_string, response_regex))
-        try:
-            parsed_result = [f(g) for f, g in zip(parse_function, res.groups())]  # try to apply each parse function to its argument
-            if len(parsed_result) == 1:
-                return parsed_result[0]
-            else:
-                return parsed_result
-        except ValueError:
-            print("Parsing Error")
-            print("Matched Groups:", res.groups())
-            print("Parsing Functions:", parse_function)
-            raise ValueError("Stage response to %s ('%s') couldn't be parsed by the supplied function" % (query_string, reply))
+        self.query_latencies.record(query_string, time.time() - start)
+        values = parser.parse(reply, query_string)
+        if len(values) == 1:
+            return values[0]
+        else:
+            return list(values)
 
     def int_query(self, query_string, **kwargs):
         """Perform a query and return the result(s) as integer(s) (see parsedQuery)"""
@@ -231,12 +302,225 @@ class MessageBusInstrument(nplab.instrument.Instrument):
         """Perform a query and return the result(s) as float(s) (see parsedQuery)"""
         return self.parsed_query(query_string, "%f", **kwargs)
 
+    def array_query(self, query_string, dtype=float, delimiter=',', **kwargs):
+        """
+        Perform a query whose response is a list of numbers (e.g. a trace, or
+        the readings of every channel), and return them as a numpy array.
+
+        The numbers are converted all at once by numpy, rather than one at a
+        time.  If delimiter is None, they are separated by whitespace.
+        """
+        start = time.time()
+        reply = self.query(query_string, **kwargs)
+        self.query_latencies.record(query_string, time.time() - start)
+        try:
+            return np.array(reply.strip().split(delimiter), dtype=dtype)
+        except ValueError:
+            raise ValueError("Response to %s ('%s') isn't a list of numbers separated by %r" % (query_string, reply, delimiter))
+
+    @property
+    def query_latencies(self):
+        """Histograms of how long each parsed query takes (see QueryLatencies)"""
+        # initialised on first use, like the communications lock
+        if self._query_latencies is None:
+            self._query_latencies = QueryLatencies()
+        return self._query_latencies
+
     #@staticmethod  # this was an attempt at making a property factory - now using a descriptor
     #def queried_property(self, get_cmd, set_cmd, dtype='float', docstring=''):
     #    get_func = self.float_query if dtype=='float' else self.query
     #    return property(fget=partial(get_func, get_cmd), fset=self.write, docstring=docstring)
 
 
+def _parse_c_integer(string):
+    """Parse an integer as C's %i does: 0x... is hexadecimal, 0... is octal and anything else decimal"""
+    digits = string.lstrip('+-')
+    sign = -1 if string.startswith('-') else 1
+    if digits[:2] in ('0x', '0X'):
+        return sign * int(digits[2:], 16)
+    elif len(digits) > 1 and digits[0] == '0':
+        return sign * int(digits, 8)
+    return sign * int(digits)
+
+
+def _noop(x):
+    return x
+
+
+PLACEHOLDERS = [  # tuples of (regex matching placeholder, regex to replace it with, parse function)
+    (r"%c", r".", _noop),
+    (r"%(\\d+)c", r".{\1}", _noop),  # TODO support %cn where n is a number of chars
+    (r"%d", r"[-+]?\\d+", int),
+    (r"%[eEfg]", r"[-+]?(?:\\d+(?:\.\\d*)?|\.\\d+)(?:[eE][-+]?\\d+)?", float),
+    (r"%i", r"[-+]?(?:0[xX][\\dA-Fa-f]+|0[0-7]*|\\d+)", _parse_c_integer),  # hexadecimal, octal or decimal
+    (r"%o", r"[-+]?[0-7]+", lambda x: int(x, 8)),  # 8 means octal
+    (r"%s", r"\\S+", _noop),
+    (r"%u", r"\\d+", int),
+    (r"%[xX]", r"[-+]?(?:0[xX])?[\\dA-Fa-f]+", lambda x: int(x, 16)),  # 16 forces hexadecimal
+]
+
+
+class ReplyParser(object):
+    """A template for the replies to a query (see MessageBusInstrument.parsed_query), compiled into a regular
+    expression and a parse function per value.  Made by reply_parser, which keeps them for reuse."""
+    def __init__(self, template, re_flags=0, parse_function=None):
+        regex = template
+        matched_placeholders = []
+        for placeholder, replacement, parse_fun in PLACEHOLDERS:
+            regex = re.sub(placeholder, '(' + replacement + ')', regex)  # substitute regex for placeholder
+            matched_placeholders.extend([(parse_fun, m.start()) for m in re.finditer(placeholder, template)])  # save the positions of the placeholders
+        self.template = template
+        self.regex = re.compile(regex, re_flags)
+        if parse_function is None:
+            parse_function = [f for f, s in sorted(matched_placeholders, key=lambda m: m[1])]  # order parse functions by their occurrence in the template
+        elif not hasattr(parse_function, '__iter__'):
+            parse_function = [parse_function] * max(self.regex.groups, 1)  # one function for every group
+        self.parse_functions = tuple(parse_function)
+
+    def parse(self, reply, query_string=None):
+        """The values in a reply, as a tuple of the types given by the template"""
+        res = self.regex.search(reply)
+        if res is None:
+            raise ValueError("Stage response to '%s' ('%s') wasn't matched by /%s/ (generated regex /%s/)" % (query_string, reply, self.template, self.regex.pattern))
+        try:
+            return tuple([f(g) for f, g in zip(self.parse_functions, res.groups())])
+        except ValueError:
+            raise ValueError("Stage response to %s ('%s') couldn't be parsed by %s (matched groups %s)" % (query_string, reply, self.parse_functions, res.groups()))
+
+    def parse_array(self, replies, dtype=float):
+        """
+        The values in several replies (e.g. from batched_query), as a (replies, values) numpy array.
+
+        The matched strings are converted all at once by numpy rather than by the parse functions, so dtype must be
+        able to read them, e.g. floats or decimal integers.
+        """
+        groups = []
+        for reply in replies:
+            res = self.regex.search(reply)
+            if res is None:
+                raise ValueError("Response '%s' wasn't matched by /%s/" % (reply, self.template))
+            groups.append(res.groups())
+        return np.array(groups, dtype=dtype)
+
+
+_reply_parsers = dict()
+MAX_REPLY_PARSERS = 1024  # the cache is emptied if it grows past this, e.g. with a new lambda for every query
+
+
+def reply_parser(template, re_flags=0, parse_function=None):
+    """The ReplyParser for a template, compiled on first use and then reused"""
+    if hasattr(parse_function, '__iter__'):
+        parse_function = tuple(parse_function)
+    key = (template, re_flags, parse_function)
+    parser = _reply_parsers.get(key)
+    if parser is None:
+        parser = ReplyParser(template, re_flags, parse_function)
+        if len(_reply_parsers) >= MAX_REPLY_PARSERS:
+            _reply_parsers.clear()
+        _reply_parsers[key] = parser
+    return parser
+
+
+class QueryLatencies(object):
+    """
+    Histograms of how long queries take, to find the slow instruments (and queries) in polling loops.
+
+    Latencies are binned logarithmically, bins_per_decade bins per decade from shortest to longest seconds; the first
+    and last bins also count anything faster or slower.
+    """
+    max_queries = 256  #: queries recorded separately. Any more are recorded together, as '<other>'
+
+    def __init__(self, bins_per_decade=4, shortest=1e-5, longest=100.):
+        self._log_shortest = math.log10(shortest)
+        self._bins_per_decade = bins_per_decade
+        self.n_bins = int(round((math.log10(longest) - self._log_shortest) * bins_per_decade))
+        self.bin_edges = np.logspace(self._log_shortest, math.log10(longest), self.n_bins + 1)
+        self._counts = dict()  # query: count in each bin
+        self._totals = dict()  # query: [number of queries, total seconds, longest seconds]
+        self._lock = threading.Lock()
+
+    def record(self, query_string, seconds):
+        index = int((math.log10(max(seconds, 1e-12)) - self._log_shortest) * self._bins_per_decade)
+        index = min(max(index, 0), self.n_bins - 1)
+        with self._lock:
+            if query_string not in self._counts:
+                if len(self._counts) >= self.max_queries:
+                    query_string = '<other>'
+                if query_string not in self._counts:
+                    self._counts[query_string] = [0] * self.n_bins
+                    self._totals[query_string] = [0, 0., 0.]
+            self._counts[query_string][index] += 1
+            totals = self._totals[query_string]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+
+    def histogram(self, query_string):
+        """The number of queries in each bin, and the bin edges in seconds (as np.histogram)"""
+        with self._lock:
+            return np.array(self._counts.get(query_string, [0] * self.n_bins)), self.bin_edges
+
+    def summary(self):
+        """(query, number, mean seconds, longest seconds) of every query, the most total time first"""
+        with self._lock:
+            totals = [(query, n, total, longest) for query, (n, total, longest) in self._totals.items()]
+        totals.sort(key=lambda t: -t[2])
+        return [(query, n, total / n, longest) for query, n, total, longest in totals]
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._totals.clear()
+
+
+class CommandBatch(object):
+    """Commands written back to back to a MessageBusInstrument, whose
+    acknowledgements are collected in a background thread.
+
+    Made by MessageBusInstrument.send_batch(..., block=False).  The thread
+    holds the instrument's communications lock from the first write until the
+    last acknowledgement, so other communications wait for the batch.
+    """
+    def __init__(self, instrument, commands, timeout=None, delay=0):
+        self.instrument = instrument
+        self.commands = list(commands)
+        self.timeout = timeout
+        self.delay = delay
+        self.replies = None
+        self.error = None
+        self.sent = threading.Event()  # set once every command has been written
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        instrument = self.instrument
+        try:
+            with instrument.communications_lock:
+                try:
+                    instrument.flush_input_buffer()
+                    instrument._write_batch(self.commands, self.delay)
+                finally:
+                    self.sent.set()
+                self.replies = [instrument._read_reply(c, self.timeout) for c in self.commands]
+        except Exception as e:
+            self.error = e
+
+    @property
+    def done(self):
+        return not self._thread.is_alive()
+
+    def wait(self, timeout=None):
+        """Wait for every acknowledgement, and return them as a list.  Errors
+        raised while communicating are raised here."""
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            raise IOError("Timed out waiting for the acknowledgements of %s" % self.commands)
+        if self.error is not None:
+            raise self.error
+        return self.replies
+
+
 class queried_property(object):
     """A Property interface that reads and writes from the instrument on the bus.
     
@@ -82,6 +82,7 @@ class SerialInstrument(MessageBusInstrument):
             if port is None: port = self.find_port()
             assert port is not None, "We don't have a serial port to open, meaning you didn't specify a valid port and autodetection failed.  Are you sure the instrument is connected?"
             self.ser = serial.Serial(port, **self.port_settings)
+            self._read_buffer = bytearray()  # bytes read from the port but not returned yet
             # self.ser_io = io.TextIOWrapper(io.BufferedRWPair(self.ser, self.ser,1),
             #                                newline = self.termination_character,
             #                                line_buffering = True)
@@ -115,36 +116,126 @@ class SerialInstrument(MessageBusInstrument):
             if query_string != echo:
                 self._logger.warn('This write did not echo: ' + echo)
 
+    def _write_batch(self, commands, delay=0):
+        """Write several commands, waiting delay seconds between each one.
+
+        With no delay they're sent as a single write.  They don't go through
+        _write, because it flushes the output buffer first, which could
+        discard commands still being sent."""
+        assert self.ser.isOpen(), "Warning: attempted to write to the serial port before it was opened.  Perhaps you need to call the 'open' method first?"
+        messages = [self.initial_character + str(command) + self.termination_character for command in commands]
+        if delay <= 0:
+            messages = [''.join(messages)]
+        for i, message in enumerate(messages):
+            if i > 0:
+                time.sleep(delay)
+            self.ser.write(str.encode(message))
+            self.ser.flush()  # so the delay starts once the command has been sent
+
     def flush_input_buffer(self):
         """Make sure there's nothing waiting to be read, and clear the buffer if there is."""
         with self.communications_lock:
             self.ser.reset_input_buffer()
+            del self._read_buffer[:]
             # if self.ser.inWaiting() > 0: self.ser.flushInput()
     def flush_output_buffer(self):
         """Make sure there's nothing waiting to be written, and clear the buffer if there is."""
         with self.communications_lock:
             self.ser.reset_output_buffer()
 
+    def _deadline(self, timeout=None):
+        if hasattr(self, 'timeout') and timeout is None:
+            timeout = self.timeout
+        elif timeout is None:
+            timeout = 10
+        return time.time() + timeout
+
+    def _read_chunk(self, deadline):
+        """Read everything waiting at the port into the read buffer.
+
+        If nothing is waiting, wait for one byte (up to the port's timeout).
+        Returns False if nothing was read, i.e. the port or deadline timed out."""
+        if time.time() >= deadline:
+            return False
+        try:
+            waiting = self.ser.in_waiting
+        except AttributeError:
+            waiting = self.ser.inWaiting()
+        chunk = self.ser.read(max(1, waiting))
+        self._read_buffer += chunk
+        return len(chunk) > 0
+
+    def _read_bytes(self, size, deadline):
+        """Take size bytes from the read buffer, reading more if needed."""
+        while len(self._read_buffer) < size:
+            if not self._read_chunk(deadline):
+                raise IOError("Timed out after %d of %d bytes" % (len(self._read_buffer), size))
+        data = bytes(self._read_buffer[:size])
+        del self._read_buffer[:size]
+        return data
+
     def readline(self, timeout=None):
+        """Read one line, up to and including the termination character.
+
+        The port is read in chunks of whatever is waiting, and anything after
+        the end of the line is kept for the next read.  If the line doesn't
+        end before the timeout (or the port's timeout passes with nothing
+        arriving), whatever has been read is returned."""
         with self.communications_lock:
-            if hasattr(self, 'timeout') and timeout is None:
-                timeout = self.timeout
-            elif timeout is None:
-                timeout = 10
+            deadline = self._deadline(timeout)
             eol = str.encode(self.termination_character)
-            leneol = len(eol)
-            line = bytearray()
-            start = time.time()
-            while time.time() - start < timeout:
-                c = self.ser.read(1)
-                if c:
-                    line += c
-                    if line[-leneol:] == eol:
-                        break
-                else:
+            searched = 0  # where to look for the termination from, so each chunk is only searched once
+            while True:
+                end = self._read_buffer.find(eol, searched)
+                if end >= 0:
+                    end += len(eol)
                     break
+                searched = max(0, len(self._read_buffer) - len(eol) + 1)
+                if not self._read_chunk(deadline):
+                    end = len(self._read_buffer)
+                    break
+            line = bytes(self._read_buffer[:end])
+            del self._read_buffer[:end]
             return line.decode().replace(self.termination_read, '\n')
 
+    def read_binary_block(self, timeout=None):
+        """Read an IEEE 488.2 binary block, returning its data as bytes.
+
+        Definite-length blocks (#<N><N-digit length><data>) are read in as
+        few chunks as possible, and #0 (indefinite-length) blocks are read up
+        to the termination character.  Anything before the # (e.g. a command
+        header echoed by the instrument) is discarded, as is the termination
+        character after the block if it has already arrived."""
+        with self.communications_lock:
+            deadline = self._deadline(timeout)
+            while b'#' not in self._read_buffer:
+                del self._read_buffer[:]
+                if not self._read_chunk(deadline):
+                    raise IOError("Timed out waiting for a binary block")
+            del self._read_buffer[:self._read_buffer.index(b'#') + 1]
+            n_digits = int(self._read_bytes(1, deadline))
+            eol = str.encode(self.termination_character)
+            if n_digits == 0:
+                while eol not in self._read_buffer:
+                    if not self._read_chunk(deadline):
+                        raise IOError("Timed out reading an indefinite-length binary block")
+                end = self._read_buffer.index(eol)
+                data = bytes(self._read_buffer[:end])
+                del self._read_buffer[:end + len(eol)]
+                return data
+            length = int(self._read_bytes(n_digits, deadline))
+            data = self._read_bytes(length, deadline)
+            if len(self._read_buffer) < len(eol):
+                try:
+                    waiting = self.ser.in_waiting
+                except AttributeError:
+                    waiting = self.ser.inWaiting()
+                if waiting:
+                    self._read_buffer += self.ser.read(waiting)
+            if self._read_buffer.startswith(eol):
+                del self._read_buffer[:len(eol)]
+            return data
+
     def test_communications(self):
         """Check if the device is available on the current port.
 
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Simulated serial device, at the other end of a pseudo-terminal (pty), so that SerialInstruments can be run (and
+tested) without hardware, through pyserial, exactly as they would be with a real port:
+
+>>> device = SimulatedSerialDevice(lambda command: 'echo ' + command, latency=0.01)
+>>> instrument = SerialInstrument(device.port)
+>>> instrument.query('hello')
+'echo hello'
+
+Commands are handled one at a time and in order, as a controller would: latency seconds after a command arrives (the
+time the device takes to process it), respond(command) is called, and its reply (if not None) is sent back followed by
+the termination character. respond can also return bytes, which are sent as they are. Every command received is
+recorded in self.commands. Only available on systems with ptys (Linux and macOS).
+"""
+from builtins import object
+import os
+import select
+import threading
+import time
+import tty
+
+
+class SimulatedSerialDevice(object):
+    def __init__(self, respond, termination='\n', latency=0.):
+        """
+        :param respond: function of each command received (a str, without termination) returning the reply (str or
+            bytes) or None for no reply
+        :param termination: the termination of commands and replies
+        :param latency: seconds the device takes to process each command
+        """
+        self.respond = respond
+        self.termination = termination.encode()
+        self.latency = latency
+        self.commands = []
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)  # no echo, and no translation of line endings
+        self.port = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='SimulatedSerialDevice')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        received = b''
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                received += os.read(self._master, 4096)
+            except OSError:  # the port was closed
+                break
+            while self.termination in received:
+                line, received = received.split(self.termination, 1)
+                command = line.decode()
+                self.commands.append(command)
+                if self.latency:
+                    time.sleep(self.latency)
+                reply = self.respond(command)
+                if reply is not None:
+                    self.send(reply)
+
+    def send(self, reply):
+        """Sends a reply (a str, which is terminated, or bytes, which are sent as they are)"""
+        if not isinstance(reply, bytes):
+            reply = reply.encode() + self.termination
+        os.write(self._master, reply)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+
+def benchmark_readline(reply_length=100000, repeats=10):
+    """
+    Times SerialInstrument.readline reading a long reply (e.g. a trace sent as text) from a simulated device, against
+    reading the same reply one byte at a time
+
+    :param reply_length: number of characters in each reply
+    :param repeats: number of replies read with each method
+    :return: dictionary of the mean seconds per reply for 'chunked' and 'bytewise' reads
+    """
+    from nplab.instrument.serial_instrument import SerialInstrument
+
+    reply = 'x' * reply_length
+    device = SimulatedSerialDevice(lambda command: reply)
+    instrument = SerialInstrument(device.port)
+    try:
+        def bytewise():
+            instrument.write('trace?')
+            line = bytearray()
+            while not line.endswith(b'\n'):
+                c = instrument.ser.read(1)
+                if not c:
+                    break
+                line += c
+            return line.decode()
+
+        times = dict()
+        for name, read in [('chunked', lambda: instrument.query('trace?')), ('bytewise', bytewise)]:
+            start = time.time()
+            for _ in range(repeats):
+                assert len(read().strip()) == reply_length
+            times[name] = (time.time() - start) / repeats
+        return times
+    finally:
+        instrument.close()
+        device.close()
+
+
+if __name__ == '__main__':
+    for length in (100, 10000, 1000000):
+        print(length, benchmark_readline(length, repeats=3))
@@ -14,9 +14,11 @@ import platform
 
 from ctypes import *
 import time
+import numpy as np
 import sys
 from nplab.instrument import Instrument
 from nplab.utils.notified_property import NotifiedProperty
+from nplab.instrument.spectrometer.calibrated_axis import CalibratedAxisCache
 from nplab.utils.gui import QtGui, QtWidgets, uic
 from nplab.ui.ui_tools import UiTools
 
@@ -36,6 +38,8 @@ class Kymera(Instrument):
         error = self.dll.ATSpectrographInitialize("")#(byref(tekst))
         self.current_kymera = 0 #for more than one kymera this has to be varied, see KymeraGetNumberDevices
         self._logger.setLevel('WARNING')
+        # the wavelength calibration only changes when the setters below are called, which invalidate it
+        self.calibration = CalibratedAxisCache(self.GetCalibration)
         
     def verbose(self, error, function=''):
         self.log( "[%s]: %s" %(function, error), level='info')
@@ -89,6 +93,7 @@ class Kymera(Instrument):
     def SetTurret(self,turret):
         error = self.dll.ATSpectrographSetTurret(self.current_kymera,c_int(turret))
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     
     turret_position = NotifiedProperty(GetTurret,SetTurret)
     
@@ -110,6 +115,7 @@ class Kymera(Instrument):
         grating = c_int(grating_num)
         error = self.dll.ATSpectrographSetGrating(self.current_kymera,grating)
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     current_grating = NotifiedProperty(GetGrating,SetGrating)    
     def GetGratingInfo(self):    
         lines = c_float()
@@ -130,6 +136,7 @@ class Kymera(Instrument):
     def SetGratingOffset(self,offset):
         error = self.dll.ATSpectrographSetGratingOffset(self.current_kymera,self.current_grating,c_int(offset))
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     Grating_offset = NotifiedProperty(GetGratingOffset,SetGratingOffset)
     
     def GetDetectorOffset(self):
@@ -141,6 +148,7 @@ class Kymera(Instrument):
     def SetDetectorOffset(self,offset):
         error = self.dll.ATSpectrographSetDetectorOffset(self.current_kymera,self.current_grating,c_int(offset))
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     
     detector_offset = NotifiedProperty(GetDetectorOffset,SetDetectorOffset)
         
@@ -162,6 +170,7 @@ class Kymera(Instrument):
     def SetWavelength(self,centre_wl):
         error = self.dll.ATSpectrographSetWavelength(self.current_kymera,c_float(centre_wl))
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
         
     center_wavelength = NotifiedProperty(GetWavelength,SetWavelength)  
       
@@ -186,6 +195,7 @@ class Kymera(Instrument):
     def GotoZeroOrder(self):
         error = self.dll.ATSpectrographGotoZeroOrder(self.current_kymera)
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     
     #Slit functions
     def AutoSlitIsPresent(self):
@@ -247,6 +257,7 @@ class Kymera(Instrument):
     def SetPixelWidth(self,width):
         error = self.dll.ATSpectrographSetPixelWidth(self.current_kymera,c_float(width))
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     
     def GetPixelWidth(self):
         pixelw = c_float()
@@ -264,17 +275,16 @@ class Kymera(Instrument):
     def SetNumberPixels(self,pixels):
         error = self.dll.ATSpectrographSetNumberPixels(self.current_kymera,pixels)
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     pixel_number = NotifiedProperty(GetNumberPixels,SetNumberPixels)
     
     def GetCalibration(self):
-        ccalib = c_float*self.pixel_number
+        pixel_number = self.pixel_number
+        ccalib = c_float*pixel_number
         ccalib_array = ccalib()
-        error = self.dll.ATSpectrographGetCalibration(self.current_kymera, pointer(ccalib_array), self.pixel_number)
+        error = self.dll.ATSpectrographGetCalibration(self.current_kymera, pointer(ccalib_array), pixel_number)
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        calib = []        
-        for i in range(len(ccalib_array)):
-            calib.append(ccalib_array[i])
-        return calib[:]
+        return np.ctypeslib.as_array(ccalib_array).tolist()
     wl_calibration = property(GetCalibration)     
     
     def GetPixelCalibrationCoefficients(self):
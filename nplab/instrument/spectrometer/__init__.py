@@ -14,6 +14,8 @@ from nplab.utils.array_with_attrs import ArrayWithAttrs
 import h5py
 from multiprocessing.pool import ThreadPool
 from nplab.experiment.gui import run_function_modally
+from nplab.instrument.spectrometer.acquisition import MultiSpectrometerAcquisition
+from nplab.instrument.spectrometer.time_series import StreamingTimeSeries
 
 import time
 
@@ -341,6 +343,19 @@ class Spectrometer(Instrument):
         to_return = ArrayWithAttrs(to_save, attrs = metadata)
         return to_return
 
+    def stream_time_series(self, num_spectra=None, interval=None, chunk_size=10):
+        """Start a time series in the background that saves spectra as they are acquired.
+
+        Spectra are scheduled every `interval` seconds (default: self.delay, in ms as for time_series) on a monotonic
+        clock and written in chunks to a resizable dataset, with a parallel dataset of timestamps. If num_spectra is
+        None it runs until stopped. Returns the running StreamingTimeSeries experiment: call its stop() method to end
+        the run."""
+        if interval is None:
+            interval = self.delay/1000.
+        experiment = StreamingTimeSeries(self, num_spectra, interval, chunk_size, name=self.time_series_name)
+        experiment.start()
+        return experiment
+
 class Spectrometers(Instrument):
     def __init__(self, spectrometer_list):
         assert False not in [isinstance(s, Spectrometer) for s in spectrometer_list],\
@@ -350,9 +365,11 @@ class Spectrometers(Instrument):
         self.num_spectrometers = len(spectrometer_list)
         self._pool = ThreadPool(processes=self.num_spectrometers)
         self._wavelengths = None
+        self.acquisition = None
         filename = DumbNotifiedProperty('spectra')
 
     def __del__(self):
+        self.stop_acquisition()
         self._pool.close()
 
     def add_spectrometer(self, spectrometer):
@@ -376,6 +393,38 @@ class Spectrometers(Instrument):
         """Acquire a list of processed (referenced, background subtracted) spectra."""
         return self._pool.map(lambda s: s.read_processed_spectrum(), self.spectrometers)
 
+    def start_acquisition(self, capacity=100, tolerance=0.05):
+        """Start reading all spectrometers continuously, each in its own thread.
+
+        See nplab.instrument.spectrometer.acquisition.MultiSpectrometerAcquisition, which is returned (and kept in
+        self.acquisition). While it runs, get spectra with latest_frame rather than read_spectra."""
+        if self.acquisition is None or not self.acquisition.running:
+            self.acquisition = MultiSpectrometerAcquisition(self.spectrometers, capacity, tolerance)
+            self.acquisition.start()
+        return self.acquisition
+
+    def stop_acquisition(self):
+        if self.acquisition is not None:
+            self.acquisition.stop()
+        self.acquisition = None
+
+    @property
+    def acquiring(self):
+        return self.acquisition is not None and self.acquisition.running
+
+    def latest_frame(self, processed=False, wait=False, timeout=None):
+        """The newest set of time-aligned spectra from the continuous acquisition, without reading the spectrometers.
+
+        Returns a Frame (with spectra and timestamps attributes), or None if no aligned frame is available, including
+        when no continuous acquisition has been started (see start_acquisition). If wait is True, waits for every
+        spectrometer to deliver a new spectrum first."""
+        if self.acquisition is None:
+            return None
+        frame = self.acquisition.wait_for_frame(timeout) if wait else self.acquisition.latest_frame()
+        if frame is not None and processed:
+            frame.spectra = self.process_spectra(frame.spectra)
+        return frame
+
     def process_spectra(self, spectra):
         pairs = list(zip(self.spectrometers, spectra))
         return self._pool.map(lambda s_spectrum: s_spectrum[0].process_spectrum(s_spectrum[1]), pairs)
@@ -587,22 +636,25 @@ class DisplayThread(QtCore.QThread):
         self.refresh_rate = 30.
 
     def run(self):
-        t0 = time.time()
         while self.parent.live_button.isChecked() or self.single_shot:
-            read_processed_spectrum = self.parent.spectrometer.read_processed_spectra \
-                if isinstance(self.parent.spectrometer, Spectrometers) \
-                else self.parent.spectrometer.read_processed_spectrum
-            spectrum = read_processed_spectrum()
-            if time.time()-t0 < 1./self.refresh_rate:
-                continue
+            t0 = time.time()
+            spectrometer = self.parent.spectrometer
+            if isinstance(spectrometer, Spectrometers) and spectrometer.acquiring:
+                # the reader threads are already acquiring, so just pick up the newest frame
+                frame = spectrometer.latest_frame(processed=True, wait=True, timeout=1.)
+                spectrum = None if frame is None else frame.spectra
+            elif isinstance(spectrometer, Spectrometers):
+                spectrum = spectrometer.read_processed_spectra()
             else:
-                t0 = time.time()
+                spectrum = spectrometer.read_processed_spectrum()
             if type(spectrum) == np.ndarray:
                 self.spectrum_ready.emit(spectrum)
             elif type(spectrum) == list:
                 self.spectra_ready.emit(spectrum)
             if self.single_shot:
                 break
+            # rather than reading spectra that won't be displayed, wait until the next refresh is due
+            time.sleep(max(0, 1./self.refresh_rate - (time.time() - t0)))
         self.finished.emit()
 
 
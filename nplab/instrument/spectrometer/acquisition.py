@@ -0,0 +1,249 @@
+"""
+Concurrent acquisition from several spectrometers
+=================================================
+
+Each spectrometer gets a dedicated reader thread, which calls read_spectrum back to back and stores the results, with
+host timestamps, in its own ring buffer. Spectra from different spectrometers can then be grouped into aligned "frames"
+(one spectrum per device, all taken within a configurable time tolerance of each other), and the newest frame can be
+picked up by a display without triggering any extra reads.
+
+The timestamp of a spectrum is the midpoint of the read_spectrum call, i.e. the host's best guess at the middle of the
+integration, in time.time() units.
+"""
+from __future__ import division
+from builtins import object
+from builtins import range
+import threading
+import time
+import numpy as np
+
+
+class SpectrumRingBuffer(object):
+    """Fixed-size, thread-safe store for the latest spectra of one spectrometer and their timestamps
+
+    The spectra array is only allocated once the first spectrum arrives (so that its length is known).
+    """
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.spectra = None
+        self.timestamps = np.full(capacity, np.nan)
+        self.count = 0  # total number of spectra ever added, the latest is at index (count - 1) % capacity
+        self._lock = threading.Lock()
+        self.new_spectrum = threading.Condition(self._lock)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, spectrum, timestamp):
+        with self._lock:
+            if self.spectra is None or self.spectra.shape[1:] != np.shape(spectrum):
+                self.spectra = np.zeros((self.capacity, ) + np.shape(spectrum))
+                self.timestamps[:] = np.nan
+                self.count = 0
+            index = self.count % self.capacity
+            self.spectra[index] = spectrum
+            self.timestamps[index] = timestamp
+            self.count += 1
+            self.new_spectrum.notify_all()
+
+    def latest(self):
+        """Returns a copy of the newest spectrum and its timestamp, or (None, None) if the buffer is empty"""
+        with self._lock:
+            if self.count == 0:
+                return None, None
+            index = (self.count - 1) % self.capacity
+            return np.copy(self.spectra[index]), self.timestamps[index]
+
+    def latest_timestamp(self):
+        with self._lock:
+            if self.count == 0:
+                return None
+            return self.timestamps[(self.count - 1) % self.capacity]
+
+    def nearest(self, timestamp):
+        """Returns a copy of the stored spectrum taken closest to timestamp, and its timestamp"""
+        with self._lock:
+            if self.count == 0:
+                return None, None
+            index = np.nanargmin(np.abs(self.timestamps - timestamp))
+            return np.copy(self.spectra[index]), self.timestamps[index]
+
+    def get_all(self):
+        """Returns copies of all the stored spectra and timestamps, oldest first"""
+        with self._lock:
+            n = len(self)
+            indices = np.arange(self.count - n, self.count) % self.capacity
+            if n == 0:
+                return np.zeros((0, )), np.zeros((0, ))
+            return self.spectra[indices], self.timestamps[indices]
+
+    def wait_for_count(self, count, timeout=None):
+        """Blocks until more than count spectra have ever been added. Returns False if it timed out"""
+        with self._lock:
+            return self.new_spectrum.wait_for(lambda: self.count > count, timeout)
+
+
+class SpectrometerReader(threading.Thread):
+    """Thread reading spectra from one spectrometer, as fast as it can, into a SpectrumRingBuffer"""
+    def __init__(self, spectrometer, buffer):
+        super(SpectrometerReader, self).__init__()
+        self.daemon = True
+        self.spectrometer = spectrometer
+        self.buffer = buffer
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                t0 = time.time()
+                spectrum = np.asarray(self.spectrometer.read_spectrum(), dtype=float)
+                t1 = time.time()
+            except Exception as e:
+                self.error = e
+                self.spectrometer.log('Reader thread stopped: %s' % e, level='error')
+                break
+            self.buffer.append(spectrum, (t0 + t1) / 2.)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class Frame(object):
+    """One spectrum from each spectrometer, taken within the acquisition's tolerance of each other"""
+    def __init__(self, spectra, timestamps):
+        self.spectra = spectra
+        self.timestamps = np.array(timestamps)
+
+    @property
+    def timestamp(self):
+        return np.mean(self.timestamps)
+
+    @property
+    def spread(self):
+        """Time (in s) between the first and last spectrum in the frame"""
+        return np.max(self.timestamps) - np.min(self.timestamps)
+
+
+class MultiSpectrometerAcquisition(object):
+    """Runs one reader thread per spectrometer, and aligns their spectra in time
+
+    Typically created with Spectrometers.start_acquisition. Note that while it runs, read_spectrum should not be called
+    on the spectrometers from elsewhere, the readers are already calling it continuously.
+    """
+    def __init__(self, spectrometers, capacity=100, tolerance=0.05):
+        """
+        :param spectrometers: list of Spectrometer instances
+        :param capacity: int. Number of spectra kept for each spectrometer
+        :param tolerance: float. Maximum time difference (in s) between spectra in the same frame
+        """
+        self.spectrometers = list(spectrometers)
+        self.capacity = capacity
+        self.tolerance = tolerance
+        self.buffers = [SpectrumRingBuffer(capacity) for _ in self.spectrometers]
+        self.readers = []
+
+    @property
+    def running(self):
+        return any(reader.is_alive() for reader in self.readers)
+
+    def start(self):
+        if self.running:
+            return
+        self.readers = [SpectrometerReader(s, b) for s, b in zip(self.spectrometers, self.buffers)]
+        for reader in self.readers:
+            reader.start()
+
+    def stop(self, timeout=None):
+        for reader in self.readers:
+            reader.stop()
+        for reader in self.readers:
+            reader.join(timeout)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def latest_spectra(self):
+        """The newest spectrum from each spectrometer, regardless of alignment
+
+        :return: list of spectra, list of timestamps
+        """
+        results = [b.latest() for b in self.buffers]
+        return [r[0] for r in results], [r[1] for r in results]
+
+    def latest_frame(self, tolerance=None):
+        """Returns the newest aligned Frame, or None if the spectrometers do not (yet) have one
+
+        The frame is built around the oldest of the latest spectra, since that is the most recent time at which every
+        spectrometer has data: each spectrometer contributes its spectrum closest to that time.
+
+        :param tolerance: float. Overrides self.tolerance
+        :return: Frame
+        """
+        if tolerance is None:
+            tolerance = self.tolerance
+        latest = [b.latest_timestamp() for b in self.buffers]
+        if any(t is None for t in latest):
+            return None
+        reference = min(latest)
+        spectra, timestamps = [], []
+        for b in self.buffers:
+            spectrum, timestamp = b.nearest(reference)
+            if abs(timestamp - reference) > tolerance:
+                return None
+            spectra += [spectrum]
+            timestamps += [timestamp]
+        return Frame(spectra, timestamps)
+
+    def aligned_frames(self, tolerance=None):
+        """Groups all the buffered spectra into frames
+
+        Each spectrum of the slowest spectrometer (the one with the fewest buffered spectra) is matched to the closest
+        spectrum of every other spectrometer. Groups with any time difference above the tolerance are dropped.
+
+        :param tolerance: float. Overrides self.tolerance
+        :return: list of Frame
+        """
+        if tolerance is None:
+            tolerance = self.tolerance
+        contents = [b.get_all() for b in self.buffers]
+        if any(len(timestamps) == 0 for _, timestamps in contents):
+            return []
+        reference = contents[int(np.argmin([len(timestamps) for _, timestamps in contents]))][1]
+        # for each spectrometer, the index of the spectrum closest to each reference time
+        indices = [np.argmin(np.abs(timestamps[None, :] - reference[:, None]), axis=1) for _, timestamps in contents]
+        frames = []
+        for frame_index in range(len(reference)):
+            timestamps = [contents[i][1][idx[frame_index]] for i, idx in enumerate(indices)]
+            if np.max(timestamps) - np.min(timestamps) <= tolerance:
+                frames += [Frame([contents[i][0][idx[frame_index]] for i, idx in enumerate(indices)], timestamps)]
+        return frames
+
+    def wait_for_frame(self, timeout=None, tolerance=None):
+        """Waits until every spectrometer has delivered a new spectrum, then returns latest_frame
+
+        :param timeout: float. In seconds
+        :return: Frame, or None if it timed out or the spectra could not be aligned
+        """
+        counts = [b.count for b in self.buffers]
+        t0 = time.time()
+        for b, count in zip(self.buffers, counts):
+            remaining = None if timeout is None else max(0, timeout - (time.time() - t0))
+            if not b.wait_for_count(count, remaining):
+                return None
+        return self.latest_frame(tolerance)
+
+    def frame_rates(self):
+        """Measured spectra per second for each spectrometer, over the spectra in the buffers"""
+        rates = []
+        for b in self.buffers:
+            _, timestamps = b.get_all()
+            if len(timestamps) < 2:
+                rates += [np.nan]
+            else:
+                rates += [(len(timestamps) - 1) / (timestamps[-1] - timestamps[0])]
+        return rates
@@ -0,0 +1,97 @@
+"""
+Cached spectrograph calibration
+===============================
+
+Reading the wavelength calibration of a Shamrock or Kymera spectrograph is an SDK call per access, and the cameras
+attached to them (Shamdor, Kandor) save their x_axis and wavelengths as metadata with every frame. CalibratedAxisCache
+reads the calibration once, and keeps it - and every axis derived from it (wavenumbers, Raman shifts, binned and
+cropped to a camera ROI, reversed) - until the spectrograph's grating, centre wavelength, detector offset or pixel
+settings change, at which point the spectrograph calls invalidate().
+
+>>> cache = CalibratedAxisCache(shamrock.GetCalibration)
+>>> cache.axis()                                    # wavelengths in nm, one per pixel
+>>> cache.axis('shift', laser_wavelength=632.8)     # Raman shifts in cm^-1
+>>> cache.axis(binning=2, roi=(100, 899))           # matching frames taken with 2x horizontal binning on pixels 100-899
+
+The returned arrays are shared between callers, so they are read-only.
+"""
+from __future__ import division
+from builtins import object
+import threading
+import numpy as np
+
+UNITS = ('nm', 'cm-1', 'shift')
+
+
+def raman_shift(wavelengths, laser_wavelength):
+    """Raman shift in cm^-1 of light at the given wavelengths (in nm), for a laser_wavelength in nm"""
+    return (1. / (laser_wavelength * 1e-9) - 1. / (np.asarray(wavelengths) * 1e-9)) / 100
+
+
+class CalibratedAxisCache(object):
+    def __init__(self, read_calibration):
+        """
+        :param read_calibration: function returning the wavelength (in nm) of each pixel of the detector, e.g.
+            Shamrock.GetCalibration. Only called when the cache is empty
+        """
+        self.read_calibration = read_calibration
+        self._wavelengths = None
+        self._axes = dict()
+        self._lock = threading.Lock()
+        self.reads = 0  # number of times the calibration has been read
+
+    def invalidate(self):
+        """Forgets the calibration, and every axis derived from it. Called by the spectrograph's setters"""
+        with self._lock:
+            self._wavelengths = None
+            self._axes.clear()
+
+    @property
+    def wavelengths(self):
+        """The wavelength of each pixel of the detector, in nm"""
+        with self._lock:
+            if self._wavelengths is None:
+                wavelengths = np.array(self.read_calibration(), dtype=float)
+                wavelengths.flags.writeable = False
+                self._wavelengths = wavelengths
+                self.reads += 1
+            return self._wavelengths
+
+    def axis(self, units='nm', laser_wavelength=None, binning=1, roi=None, reverse=False):
+        """The calibrated axis of the detector
+
+        :param units: 'nm' for wavelengths, 'cm-1' for absolute wavenumbers or 'shift' for Raman shifts (in cm^-1)
+        :param laser_wavelength: in nm, needed for Raman shifts
+        :param binning: number of pixels binned together horizontally. Each binned pixel gets the mean of their values
+        :param roi: (first, last) pixels read out, inclusive, in detector order. Defaults to the whole detector
+        :param reverse: whether to reverse the axis (after cropping and binning), e.g. for frames read out through the
+            EM register
+        :return: read-only numpy array
+        """
+        if units not in UNITS:
+            raise ValueError('units should be one of %s, not %r' % (UNITS, units))
+        if units == 'shift' and laser_wavelength is None:
+            raise ValueError('Raman shifts need a laser_wavelength')
+        key = (units, laser_wavelength if units == 'shift' else None, binning,
+               None if roi is None else tuple(roi), reverse)
+        axis = self._axes.get(key)
+        if axis is None:
+            wavelengths = self.wavelengths
+            if roi is not None:
+                wavelengths = wavelengths[roi[0]:roi[1] + 1]
+            if binning > 1:
+                n_bins = len(wavelengths) // binning
+                wavelengths = wavelengths[:n_bins * binning].reshape(n_bins, binning).mean(axis=1)
+            if units == 'cm-1':
+                axis = 1e7 / wavelengths
+            elif units == 'shift':
+                axis = raman_shift(wavelengths, laser_wavelength)
+            else:
+                axis = np.array(wavelengths)
+            if reverse:
+                axis = axis[::-1]
+            axis.flags.writeable = False
+            with self._lock:
+                if self._wavelengths is not None:  # unless it was invalidated meanwhile
+                    self._axes[key] = axis
+        return axis
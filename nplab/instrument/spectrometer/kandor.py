@@ -27,16 +27,17 @@ class Kandor(Andor):
         self.metadata_property_names += ('slit_width', 'wavelengths')
         self.ImageFlip = 0
     
-    def get_x_axis(self, use_shifts=None):
-        X = self.kymera.GetCalibration()
-        if all([not x for x in X]):# if the list is all 0s
-            X = range(len(X))
-        if self.use_shifts and use_shifts in [None, False]:
-            
-            wavelengths = np.array(X)
-            return ( 1./(self.laser_wl*1e-9)- 1./(wavelengths*1e-9))/100    
-        
-        return X
+    def get_x_axis(self, use_shifts=None, binned=False):
+        '''Raman shifts if self.use_shifts (unless use_shifts is False), wavelengths otherwise, from the kymera's
+        cached calibration. If binned, the axis matches the frames read with the current binning and ROI, instead
+        of having a value per detector pixel
+        '''
+        calibration = self.kymera.calibration
+        if not np.any(calibration.wavelengths):# if the calibration is all 0s
+            return np.arange(len(calibration.wavelengths))
+        units = 'shift' if self.use_shifts and use_shifts in (None, True) else 'nm'
+        binning, roi = self.horizontal_readout if binned else (1, None)
+        return calibration.axis(units, self.laser_wl, binning, roi)
     x_axis = property(get_x_axis)
     
     @property
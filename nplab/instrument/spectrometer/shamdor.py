@@ -28,13 +28,14 @@ class Shamdor(Andor):
         super(Shamdor, self).__init__()
         self.metadata_property_names += ('slit_width', 'wavelengths')
     
-    def get_x_axis(self, use_shifts=None):
-        if self.use_shifts and use_shifts in (None, True):
-            
-            wavelengths = np.array(self.shamrock.GetCalibration()[::-1])
-            return ( 1./(self.laser_wl*1e-9)- 1./(wavelengths*1e-9))/100    
-        else:
-            return self.shamrock.GetCalibration()[::-1]
+    def get_x_axis(self, use_shifts=None, binned=False):
+        '''Raman shifts if self.use_shifts (unless use_shifts is False), wavelengths otherwise, from the shamrock's
+        cached calibration. If binned, the axis matches the frames read with the current binning and ROI, instead
+        of having a value per detector pixel
+        '''
+        units = 'shift' if self.use_shifts and use_shifts in (None, True) else 'nm'
+        binning, roi = self.horizontal_readout if binned else (1, None)
+        return self.shamrock.calibration.axis(units, self.laser_wl, binning, roi, reverse=True)
     x_axis = property(get_x_axis)
     
     @property
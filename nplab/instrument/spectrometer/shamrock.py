@@ -14,9 +14,11 @@ import platform
 
 from ctypes import *
 import time
+import numpy as np
 import sys
 from nplab.instrument import Instrument
 from nplab.utils.notified_property import NotifiedProperty
+from nplab.instrument.spectrometer.calibrated_axis import CalibratedAxisCache
 from nplab.ui.ui_tools import QuickControlBox
 from nplab.utils.gui import QtWidgets
 from nplab.ui.ui_tools import *
@@ -42,6 +44,8 @@ class Shamrock(Instrument):
             
         self.current_shamrock = 0 #for more than one Shamrock this has to be varied, see ShamrockGetNumberDevices
         self._logger.setLevel('WARN')
+        # the wavelength calibration only changes when the setters below are called, which invalidate it
+        self.calibration = CalibratedAxisCache(self.GetCalibration)
 
     def verbose(self, error, function=''):
         self.log( "[%s]: %s" %(function, error),level = 'info')
@@ -95,6 +99,7 @@ class Shamrock(Instrument):
     def SetTurret(self,turret):
         error = self.dll.ShamrockSetTurret(self.current_shamrock,c_int(turret))
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     
     turret_position = NotifiedProperty(GetTurret,SetTurret)
     
@@ -116,6 +121,7 @@ class Shamrock(Instrument):
         grating = c_int(grating_num)
         error = self.dll.ShamrockSetGrating(self.current_shamrock,grating)
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     current_grating = NotifiedProperty(GetGrating,SetGrating)    
     def GetGratingInfo(self):    
         lines = c_float()
@@ -136,6 +142,7 @@ class Shamrock(Instrument):
     def SetGratingOffset(self,offset):
         error = self.dll.ShamrockSetGratingOffset(self.current_shamrock,self.current_grating,c_int(offset))
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     Grating_offset = NotifiedProperty(GetGratingOffset,SetGratingOffset)
     
     def GetDetectorOffset(self):
@@ -147,6 +154,7 @@ class Shamrock(Instrument):
     def SetDetectorOffset(self,offset):
         error = self.dll.ShamrockSetDetectorOffset(self.current_shamrock,self.current_grating,c_int(offset))
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     
     detector_offset = NotifiedProperty(GetDetectorOffset,SetDetectorOffset)
         
@@ -168,6 +176,7 @@ class Shamrock(Instrument):
     def SetWavelength(self,centre_wl):
         error = self.dll.ShamrockSetWavelength(self.current_shamrock,c_float(centre_wl))
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
 
     center_wavelength = NotifiedProperty(GetWavelength,SetWavelength)  
       
@@ -192,6 +201,7 @@ class Shamrock(Instrument):
     def GotoZeroOrder(self):
         error = self.dll.ShamrockGotoZeroOrder(self.current_shamrock)
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     
     #Slit functions
     def AutoSlitIsPresent(self):
@@ -253,6 +263,7 @@ class Shamrock(Instrument):
     def SetPixelWidth(self,width):
         error = self.dll.ShamrockSetPixelWidth(self.current_shamrock,c_float(width))
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     
     def GetPixelWidth(self):
         pixelw = c_float()
@@ -270,17 +281,16 @@ class Shamrock(Instrument):
     def SetNumberPixels(self,pixels):
         error = self.dll.ShamrockSetNumberPixels(self.current_shamrock,pixels)
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.calibration.invalidate()
     pixel_number = NotifiedProperty(GetNumberPixels,SetNumberPixels)
     
     def GetCalibration(self):
-        ccalib = c_float*self.pixel_number
+        pixel_number = self.pixel_number
+        ccalib = c_float*pixel_number
         ccalib_array = ccalib()
-        error = self.dll.ShamrockGetCalibration(self.current_shamrock,pointer(ccalib_array),self.pixel_number)
+        error = self.dll.ShamrockGetCalibration(self.current_shamrock,pointer(ccalib_array),pixel_number)
         self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        calib = []        
-        for i in range(len(ccalib_array)):
-            calib.append(ccalib_array[i])
-        return calib[:]
+        return np.ctypeslib.as_array(ccalib_array).tolist()
     wl_calibration = property(GetCalibration)     
     
     def GetPixelCalibrationCoefficients(self):
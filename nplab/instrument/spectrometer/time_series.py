@@ -0,0 +1,110 @@
+"""
+Streaming spectrometer time series
+==================================
+
+Unlike Spectrometer.time_series, which keeps every spectrum in memory and only saves at the end, this writes the
+spectra into a resizable dataset as it goes (a chunk at a time), with the acquisition time of each spectrum in a
+parallel "timestamps" dataset. Acquisitions are scheduled on a fixed grid of a monotonic clock, so the interval
+between spectra does not drift with the time each reading takes, and the run can go on until it is stopped.
+
+Usually started with Spectrometer.stream_time_series(), which returns the running experiment (call stop() on it).
+"""
+from __future__ import division
+import datetime
+import time
+import numpy as np
+from nplab.experiment import Experiment, ExperimentStopped
+
+
+class StreamingTimeSeries(Experiment):
+    """Acquires spectra at a fixed interval, writing them to the current datafile as they arrive."""
+    experiment_can_be_safely_aborted = True
+
+    def __init__(self, spectrometer, num_spectra=None, interval=0, chunk_size=10, name='time_series_%d'):
+        """
+        :param spectrometer: Spectrometer instance
+        :param num_spectra: int. Number of spectra to take, or None to keep going until stop() is called
+        :param interval: float. Time (in s) between the starts of consecutive spectra. If the spectrometer is slower
+                         than this, spectra are taken back to back
+        :param chunk_size: int. Spectra are written to the file every chunk_size spectra (and when the run ends)
+        :param name: str. Name of the data group the datasets are saved in
+        """
+        super(StreamingTimeSeries, self).__init__()
+        self.spectrometer = spectrometer
+        self.num_spectra = num_spectra
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.name = name
+        self.data_group = None
+        self.spectra_saved = 0
+        self.late_spectra = 0  # number of spectra that started later than scheduled
+
+    def prepare_to_run(self, *args, **kwargs):
+        # Creating the group here means any file dialog pops up in the foreground thread
+        metadata = self.spectrometer.metadata
+        metadata.update({'number of spectra': -1 if self.num_spectra is None else self.num_spectra,
+                         'spectrum start-to-start interval': self.interval})
+        self.data_group = self.spectrometer.create_data_group(self.name, attrs=metadata)
+
+    def _create_datasets(self, spectrum):
+        n_pixels = len(spectrum)
+        self.spectra_dataset = self.data_group.create_dataset('spectra', shape=(0, n_pixels), dtype=float,
+                                                              maxshape=(None, n_pixels),
+                                                              chunks=(self.chunk_size, n_pixels))
+        self.timestamps_dataset = self.data_group.create_dataset('timestamps', shape=(0,), dtype=float,
+                                                                 maxshape=(None,), chunks=(self.chunk_size,))
+        self.timestamps_dataset.attrs['units'] = 's since start_time'
+
+    def _write_chunk(self, spectra, timestamps):
+        if len(spectra) == 0:
+            return
+        n = self.spectra_saved
+        self.spectra_dataset.resize(n + len(spectra), 0)
+        self.spectra_dataset[n:] = spectra
+        self.timestamps_dataset.resize(n + len(spectra), 0)
+        self.timestamps_dataset[n:] = timestamps
+        self.spectra_saved += len(spectra)
+        self.data_group.file.flush()
+
+    def run(self, *args, **kwargs):
+        if self.data_group is None or 'spectra' in self.data_group:
+            self.prepare_to_run()  # run() was called directly, rather than through start()
+        self.spectra_saved = 0
+        self.late_spectra = 0
+        self.data_group.attrs['start_time'] = datetime.datetime.now().isoformat()
+        start = time.monotonic()
+        next_time = start
+        spectra = None
+        timestamps = np.zeros(self.chunk_size)
+        in_chunk = 0
+        count = 0
+        try:
+            while self.num_spectra is None or count < self.num_spectra:
+                wait = next_time - time.monotonic()
+                if wait < 0:
+                    if count > 0 and self.interval > 0:
+                        self.late_spectra += 1
+                    next_time = time.monotonic()  # don't try to catch up on missed slots
+                self.wait_or_stop(max(wait, 0))
+                timestamp = time.monotonic() - start
+                spectrum = self.spectrometer.read_spectrum()
+                if spectra is None:
+                    self._create_datasets(spectrum)
+                    spectra = np.zeros((self.chunk_size, len(spectrum)))
+                spectra[in_chunk] = spectrum
+                timestamps[in_chunk] = timestamp
+                in_chunk += 1
+                count += 1
+                next_time += self.interval
+                self.latest_data = spectrum
+                if in_chunk == self.chunk_size:
+                    self._write_chunk(spectra, timestamps)
+                    in_chunk = 0
+        except ExperimentStopped:
+            self.log('Time series stopped after %d spectra' % count)
+        finally:
+            if spectra is not None:
+                self._write_chunk(spectra[:in_chunk], timestamps[:in_chunk])
+            self.data_group.attrs['number of spectra saved'] = self.spectra_saved
+            self.data_group.file.flush()
+        return self.data_group
@@ -71,7 +71,14 @@ class SMC100(SerialInstrument, Stage):
     about the units which is dependent on the STAGE. I only have TRB25CC, which
     has native units of mm. A more general implementation will move the move
     methods into a stage class.
+    Moves of several axes (controllers daisy-chained on the same port) are sent in one batch, and then the states of
+    all the axes are polled together, so all the axes move before we wait for any of them. Commands that aren't
+    acknowledged are still sent command_wait_time apart, so each axis starts moving that long after the previous one.
+    If your controllers take unacknowledged commands faster, command_wait_time can be reduced (to 0 for the axes to
+    start together).
     """
+    termination_character = '\r\n'
+    command_wait_time = COMMAND_WAIT_TIME_SEC  #: seconds between commands that aren't acknowledged
 
     def __init__(self, port, smcID=(1, ), **kwargs):
         """
@@ -154,13 +161,9 @@ class SMC100(SerialInstrument, Stage):
             done = False
             while not done:
                 if expect_response:
-                    self.ser.flushInput()
-
-                self.ser.flushOutput()
-
-                self.ser.write(tosend)
-                self.ser.write('\r\n')
+                    self.flush_input_buffer()
 
+                self._write(tosend)
                 self.ser.flush()
 
                 if expect_response:
@@ -182,7 +185,7 @@ class SMC100(SerialInstrument, Stage):
                     # we only need to delay when we are not waiting for a response
                     now = time.time()
                     dt = now - self._last_sendcmd_time
-                    dt = COMMAND_WAIT_TIME_SEC - dt
+                    dt = self.command_wait_time - dt
                     # print dt
                     if dt > 0:
                         time.sleep(dt)
@@ -211,7 +214,7 @@ class SMC100(SerialInstrument, Stage):
         line = str()
         # print 'reading line',
         while not done:
-            c = self.ser.read()
+            c = self.ser.read().decode('latin-1')
             # ignore \r since it is part of the line terminator
             if len(c) == 0:
                 raise SMC100ReadTimeOutException()
@@ -228,8 +231,8 @@ class SMC100(SerialInstrument, Stage):
 
     def _wait_states(self, targetstates, ignore_disabled_states=False):
         """
-        Waits for the controller to enter one of the the specified target state.
-        Controller state is determined via the TS command.
+        Waits for the controllers of all the axes to enter one of the the specified target states.
+        Controller states are determined via the TS command, which is sent to all the axes at once in each poll.
         If ignore_disabled_states is True, disable states are ignored. The normal
         behaviour when encountering a disabled state when not looking for one is
         for an exception to be raised.
@@ -241,35 +244,33 @@ class SMC100(SerialInstrument, Stage):
         UNLESS you were waiting for that state. This is because if we wait for
         READY_FROM_MOVING, and the stage gets stuck we transition into
         DISABLE_FROM_MOVING and then STAY THERE FOREVER.
-        The state encountered is returned.
+        The states encountered are returned, one per axis.
         """
-        starttime = time.time()
-        done = [False]*len(self.axis_names)
         self._logger.debug('waiting for states %s' % (str(targetstates)))
-        while not all(done):
-            for axes in range(len(self.axis_names)):
-                waittime = time.time() - starttime
-                if waittime > MAX_WAIT_TIME_SEC:
-                    raise SMC100WaitTimedOutException()
-
-                try:
-                    state = self.get_status()[axes][1]
-                    if state in targetstates:
-                        self._logger.debug('in state %s' % (state))
-                        done[axes] = True
-                        # return state
-                    elif not ignore_disabled_states:
-                        disabledstates = [
-                            STATE_DISABLE_FROM_READY,
-                            STATE_DISABLE_FROM_JOGGING,
-                            STATE_DISABLE_FROM_MOVING]
-                        if state in disabledstates:
-                            raise SMC100DisabledStateException(state)
-
-                except SMC100ReadTimeOutException:
-                    self._logger.info('Read timed out, retrying in 1 second')
-                    time.sleep(1)
-                    continue
+        disabledstates = [
+            STATE_DISABLE_FROM_READY,
+            STATE_DISABLE_FROM_JOGGING,
+            STATE_DISABLE_FROM_MOVING]
+
+        def done(reply):
+            # replies are <ID>TS<4 hex digits of errors><state>. Anything else (e.g. a read timing out) is polled again
+            if 'TS' not in reply or len(reply.split('TS', 1)[1]) != 6:
+                return False
+            state = reply[-2:]
+            if state in targetstates:
+                return True
+            elif not ignore_disabled_states and state in disabledstates:
+                raise SMC100DisabledStateException(state)
+            return False
+
+        queries = [str(axis) + 'TS?' for axis in self.axis_names]
+        try:
+            replies = self.wait_until_all(queries, done, timeout=MAX_WAIT_TIME_SEC)
+        except IOError:
+            raise SMC100WaitTimedOutException()
+        states = [reply[-2:] for reply in replies]
+        self._logger.debug('in states %s' % states)
+        return states
 
     def reset_and_configure(self):
         """
@@ -321,7 +322,7 @@ class SMC100(SerialInstrument, Stage):
         if 'waitStop' in kwargs and kwargs['waitStop']:
             # wait for the controller to be ready
             st = self._wait_states((STATE_READY_FROM_HOMING, STATE_READY_FROM_MOVING))
-            if st == STATE_READY_FROM_MOVING:
+            if STATE_READY_FROM_MOVING in st:
                 self.move([0]*len(self.axis_names), **kwargs)
         else:
             self.move([0]*len(self.axis_names), **kwargs)
@@ -348,18 +349,18 @@ class SMC100(SerialInstrument, Stage):
     def move(self, pos, axis=None, relative=False, waitStop=True):
         if axis is None:
             axis = self.axis_names
+        elif not hasattr(axis, '__iter__') or isinstance(axis, str):
+            axis = (axis, )
         if not hasattr(pos, '__iter__'):
             pos = [pos]
-        if relative:
-            index = 0
-            for ax in axis:
-                self._send_cmd('PR', axes=ax, argument=pos[index])
-                index += 1
-        else:
-            index = 0
-            for ax in axis:
-                self._send_cmd('PA', axes=ax, argument=pos[index])
-                index += 1
+        # the moves of all the axes are sent in one batch, still command_wait_time apart as in _send_cmd
+        wait = self.command_wait_time - (time.time() - self._last_sendcmd_time)
+        if wait > 0:
+            time.sleep(wait)
+        command = 'PR' if relative else 'PA'
+        self.send_batch([str(ax) + command + str(p) for ax, p in zip(axis, pos)], acknowledged=False,
+                        delay=self.command_wait_time)
+        self._last_sendcmd_time = time.time()
 
         if waitStop:
             # If we were previously homed, then something like PR0 will have no
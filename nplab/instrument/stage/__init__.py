@@ -17,7 +17,10 @@ from nplab.ui.widgets.position_widgets import XYZPositionWidget
 import inspect
 from functools import partial
 from nplab.utils.formatting import engineering_format
-import collections
+try:
+    from collections.abc import Sequence
+except ImportError:  # Python 2
+    from collections import Sequence
 
 
 class Stage(Instrument):
@@ -104,19 +107,19 @@ class Stage(Instrument):
     def get_axis_param(self, get_func, axis=None):
         if axis is None:
             return tuple(get_func(axis) for axis in self.axis_names)
-        elif isinstance(axis, collections.Sequence) and not isinstance(axis, str):
+        elif isinstance(axis, Sequence) and not isinstance(axis, str):
             return tuple(get_func(ax) for ax in axis)
         else:
             return get_func(axis)
 
     def set_axis_param(self, set_func, value, axis=None):
         if axis is None:
-            if isinstance(value, collections.Sequence):
+            if isinstance(value, (Sequence, np.ndarray)):
                 tuple(set_func(v, axis) for v,axis in zip(value, self.axis_names))
             else:
                 tuple(set_func(value, axis) for axis in self.axis_names)
-        elif isinstance(axis, collections.Sequence) and not isinstance(axis, str):
-            if isinstance(value, collections.Sequence):
+        elif isinstance(axis, Sequence) and not isinstance(axis, str):
+            if isinstance(value, (Sequence, np.ndarray)):
                 tuple(set_func(v, ax) for v,ax in zip(value, axis))
             else:
                 tuple(set_func(value, ax) for ax in axis)
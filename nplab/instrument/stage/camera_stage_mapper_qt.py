@@ -8,6 +8,8 @@ from past.utils import old_div
 import nplab.instrument.camera
 import nplab.instrument.stage
 from nplab.instrument import Instrument
+from nplab.utils.mosaic import TiledMosaic
+from nplab.instrument.camera import merit_functions
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
@@ -252,7 +254,7 @@ class CameraStageMapper(Instrument):
 
     ######## Image Tiling ############
     def acquire_tiled_image(self, n_images=(3,3), dest=None, overlap=0.33,
-                            autofocus_args={},live_plot=False, downsample=8):
+                            autofocus_args={},live_plot=False, downsample=8, stitch=False):
         """Raster-scan the stage and take images, which we can later tile.
 
         Arguments:
@@ -266,6 +268,10 @@ class CameraStageMapper(Instrument):
         @param: autofocus_args: A dictionary of keyword arguments for the
         autofocus that occurs before each image is taken.  Set to None to
         disable autofocusing.
+        @param: stitch: If True, register each tile against its neighbours
+        as it arrives and assemble them into a mosaic (a pyramid of datasets
+        called mosaic_0, mosaic_1... in dest), see nplab.utils.mosaic.  The
+        TiledMosaic is kept as self.mosaic.
         """
         reset_interactive_mode = live_plot and not matplotlib.is_interactive()
         if live_plot:
@@ -280,6 +286,7 @@ class CameraStageMapper(Instrument):
             centre_position = self.camera_centre_position()[0:2] #only 2D
             x_indices = np.arange(n_images[0]) - (n_images[0] - 1)/2.0
             y_indices = np.arange(n_images[1]) - (n_images[1] - 1)/2.0
+            self.mosaic = None
             for y_index in y_indices:
                 for x_index in x_indices:
                     position = centre_position + self.camera_point_displacement_to_sample(np.array([x_index, y_index]) * (1-overlap))
@@ -292,6 +299,13 @@ class CameraStageMapper(Instrument):
                                                attrs=self.camera.metadata)
                     tile.attrs.create("stage_position",self.stage.position)
                     tile.attrs.create("camera_centre_position",self.camera_centre_position())
+                    if stitch:
+                        if self.mosaic is None:
+                            scan_step = np.round(np.array(tile.shape[0:2]) * (1-overlap)).astype(int)
+                            self.mosaic = TiledMosaic(dest, tile.shape, n_images, scan_step, dtype=tile.dtype,
+                                                      max_shift=int(np.min(tile.shape[0:2]) * overlap / 5))
+                        self.mosaic.add_tile(tile[...], (x_index + (n_images[0] - 1)/2.0,
+                                                         y_index + (n_images[1] - 1)/2.0))
                     if live_plot:
                         #Plot the image, in sample coordinates
                         corner_points = np.array([self.camera_point_to_sample((xcorner,ycorner)) 
@@ -320,10 +334,8 @@ class CameraStageMapper(Instrument):
             img = self.camera.filter_function(self.camera.raw_image())
         else:
             img = self.camera.raw_image()
-        if np.shape(img)[-1]==3:
-            img = cv2.cvtColor(img,cv2.COLOR_BGR2GRAY)
 #        return np.sum((img - cv2.blur(img,(21,21))).astype(np.single)**2)
-        return np.sum(cv2.Laplacian(img, ddepth=cv2.CV_32F)**2)
+        return merit_functions.merit(img, 'squared_laplacian', channel_weights=merit_functions.BGR_LUMINANCE) * img.shape[0] * img.shape[1]
 
 
     def autofocus_in_background(self):
@@ -256,4 +256,155 @@ def locate_feature_in_image(image, feature, margin=0, restrict=False):
     peak = ndimage.measurements.center_of_mass(corr)  # take the centroid (NB this is of grayscale values, not binary)
     pos = np.array(peak) + image_shift + datum_pixel(feature) # return the position of the feature's datum point.
     return pos
-    
\ No newline at end of file
+    
+
+def _grayscale(image):
+    """Return a float32, 2D version of an image (averaging over colour channels if needed)"""
+    image = np.asarray(image)
+    if image.ndim == 3:
+        return image.mean(axis=2, dtype=np.float32)
+    return image.astype(np.float32)
+
+
+def _block_mean(image, factor):
+    """Downsample a 2D image by averaging blocks of factor x factor pixels (dropping any incomplete blocks)"""
+    if factor == 1:
+        return image
+    rows, cols = image.shape[0] // factor, image.shape[1] // factor
+    blocks = image[:rows * factor, :cols * factor].reshape(rows, factor, cols, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def _parabolic_peak(values):
+    """Sub-pixel offset of the peak of three equally spaced samples, the middle one being the largest"""
+    curvature = values[0] - 2 * values[1] + values[2]
+    if curvature >= 0:
+        return 0.0
+    return float(np.clip(0.5 * (values[0] - values[2]) / curvature, -0.5, 0.5))
+
+
+class FeatureTracker(object):
+    """Repeatedly find the same feature (small image) in a series of larger images.
+
+    This does the same job as `locate_feature_in_image`, but is intended for the case where one feature is looked for
+    many times, e.g. while centring on a feature or calibrating a stage.  The feature is converted to grayscale and
+    downsampled into a pyramid once, and the Fourier transform of each level of the pyramid is kept for each size of
+    search area it's used with.  Matching is done by normalised cross-correlation (so the result doesn't depend on the
+    brightness or contrast of the image), starting with a coarse search on a downsampled image, which is then refined
+    at higher resolution in a small window.
+
+    Each search is restricted to a region around a predicted position, which is either given or is where the feature
+    was last found.  If the match there is poor (its correlation coefficient is below ``min_quality``) the whole image
+    is searched instead.  After each call to `locate`, ``quality`` holds the correlation coefficient of the match
+    (1 is a perfect match).
+    """
+    def __init__(self, feature, search_radius=50, levels=3, min_quality=0.5, min_template_size=16):
+        """
+        :param feature: numpy.array, ideally an `ImageWithLocation`.  The feature to look for.
+        :param search_radius: int. How far (in pixels) from the predicted position we look before trying the whole
+            image.  None means always search the whole image.
+        :param levels: int. Maximum number of pyramid levels (each downsampled by a further factor of 2)
+        :param min_quality: float. Matches with a correlation coefficient below this trigger a full-image search
+        :param min_template_size: int. Pyramid levels where the feature would be smaller than this are not used
+        """
+        self.datum = datum_pixel(feature)
+        self.shape = np.array(feature.shape[:2])
+        self.search_radius = search_radius
+        self.min_quality = min_quality
+        gray = _grayscale(feature)
+        self.templates = []  # (zero-mean template, its norm) for each level of the pyramid
+        for level in range(levels):
+            template = _block_mean(gray, 2**level)
+            if level > 0 and min(template.shape) < min_template_size:
+                break
+            template = template - template.mean()
+            self.templates.append((template, np.sqrt(np.sum(template.astype(np.float64)**2))))
+        self._spectra = {}  # Fourier transform of each template, by (level, transform shape)
+        self.position = None
+        self.quality = None
+        self.full_image_searches = 0
+
+    def _template_spectrum(self, level, shape):
+        key = (level, shape)
+        if key not in self._spectra:
+            self._spectra[key] = np.conj(np.fft.rfft2(self.templates[level][0], s=shape))
+        return self._spectra[key]
+
+    def correlate(self, image, level=0):
+        """Normalised cross-correlation of a (grayscale, suitably downsampled) image with the template.
+
+        The result has one element for each position of the template that fits entirely in the image, and is the
+        correlation coefficient (between -1 and 1) of the template with that part of the image.
+        """
+        template, template_norm = self.templates[level]
+        h, w = template.shape
+        shape = tuple(int(n) for n in image.shape)
+        product = np.fft.irfft2(np.fft.rfft2(image, s=shape) * self._template_spectrum(level, shape), s=shape)
+        product = product[:shape[0] - h + 1, :shape[1] - w + 1]
+        # sums of the image, and its square, over each position of the template, from cumulative sums
+        sums = []
+        for power in (1, 2):
+            c = np.zeros((shape[0] + 1, shape[1] + 1))
+            c[1:, 1:] = np.cumsum(np.cumsum(image.astype(np.float64)**power, axis=0), axis=1)
+            sums.append(c[h:, w:] - c[:-h, w:] - c[h:, :-w] + c[:-h, :-w])
+        variance = np.clip(sums[1] - sums[0]**2 / (h * w), 0, None)  # times the number of pixels
+        denominator = np.sqrt(variance) * template_norm
+        return np.where(denominator > 1e-6 * (template_norm**2 + 1),
+                        product / np.maximum(denominator, 1e-30), 0)
+
+    def _match(self, image, corner_min, corner_max, level):
+        """Search for the template's corner between corner_min and corner_max (inclusive) at one pyramid level.
+
+        :return: the (full resolution) position of the template's corner, and the correlation coefficient there.
+        """
+        f = 2**level
+        size = np.array(self.templates[level][0].shape) * f
+        corner_min = np.clip(corner_min, 0, np.array(image.shape[:2]) - size).astype(int)
+        corner_max = np.clip(corner_max, corner_min, np.array(image.shape[:2]) - size).astype(int)
+        region = image[corner_min[0]:corner_max[0] + size[0], corner_min[1]:corner_max[1] + size[1], ...]
+        corr = self.correlate(_block_mean(_grayscale(region), f), level)
+        peak = np.array(np.unravel_index(np.argmax(corr), corr.shape))
+        quality = corr[tuple(peak)]
+        position = peak.astype(float)
+        if level == 0:
+            for axis in range(2):
+                if 0 < peak[axis] < corr.shape[axis] - 1:
+                    index = [peak[0], peak[1]]
+                    index[axis] = slice(peak[axis] - 1, peak[axis] + 2)
+                    position[axis] += _parabolic_peak(corr[tuple(index)])
+        return corner_min + position * f, quality
+
+    def _coarse_to_fine(self, image, corner_min, corner_max):
+        corner, quality = None, None
+        for level in reversed(range(len(self.templates))):
+            if corner is not None:
+                corner = np.round(corner)
+                corner_min, corner_max = corner - 2**(level + 1), corner + 2**(level + 1)
+            corner, quality = self._match(image, corner_min, corner_max, level)
+        return corner, quality
+
+    def locate(self, image, predicted_position=None):
+        """Find the feature and return the position of its datum (or centre) in the image's pixels.
+
+        :param image: numpy.array. The image in which to look, which must be larger than the feature.
+        :param predicted_position: 2-element array.  Where we expect the feature's datum pixel to be.  Defaults to
+            where it was last found; if it has not been found yet, the whole image is searched.
+        """
+        assert image.shape[0] > self.shape[0] and image.shape[1] > self.shape[1], "Image must be larger than feature!"
+        image = np.asarray(image)  # only the parts of the image that are searched get converted to grayscale
+        if predicted_position is None:
+            predicted_position = self.position
+        corner, quality = None, -np.inf
+        if predicted_position is not None and self.search_radius is not None:
+            predicted_corner = np.array(predicted_position) - self.datum
+            corner, quality = self._coarse_to_fine(image, predicted_corner - self.search_radius,
+                                                   predicted_corner + self.search_radius)
+        if quality < self.min_quality:
+            self.full_image_searches += 1
+            full_corner, full_quality = self._coarse_to_fine(image, np.zeros(2),
+                                                             np.array(image.shape[:2]) - self.shape)
+            if full_quality > quality:
+                corner, quality = full_corner, full_quality
+        self.position = corner + self.datum
+        self.quality = quality
+        return self.position
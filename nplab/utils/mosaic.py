@@ -0,0 +1,171 @@
+"""
+Tiled Mosaic
+============
+
+Stitches a grid of image tiles together while they are being acquired, rather than afterwards.  Each new tile is
+registered against the tiles next to it that are already in place, using `locate_feature_in_image` on the strips where
+they overlap (not the whole image), and is then written straight into a multi-resolution pyramid of chunked datasets.
+Level ``n`` of the pyramid is the full-resolution mosaic decimated by ``2**n`` (the same convention as
+`ImageWithLocation.downsample`), so a coarse level can be displayed or saved without ever reading the full mosaic back.
+
+Coordinates are the same as in `nplab.utils.image_with_location`: pixel positions are (row, column) in the full
+resolution mosaic, and a tile's position is the mosaic pixel that its [0,0] pixel lands on.  Tiles are addressed by
+their integer grid index, along the same axes as their pixel coordinates.
+"""
+from __future__ import division
+from builtins import object
+from builtins import range
+import numpy as np
+from nplab.utils.image_with_location import locate_feature_in_image, ensure_3d, _grayscale
+
+
+class TiledMosaic(object):
+    """A mosaic of image tiles, assembled into a chunked image pyramid as the tiles arrive."""
+    def __init__(self, dest, tile_shape, n_tiles, scan_step, dtype=np.uint8, levels=4, chunk_size=256,
+                 max_shift=50, overview_level=None, pixel_to_sample_matrix=None):
+        """
+        :param dest: HDF5 group in which to create the pyramid datasets (``mosaic_0``, ``mosaic_1``, ...)
+        :param tile_shape: shape of each tile, e.g. (rows, columns, 3) for a colour image
+        :param n_tiles: 2-tuple of int. Number of tiles along each axis
+        :param scan_step: 2-element array. Nominal displacement between adjacent tiles, in pixels
+        :param dtype: data type of the mosaic (should match the tiles)
+        :param levels: int. Number of pyramid levels, each one decimated by a further factor of 2
+        :param chunk_size: int. Size (in pixels along each axis) of the HDF5 chunks
+        :param max_shift: int. Largest correction to the nominal tile position that registration may make, in pixels.
+            The mosaic is padded by this much on each side.
+        :param overview_level: int. Pyramid level kept in memory as `overview` (defaults to the coarsest one)
+        :param pixel_to_sample_matrix: 4x4 array. If given, the pixel-to-sample matrix of a tile placed at its nominal
+            position for grid index (0,0); the matrix of the mosaic is then saved as an attribute of each level.
+        """
+        self.tile_shape = tuple(tile_shape)
+        self.n_tiles = tuple(n_tiles)
+        self.scan_step = np.array(scan_step, dtype=int)
+        self.max_shift = int(max_shift)
+        self.levels = int(levels)
+        self.overview_level = self.levels - 1 if overview_level is None else overview_level
+        self.origin = np.array([self.max_shift, self.max_shift])  # nominal position of tile (0,0)
+        self.shape = tuple((np.array(self.n_tiles) - 1) * self.scan_step + np.array(self.tile_shape[:2])
+                           + 2 * self.max_shift) + self.tile_shape[2:]
+        self.pyramid = []
+        for level in range(self.levels):
+            shape = self._level_shape(level)
+            chunks = tuple(min(chunk_size, n) for n in shape[:2]) + shape[2:]
+            dset = dest.create_dataset("mosaic_%d" % level, shape=shape, dtype=dtype, chunks=chunks)
+            dset.attrs['downsampling'] = 2**level
+            if pixel_to_sample_matrix is not None:
+                dset.attrs['pixel_to_sample_matrix'] = self._level_matrix(pixel_to_sample_matrix, level)
+            self.pyramid.append(dset)
+        self.overview = np.zeros(self._level_shape(self.overview_level), dtype=dtype)
+        self.positions = {}  # the position where each tile was placed, by grid index
+        self.registration_shifts = {}  # the correction made by registration, relative to the nominal position
+        self._gray_tiles = {}  # grayscale copies of recent tiles, used to register their neighbours
+
+    def _level_shape(self, level):
+        f = 2**level
+        return tuple(-(-n // f) for n in self.shape[:2]) + self.shape[2:]
+
+    def _level_matrix(self, pixel_to_sample_matrix, level):
+        """The pixel-to-sample matrix for a level of the pyramid"""
+        M = np.array(pixel_to_sample_matrix, dtype=float)
+        # mosaic pixel 0 is at tile (0,0) pixel -origin
+        M[3, :3] += np.dot(ensure_3d(-self.origin), M[:3, :3])
+        M[:2, :3] *= 2**level
+        return M
+
+    def nominal_position(self, grid_index):
+        """The position of a tile if the stage moved exactly by the scan step"""
+        return self.origin + np.array(grid_index) * self.scan_step
+
+    def register_tile(self, gray_tile, grid_index):
+        """Work out where a tile should go, by matching it to its neighbours that are already in place.
+
+        Each neighbour that overlaps the tile gives an estimate of the tile's position; these are averaged.  Neighbours
+        whose overlap is too small, or too featureless, to match reliably are ignored, and if no neighbour can be used
+        the tile is placed at its nominal position, corrected by the shift of its neighbours (so that stage drift
+        doesn't tear the mosaic apart).
+
+        :param gray_tile: 2D float32 array
+        :param grid_index: 2-tuple of int
+        :return: integer position of the tile in the mosaic
+        """
+        nominal = self.nominal_position(grid_index)
+        estimates, neighbour_shifts = [], []
+        m = self.max_shift
+        for axis in range(2):
+            for direction in (-1, 1):
+                neighbour_index = tuple(np.array(grid_index) + direction * np.eye(2, dtype=int)[axis])
+                if neighbour_index not in self._gray_tiles:
+                    continue
+                neighbour = self._gray_tiles[neighbour_index]
+                neighbour_position = self.positions[neighbour_index]
+                neighbour_shifts.append(self.registration_shifts[neighbour_index])
+                # expected position of the tile, assuming it moved relative to its neighbour by the scan step
+                expected = neighbour_position - direction * np.eye(2, dtype=int)[axis] * self.scan_step
+                # overlap of the two tiles, in the coordinates of the new tile, shrunk so it can move by max_shift
+                offset = expected - neighbour_position
+                start = np.maximum(0, -offset) + m
+                stop = np.minimum(gray_tile.shape, np.array(neighbour.shape) - offset) - m
+                if np.any(stop - start < 8):
+                    continue  # not enough overlap to register
+                feature = gray_tile[start[0]:stop[0], start[1]:stop[1]]
+                if feature.std() < 1e-3 * (np.abs(feature).mean() + 1):
+                    continue  # featureless
+                search = neighbour[start[0] + offset[0] - m:stop[0] + offset[0] + m,
+                                   start[1] + offset[1] - m:stop[1] + offset[1] + m]
+                try:
+                    found = locate_feature_in_image(search, feature, margin=m)
+                except AssertionError:
+                    continue  # the correlation was flat, so there's nothing to match
+                # found is the centre of the feature in the search strip; had the tile been exactly where we
+                # expected, it would be at the centre of the strip.
+                shift = found - (np.array(search.shape) - 1) // 2
+                if np.all(np.isfinite(shift)) and np.all(np.abs(shift) <= m):
+                    estimates.append(expected + shift)
+        if len(estimates) > 0:
+            return np.round(np.mean(estimates, axis=0)).astype(int)
+        if len(neighbour_shifts) > 0:
+            return np.round(nominal + np.mean(neighbour_shifts, axis=0)).astype(int)
+        return nominal
+
+    def add_tile(self, tile, grid_index, register=True):
+        """Register a tile against its neighbours and write it into every level of the pyramid.
+
+        :param tile: image array (with shape `tile_shape`)
+        :param grid_index: 2-tuple of int. Position of the tile in the grid
+        :param register: bool. If False, place the tile at its nominal position
+        :return: integer position of the tile in the (full resolution) mosaic
+        """
+        tile = np.asarray(tile)
+        grid_index = tuple(int(round(i)) for i in grid_index)
+        gray_tile = _grayscale(tile)
+        if register:
+            position = self.register_tile(gray_tile, grid_index)
+        else:
+            position = self.nominal_position(grid_index)
+        position = np.clip(position, 0, np.array(self.shape[:2]) - tile.shape[:2])
+        self.positions[grid_index] = position
+        self.registration_shifts[grid_index] = position - self.nominal_position(grid_index)
+        self._gray_tiles[grid_index] = gray_tile
+        self._forget_old_tiles(grid_index)
+
+        for level, dset in enumerate(self.pyramid):
+            region, decimated = self._decimate(tile, position, level)
+            dset[region] = decimated
+            if level == self.overview_level:
+                self.overview[region] = decimated
+        return position
+
+    def _decimate(self, tile, position, level):
+        """The slice of a pyramid level covered by a tile, and the tile decimated to fit in it"""
+        f = 2**level
+        start = -(-position // f)  # first pyramid pixel whose full resolution pixel falls in the tile
+        stop = -(-(position + np.array(tile.shape[:2])) // f)
+        first = start * f - position  # the pixel in the tile that lands on it
+        region = (slice(start[0], stop[0]), slice(start[1], stop[1]))
+        return region, tile[first[0]::f, first[1]::f, ...]
+
+    def _forget_old_tiles(self, grid_index):
+        """Only keep the tiles that a future tile could overlap with (i.e. the last two rows of the scan)"""
+        for index in list(self._gray_tiles.keys()):
+            if abs(index[1] - grid_index[1]) > 1:
+                del self._gray_tiles[index]
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Background polling of slowly-changing instrument status, e.g. the temperature of a cooled camera.
+
+An instrument makes one StatusPoller, with a function to read each status value. Once started, the poller reads them
+all every `interval` seconds in a background thread, and publishes them as a new dictionary (poller.values), together
+with the time they were read (poller.updated, and poller.read_times for each value). Publishing replaces the dictionary rather than changing it, so GUIs and
+metadata can read the latest values at any time without taking any lock, or talking to the instrument:
+
+>>> poller = StatusPoller(dict(temperature=camera.read_temperature), interval=2)
+>>> poller.start()
+>>> poller.values['temperature']
+>>> with poller.paused():  # no polling during a time-critical acquisition
+>>>     camera.capture()
+>>> poller.wait_until(lambda values: values['temperature'] < -60)
+
+Readers should not be called directly while the poller is running, as they would compete with it for the instrument.
+"""
+from builtins import object
+import contextlib
+import logging
+import threading
+import time
+
+
+class StatusPoller(object):
+    def __init__(self, readers, interval=1., logger=None):
+        """
+        :param readers: dictionary of status names and functions (with no arguments) that read them
+        :param interval: seconds between polls
+        :param logger: to log failed reads to. Defaults to this module's logger
+        """
+        self.readers = dict(readers)
+        self.interval = interval
+        self._logger = logger if logger is not None else logging.getLogger(__name__)
+        self.values = dict()  # replaced, never modified, on each poll
+        self.updated = None  # time.time() of the last poll
+        self.read_times = dict()  # time.time() each value in self.values started being read, replaced with it
+        self._poll_started = None  # time.time() the last published values started being read
+        self._pauses = 0
+        self._pause_lock = threading.Lock()
+        self._polled = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        """Whether the polling thread is running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def is_paused(self):
+        return self._pauses > 0
+
+    def start(self, interval=None):
+        """Starts polling in a background thread, if it isn't already
+
+        :param interval: seconds between polls. Defaults to self.interval
+        """
+        if interval is not None:
+            self.interval = interval
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='StatusPoller')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stops polling, waiting for the current poll to finish. The last values are kept"""
+        self._stop.set()
+        if self.running and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.is_paused:
+                self.poll()
+            self._stop.wait(self.interval)
+
+    def poll(self):
+        """Reads every status value now, and publishes them. Values that fail to be read keep their previous value
+        (for display), and the time it was read in read_times
+
+        :return: the new values
+        """
+        started = time.time()
+        values = dict(self.values)
+        read_times = dict(self.read_times)
+        for name, reader in list(self.readers.items()):
+            try:
+                read_started = time.time()
+                values[name] = reader()
+                read_times[name] = read_started
+            except Exception as e:
+                self._logger.warning('Failed to read %s: %s' % (name, e))
+        with self._polled:
+            self.values = values
+            self.read_times = read_times
+            self.updated = time.time()
+            self._poll_started = started
+            self._polled.notify_all()
+        return values
+
+    def pause(self):
+        """Stops polling until resume is called (as many times as pause). A poll that has already started will
+        finish"""
+        with self._pause_lock:
+            self._pauses += 1
+
+    def resume(self):
+        with self._pause_lock:
+            self._pauses = max(0, self._pauses - 1)
+
+    @contextlib.contextmanager
+    def paused(self):
+        """Context manager pausing the polling while it runs, e.g. during an acquisition"""
+        self.pause()
+        try:
+            yield
+        finally:
+            self.resume()
+
+    def wait_until(self, condition, timeout=None, callback=None):
+        """Waits for a condition on the status values to be true, polling in the background meanwhile (the poller is
+        started if needed, and stopped again afterwards). Only values read after this is called are checked, so a
+        value published before e.g. a set point was changed can't satisfy the condition. Nothing is read while the
+        poller is paused, so this waits for it to be resumed - for ever if timeout is None and nothing resumes it
+
+        :param condition: function of the values dictionary returning True when done waiting. Values that haven't
+            been read successfully since this was called are missing from the dictionary
+        :param timeout: maximum seconds to wait, or None to wait for ever
+        :param callback: function called with the values after each poll, e.g. to print progress
+        :return: the values that satisfied the condition
+        """
+        called = time.time()
+        started = not self.running
+        self.start()
+        expiry = None if timeout is None else called + timeout
+        try:
+            last_update = None
+            while True:
+                with self._polled:
+                    while self.updated == last_update or self._poll_started is None or self._poll_started < called:
+                        remaining = None if expiry is None else expiry - time.time()
+                        if remaining is not None and remaining <= 0:
+                            raise IOError('Timed out waiting for the status')
+                        self._polled.wait(remaining if remaining is not None else self.interval)
+                    last_update = self.updated
+                    values = dict((name, value) for name, value in self.values.items()
+                                  if self.read_times[name] >= called)
+                if callback is not None:
+                    callback(values)
+                if condition(values):
+                    return values
+        finally:
+            if started:
+                self.stop()
@@ -0,0 +1,143 @@
+import time
+import numpy as np
+import pytest
+from nplab.instrument.camera.Andor import Andor
+from nplab.instrument.camera.Andor.andor_sdk import ImageRingBuffer
+from nplab.instrument.camera.Andor.mock_dll import MockAndorDLL, IMAGE_STEP
+from nplab.instrument.camera.track_extraction import random_tracks
+
+
+@pytest.fixture
+def camera():
+    camera = Andor(dll=MockAndorDLL(detector_shape=(64, 32)))
+    camera.set_andor_parameter('OutAmp', 0)
+    return camera
+
+
+def expected_images(n_images, image_shape):
+    size = int(np.prod(image_shape))
+    return np.array([np.arange(size) + k * IMAGE_STEP for k in range(n_images)]).reshape((n_images,) + image_shape)
+
+
+def test_capture(camera):
+    images, n_images, image_shape = camera.capture()
+    assert (n_images, image_shape) == (1, (32, 64))
+    assert images.dtype == np.int32
+    assert np.all(images == expected_images(1, (32, 64)))
+
+    camera.set_andor_parameter('ReadMode', 0)
+    camera.set_andor_parameter('AcquisitionMode', 3)
+    camera.set_andor_parameter('NKin', 5)
+    images, n_images, image_shape = camera.capture()
+    assert np.all(images == expected_images(5, (64, )))
+    # a buffer of the right size is written into, instead of allocating a new one
+    reused, _, _ = camera.capture(out=images)
+    assert np.shares_memory(reused, images)
+
+
+def test_raw_snapshot(camera):
+    camera.set_andor_parameter('OutAmp', 1)
+    success, image = camera.raw_snapshot()
+    assert success
+    assert np.all(image == expected_images(1, (32, 64))[0, :, ::-1])
+
+
+def test_ring_buffer():
+    ring = ImageRingBuffer(4, (2, ))
+    first = 0
+    while first < 9:
+        slots = ring.next_slots(min(3, 9 - first))
+        assert len(slots) == min(3, 9 - first, 4 - first % 4)
+        slots[:] = np.arange(first, first + len(slots))[:, np.newaxis]
+        ring.commit(first, len(slots))
+        first += len(slots)
+    frames, indices = ring.get_all()
+    assert list(indices) == [5, 6, 7, 8]
+    assert np.all(frames[:, 0] == indices)
+    assert ring.latest()[1] == 8
+
+
+def test_stream_kinetic_series(camera):
+    camera.dll.frames_per_poll = 3
+    camera.set_andor_parameter('AcquisitionMode', 3)
+    camera.set_andor_parameter('NKin', 10)
+    received = []
+    for index, images in camera.stream_kinetic_series(ring_size=4, poll_interval=0):
+        assert index == len(received)
+        received.extend(np.copy(images))
+    assert np.all(np.array(received) == expected_images(10, (32, 64)))
+    frames, indices = camera.image_ring.get_all()
+    assert list(indices) == [6, 7, 8, 9]
+    assert np.all(frames == expected_images(10, (32, 64))[6:])
+    assert 'AbortAcquisition' not in camera.dll.calls
+
+
+def test_stream_until_abort(camera):
+    camera.dll.frames_per_poll = 2
+    camera.set_andor_parameter('AcquisitionMode', 5)
+    for index, images in camera.stream_kinetic_series(poll_interval=0):
+        if index >= 6:
+            break
+    assert camera.dll.calls[-1] == 'AbortAcquisition'
+    assert not camera.dll.acquiring
+
+
+def test_parameter_cache(camera):
+    camera.snapshot_parameters()
+    calls = len(camera.dll.calls)
+    snapshot = camera.snapshot_parameters()
+    assert len(camera.dll.calls) == calls
+    assert snapshot['DetectorShape'] == (64, 32) and snapshot['Exposure'] == 1
+
+    # setting a parameter writes it through, and invalidates what depends on it
+    camera.set_andor_parameter('EMGain', 20)
+    calls = len(camera.dll.calls)
+    assert camera.get_andor_parameter('EMGain') == 20
+    assert len(camera.dll.calls) == calls
+    camera.set_andor_parameter('Exposure', 0.5)
+    assert camera.get_andor_parameter('Exposure') == 0.5
+    camera.set_andor_parameter('ReadMode', 0)
+    camera.get_andor_parameter('AcquisitionTimings')
+    assert camera.dll.calls[-2:] == ['SetReadMode', 'GetAcquisitionTimings']
+    # values read with different inputs are cached separately
+    camera.set_andor_parameter('OutAmp', 1)
+    assert len(camera.get_andor_parameter('HSSpeeds')) == 3
+    camera.set_andor_parameter('OutAmp', 0)
+    assert len(camera.get_andor_parameter('HSSpeeds')) == 2
+
+    camera.cooler = 0
+    assert camera.get_andor_parameter('CurrentTemperature') == 20
+
+
+def test_dll_calls_per_frame(camera):
+    for i in range(3):
+        camera.raw_snapshot()
+        camera.get_metadata()
+    assert camera.last_frame_dll_calls == 3  # StartAcquisition, WaitForAcquisition, GetAcquiredData
+
+
+def test_extract_tracks(camera):
+    camera.tracks = random_tracks([3, 4, 11, 15])
+    camera.raw_snapshot()
+    spectra = camera.extract_tracks()
+    image = expected_images(1, (32, 64))[0]
+    assert np.all(spectra == [image[2:4].sum(axis=0), image[10:15].sum(axis=0)])
+    # frames read with a vertical ROI and binning
+    camera.set_andor_parameter('Image', 1, 2, 1, 64, 9, 16)
+    binned = image[8:16].reshape(4, 2, 64).sum(axis=1)
+    assert np.all(camera.extract_tracks(binned, random_tracks([11, 14])) == image[10:14].sum(axis=0))
+
+
+def test_temperature_polling(camera):
+    camera.status_poller.start(interval=0.05)
+    try:
+        values = camera.status_poller.wait_until(lambda values: 'CurrentTemperature' in values, timeout=5)
+        expected = -80 if camera.dll.cooler else 20
+        assert values['CurrentTemperature'] == expected
+        # while the poller keeps it up to date, reading the temperature doesn't call the DLL
+        time.sleep(0.01)
+        calls = camera.dll_calls['GetTemperature']
+        assert camera.CurrentTemperature == expected
+        assert camera.dll_calls['GetTemperature'] == calls
+    finally:
+        camera.status_poller.stop()
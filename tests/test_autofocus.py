@@ -0,0 +1,36 @@
+import gc
+import numpy as np
+from scipy import ndimage
+from nplab.instrument.camera import DummyCamera
+from nplab.instrument.stage import DummyStage
+from nplab.instrument.camera.camera_with_location import CameraWithLocation
+
+
+def _simulated_microscope():
+    """A DummyCamera that sees a sample which blurs as a (3-axis) DummyStage moves away from z=1"""
+    stage = DummyStage()
+    stage.axis_names = ('x', 'y', 'z')
+    stage._position = np.zeros(3)
+    sample = ndimage.gaussian_filter(np.random.RandomState(0).rand(120, 160), 1)
+
+    class DefocusingCamera(DummyCamera):
+        def raw_snapshot(self):
+            image = ndimage.gaussian_filter(sample, 0.5 + 2 * abs(stage.position[2] - 1)) * 255
+            return True, np.repeat(image[:, :, np.newaxis], 3, axis=2).astype(np.uint8)
+    return CameraWithLocation(DefocusingCamera(), stage)
+
+
+def test_adaptive_autofocus():
+    cwl = _simulated_microscope()
+    for method in ("brent", "golden", "parabola"):
+        cwl.stage.move([0, 0, 0])
+        shift, positions, powers = cwl.adaptive_autofocus(method, search_range=6, tolerance=0.05)
+        assert abs(cwl.stage.position[2] - 1) < 0.1, "{} didn't find the focus".format(method)
+        assert len(positions) == cwl.autofocus_engine.history[-1]['images']
+    cwl.stage.move([0, 0, 0])
+    cwl.adaptive_autofocus("sweep", search_range=6, sweep_time=0.2)
+    assert abs(cwl.stage.position[2] - 1) < 0.3
+    record = cwl.autofocus_engine.history[-1]
+    assert record['moves'] == record['stage_commands'] + 2  # every step of the sweep, to its start, and to the focus
+    del cwl
+    gc.collect()  # so that other tests don't find these instruments
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from nplab.instrument.spectrometer.calibrated_axis import CalibratedAxisCache
+
+
+class FakeSpectrograph(object):
+    def __init__(self):
+        self.center_wavelength = 700.
+        self.calls = 0
+
+    def GetCalibration(self):
+        self.calls += 1
+        return list(self.center_wavelength + 0.1 * (np.arange(1600) - 800))
+
+
+def test_calibration_is_read_once():
+    spectrograph = FakeSpectrograph()
+    cache = CalibratedAxisCache(spectrograph.GetCalibration)
+    wavelengths = np.array(spectrograph.GetCalibration())
+    for i in range(3):
+        assert np.all(cache.axis() == wavelengths)
+        shifts = cache.axis('shift', laser_wavelength=632.8, reverse=True)
+        assert np.allclose(shifts, (1. / (632.8e-9) - 1. / (wavelengths[::-1] * 1e-9)) / 100)
+        assert np.allclose(cache.axis('cm-1'), 1e7 / wavelengths)
+    assert spectrograph.calls == 2 and cache.reads == 1
+    assert cache.axis('shift', laser_wavelength=632.8, reverse=True) is shifts
+    with pytest.raises(ValueError):
+        shifts[0] = 0
+
+    binned = cache.axis(binning=4, roi=(100, 899))
+    assert np.allclose(binned, wavelengths[100:900].reshape(200, 4).mean(axis=1))
+    assert np.allclose(cache.axis(binning=4, roi=(100, 899), reverse=True), binned[::-1])
+
+    spectrograph.center_wavelength = 800.
+    cache.invalidate()
+    assert np.allclose(cache.axis()[800], 800.)
+    assert cache.reads == 2
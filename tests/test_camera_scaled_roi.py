@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from nplab.instrument.camera.camera_scaled_roi import DummyCameraRoiScale
+
+
+@pytest.fixture
+def camera():
+    camera = DummyCameraRoiScale('image', detector_shape=(64, 32))
+    yield camera
+    camera.close()
+
+
+def test_software_roi_is_a_view(camera):
+    frame = np.arange(32 * 64).reshape(32, 64)
+    camera.roi = (10, 30, 4, 12)
+    cropped = camera.filter_function(frame)
+    assert cropped.shape == (8, 20)
+    assert np.shares_memory(cropped, frame)
+    np.testing.assert_array_equal(cropped, frame[4:12, 10:30])
+
+
+def test_software_binning(camera):
+    frame = np.arange(32 * 64).reshape(32, 64)
+    camera.roi = (10, 31, 4, 12)
+    camera.binning = (2, 4)
+    binned = camera.filter_function(frame)
+    expected = frame[4:12, 10:30].reshape(2, 4, 10, 2).sum(axis=(1, 3))
+    np.testing.assert_array_equal(binned, expected)
+    spectrum = np.arange(64)
+    np.testing.assert_array_equal(camera.filter_function(spectrum), spectrum[10:30].reshape(10, 2).sum(axis=1))
+
+
+def test_hardware_roi(camera):
+    camera.hardware_roi = True
+    camera.roi = (10, 30, 4, 12)
+    camera.binning = 2
+    assert camera.filter_function is None
+    camera.latest_raw_frame = camera.raw_snapshot()[1]
+    assert camera.latest_frame.shape == (4, 10)
+
+
+def test_roi_axes_are_cached(camera):
+    camera.roi = (10, 30, 4, 12)
+    camera.binning = (2, 1)
+    x_axis, y_axis = camera.roi_axes()
+    np.testing.assert_array_equal(x_axis, np.arange(11, 31).reshape(10, 2).mean(axis=1))
+    assert y_axis is None
+    assert camera.roi_axes()[0] is x_axis
+    camera._x_axis = np.arange(1600) * 2.
+    assert camera.roi_axes()[0] is not x_axis
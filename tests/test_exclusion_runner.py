@@ -0,0 +1,75 @@
+import numpy as np
+import h5py
+from nplab.analysis.particle_exclusion.exclusion_runner import Criterion, ExclusionRunner
+
+
+class BrightnessCriterion(Criterion):
+    '''rejects particles whose image is too bright'''
+    name = 'brightness'
+
+    def __init__(self, threshold=0.5, smooth=1):
+        self.threshold = threshold
+        self.smooth = smooth
+
+    def parameters(self):
+        return {'smooth': self.smooth}
+
+    def read(self, group):
+        return group['image'][()]
+
+    def features(self, image):
+        return {'mean': image.mean() * self.smooth, 'profile': image.mean(axis=0)}
+
+    def scores(self, features):
+        return features['mean']
+
+    def reject(self, scores):
+        return scores > self.threshold
+
+
+def _scan(n):
+    f = h5py.File('test_exclusion_runner.h5', 'w', driver='core', backing_store=False)
+    scan = f.create_group('ParticleScannerScan_0')
+    for i in range(n):
+        scan.create_group(f'Particle_{i}').create_dataset('image', data=np.full((4, 5), i / n))
+    return f, scan
+
+
+def test_exclusion_runner(monkeypatch):
+    f, scan = _scan(10)
+    criterion = BrightnessCriterion()
+    results = {}
+    for processes in (0, 2):
+        store = f.create_group(f'exclusion_{processes}')
+        runner = ExclusionRunner(scan, [criterion], store=store, processes=processes, batch_size=3)
+        results[processes] = runner.run()
+    assert results[0] == results[2] == {f'Particle_{i}' for i in range(6, 10)}
+    names, features = runner.features('brightness')
+    assert list(names) == [f'Particle_{i}' for i in range(10)]
+    assert features['profile'].shape == (10, 5)
+    assert list(store['brightness/rejected']) == [False] * 6 + [True] * 4
+
+    # new thresholds reuse the cached features, new particles are added, new parameters recompute everything
+    with monkeypatch.context() as m:
+        m.setattr(BrightnessCriterion, 'read', lambda self, group: 1 / 0)
+        criterion.threshold = 0.75
+        assert runner.run() == {'Particle_8', 'Particle_9'}
+    scan.create_group('Particle_10').create_dataset('image', data=np.ones((4, 5)))
+    assert 'Particle_10' in runner.run()
+    criterion.smooth = 0.5
+    assert runner.run() == set()
+    assert len(store['rejected']) == 0
+
+
+def test_sidecar_store_is_closed(tmp_path):
+    with h5py.File(tmp_path / 'data.h5', 'w') as f:
+        scan = f.create_group('ParticleScannerScan_0')
+        for i in range(4):
+            scan.create_group(f'Particle_{i}').create_dataset('image', data=np.full((4, 5), i / 4))
+        runner = ExclusionRunner(scan, [BrightnessCriterion()], processes=0)
+        assert runner.run() == {'Particle_3'}
+        assert runner.store is None
+        with h5py.File(tmp_path / 'data_exclusion.h5', 'r') as store:  # closed, so it can be opened read-only
+            assert list(store['ParticleScannerScan_0/rejected'].asstr()) == ['Particle_3']
+        assert runner.run() == {'Particle_3'}  # and reopened
+        assert len(runner.features('brightness')[0]) == 4
@@ -35,6 +35,27 @@ def test_metadata_slicing():
     assert np.all(sliced_iwl.datum_location == sample_iwl.datum_location), \
         "The position shift was incorrect for step==2"
 
+def test_feature_tracker():
+    from scipy import ndimage
+    from nplab.utils.image_with_location import FeatureTracker
+    sample = ndimage.gaussian_filter(np.random.RandomState(0).rand(400, 500), 3)
+    image = ImageWithLocation(sample[50:350, 50:450])
+    image.pixel_to_sample_matrix = np.identity(4)
+    feature = image[100:160, 150:230]
+    tracker = FeatureTracker(feature, search_radius=20)
+    assert np.allclose(tracker.locate(image), feature.datum_pixel + np.array([100, 150]), atol=0.01)
+    assert tracker.quality > 0.99
+    # a small sub-pixel shift is found in the predicted region, without searching the whole image
+    shifted = ndimage.shift(sample, (2.3, -4.6))[50:350, 50:450]
+    position = tracker.locate(shifted)
+    assert np.allclose(position, feature.datum_pixel + np.array([102.3, 145.4]), atol=0.1)
+    assert tracker.full_image_searches == 1
+    # a large shift needs the whole image to be searched
+    shifted = sample[0:300, 120:520]
+    position = tracker.locate(shifted)
+    assert np.allclose(position, feature.datum_pixel + np.array([150, 80]), atol=0.01)
+    assert tracker.full_image_searches == 2
+
 if __name__ == "__main__":
     try:
         test_metadata_slicing()
@@ -0,0 +1,35 @@
+import numpy as np
+from scipy import ndimage
+from nplab.instrument.camera import merit_functions
+
+
+def test_stack_matches_single_images():
+    rng = np.random.RandomState(0)
+    sharp = (ndimage.gaussian_filter(rng.rand(60, 80), 1) * 255).astype(np.uint8)
+    stack = np.array([ndimage.uniform_filter(sharp, size) for size in (1, 3, 5)])
+    colour_stack = np.repeat(stack[..., np.newaxis], 3, axis=3)
+    roi = merit_functions.centred_roi(stack.shape[1:], (40, 40))
+    for name in merit_functions.METRICS:
+        values = merit_functions.merit(colour_stack, name, roi=roi, binning=2)
+        assert np.all(np.diff(values) < 0), "{} doesn't decrease with blur".format(name)
+        for image, value in zip(stack, values):
+            assert np.isclose(merit_functions.merit(image, name, roi=roi, binning=2), value, rtol=1e-4)
+
+
+def test_no_copy():
+    stack = np.random.rand(2, 30, 40).astype(np.float32)
+    prepared = merit_functions.prepare(stack, roi=(slice(5, 25), slice(10, 30)))
+    assert np.shares_memory(prepared, stack)
+
+
+def test_colour_dtypes():
+    rng = np.random.RandomState(1)
+    gray = ndimage.gaussian_filter(rng.rand(40, 50), 1) * 1000
+    for dtype in (np.float64, np.int32, np.uint8):
+        colour = np.stack([gray, gray * 0.5, gray * 0.25], axis=2).astype(dtype)
+        expected = merit_functions.merit(colour.astype(np.float64).mean(axis=2), 'squared_laplacian')
+        assert np.isclose(merit_functions.merit(colour, 'squared_laplacian'), expected, rtol=1e-4)
+        assert np.isfinite(merit_functions.merit(colour[np.newaxis], 'tenengrad', binning=2)).all()
+        weighted = merit_functions.merit(colour, 'squared_laplacian', channel_weights=merit_functions.BGR_LUMINANCE)
+        luminance = np.dot(colour.astype(np.float64), merit_functions.BGR_LUMINANCE)
+        assert np.isclose(weighted, merit_functions.merit(luminance, 'squared_laplacian'), rtol=1e-4)
@@ -5,7 +5,9 @@ Created on Thu Apr 09 22:37:15 2015
 @author: rwb27
 """
 
-from nplab.instrument.message_bus_instrument import EchoInstrument
+import numpy as np
+
+from nplab.instrument.message_bus_instrument import EchoInstrument, reply_parser
 
 
 def test_parsing():
@@ -17,3 +19,22 @@ def test_parsing():
     assert e.parsed_query("tell me 0x17","tell me %x") == 23
     assert e.parsed_query("tell me 010","%i") == 8
     assert e.parsed_query("tell me 010","%o") == 8
+
+
+def test_reply_parsers_are_reused():
+    parser = reply_parser("%f on attempt number %d")
+    assert reply_parser("%f on attempt number %d") is parser
+    assert parser.parse("result was 49.56 on attempt number 7") == (49.56, 7)
+    assert parser.parse_array(["1.5 on attempt number 1", "2.5 on attempt number 2"]).tolist() == [[1.5, 1], [2.5, 2]]
+    assert reply_parser(r"(\d+)-(\d+)", parse_function=int).parse("12-34") == (12, 34)
+
+
+def test_array_query_and_latencies():
+    e = EchoInstrument()
+    assert np.array_equal(e.array_query("1.5,2,-3e2"), [1.5, 2, -300])
+    assert np.array_equal(e.array_query("1 2 3", dtype=int, delimiter=None), [1, 2, 3])
+    for _ in range(3):
+        e.float_query("quotient is 485.24")
+    counts, edges = e.query_latencies.histogram("quotient is 485.24")
+    assert counts.sum() == 3 and len(edges) == len(counts) + 1
+    assert sorted(n for query, n, mean, longest in e.query_latencies.summary()) == [1, 1, 3]
@@ -0,0 +1,33 @@
+import numpy as np
+import h5py
+from scipy import ndimage
+from nplab.utils.mosaic import TiledMosaic
+
+
+def _random_texture(shape, seed=0):
+    texture = ndimage.gaussian_filter(np.random.RandomState(seed).rand(*shape), 2)
+    return ((texture - texture.min()) / (texture.max() - texture.min()) * 255).astype(np.uint8)
+
+
+def test_tiles_are_registered():
+    sample = _random_texture((900, 1000))
+    f = h5py.File('test_mosaic.h5', 'w', driver='core', backing_store=False)
+    tile_shape = (200, 240)
+    mosaic = TiledMosaic(f, tile_shape + (3, ), (3, 3), (140, 180), max_shift=15, levels=3)
+    rng = np.random.RandomState(1)
+    errors = {}
+    for j in range(3):
+        for i in range(3):
+            error = rng.randint(-8, 9, 2)  # the stage doesn't go exactly where it's told
+            corner = mosaic.nominal_position((i, j)) + error + 100
+            tile = sample[corner[0]:corner[0] + tile_shape[0], corner[1]:corner[1] + tile_shape[1], np.newaxis]
+            mosaic.add_tile(np.repeat(tile, 3, axis=2), (i, j))
+            errors[(i, j)] = error
+    for index, error in errors.items():
+        assert np.all(mosaic.registration_shifts[index] - mosaic.registration_shifts[(0, 0)]
+                      == error - errors[(0, 0)]), "Tile {} was misplaced".format(index)
+    # every level of the pyramid is a decimated copy of the full resolution mosaic
+    full = f['mosaic_0'][...]
+    for level in range(1, 3):
+        assert np.all(f['mosaic_%d' % level][...] == full[::2**level, ::2**level])
+    assert np.all(mosaic.overview == f['mosaic_2'][...])
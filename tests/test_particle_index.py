@@ -0,0 +1,56 @@
+import numpy as np
+import h5py
+from nplab.analysis import Spectrum
+from nplab.analysis.particle_index import ParticleScanIndex, open_index, sidecar_path
+
+
+def _add_particle(scan, i, rng):
+    group = scan.create_group(f'Particle_{i}')
+    dataset = group.create_dataset('lab.z_scan0', data=rng.rand(4, 50) + 1)
+    dataset.attrs['wavelengths'] = np.linspace(400, 900, 50)
+    dataset.attrs['background'] = np.full(50, 0.5)
+    dataset.attrs['reference'] = np.full(50, 2. + i)  # differs between particles
+    if i % 2:
+        group.create_dataset('image', data=np.zeros((8, 8)))
+
+
+def test_particle_index():
+    f = h5py.File('test_particle_index.h5', 'w', driver='core', backing_store=False)
+    scan = f.create_group('ParticleScannerScan_0')
+    rng = np.random.RandomState(0)
+    for i in range(5):
+        _add_particle(scan, i, rng)
+    scan.create_group('not_a_particle')
+    index = ParticleScanIndex(scan, f.create_group('index'), stacked=('lab.z_scan0', ))
+    assert index.update() == 5
+    for i in range(5, 12):
+        _add_particle(scan, i, rng)
+    assert index.update() == 7 and index.update() == 0
+    assert list(index.particle_ids) == list(range(12))
+    assert list(index.has('image')) == [bool(i % 2) for i in range(12)]
+    assert np.ndim(index.attr('lab.z_scan0', 'background')) == 1  # stored once
+    assert index.attr('lab.z_scan0', 'reference').shape == (12, 50)
+    assert np.all(index.read('Particle_3', 'image') == 0)
+
+    batches = list(index.iter_spectra('lab.z_scan0', batch_size=5))
+    assert len(batches) == 3
+    names = np.concatenate([batch[0] for batch in batches])
+    spectra = np.concatenate([batch[1] for batch in batches])
+    for name, spectrum in zip(names, spectra):
+        expected = Spectrum.from_h5(scan[name]['lab.z_scan0'])
+        assert np.allclose(spectrum, expected)
+    assert np.all(batches[0][1].wl == expected.wl)
+
+
+def test_open_index_closes_sidecar(tmp_path):
+    with h5py.File(tmp_path / 'data.h5', 'w') as f:
+        scan = f.create_group('ParticleScannerScan_0')
+        rng = np.random.RandomState(0)
+        for i in range(3):
+            _add_particle(scan, i, rng)
+        with open_index(scan) as index:
+            assert len(index) == 3
+            sidecar = index.group.file
+        assert not sidecar  # closed
+        with h5py.File(sidecar_path(scan), 'r') as index_file:  # and can be opened again
+            assert len(index_file['ParticleScannerScan_0/particle_id']) == 3
@@ -0,0 +1,62 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy.optimize import check_grad
+from nplab.analysis.SERS_Fitting import lineshapes
+from nplab.analysis.SERS_Fitting.peaks_and_bg_fitting import fullfit, peak_search_loss
+from nplab.analysis.SERS_Fitting.Auto_Fit_Raman import Multi_L_Constant
+
+
+def test_peak_search_gradient():
+    x = np.linspace(200, 1800, 1600)
+    target = np.sin(x / 50)
+    for lineshape in 'LG':
+        for params in ([5, 700.3, 12], [2, 1000.6, 3]):
+            params = np.array(params, dtype=float)
+            error = check_grad(lambda p: peak_search_loss(p, x, target, lineshape)[0],
+                               lambda p: peak_search_loss(p, x, target, lineshape)[1], params)
+            assert error < 1e-4 * np.linalg.norm(peak_search_loss(params, x, target, lineshape)[1])
+
+
+def _fit(executor=None):
+    x = np.linspace(200, 1800, 1600)
+    ff = fullfit(np.zeros_like(x), x, lineshape='L', executor=executor)
+    ff.signal = ff.L(x, 100, 650, 8) + ff.L(x, 300, 1200, 10)
+    ff.peaks, ff.peak_bounds, ff.bound = [[300, 1200, 10]], [], None
+    ff.noise_threshold, ff.width, ff.minwidth, ff.maxwidth = 5, 16, 2, 20
+    ff.min_peak_spacing, ff.regions, ff.verbose = 3, 16, False
+    np.random.seed(0)
+    ff.add_new_peak()
+    return ff
+
+
+def test_add_new_peak():
+    ff = _fit()
+    assert ff.peak_added
+    assert np.allclose(ff.peaks[-1], [100, 650, 8], rtol=0.02)
+    with ThreadPoolExecutor(2) as executor:
+        assert np.allclose(_fit(executor).peaks[-1], ff.peaks[-1])
+
+
+def test_lineshapes_kernel():
+    x = np.linspace(200, 1800, 1600)
+    params = np.array([3., 5, 700, 12, 2, 1000, 30])
+    lorentzians = 3 + sum(H / (1 + ((x - C) / W)**2) for H, C, W in params[1:].reshape(-1, 3))
+    assert np.allclose(Multi_L_Constant(x, *params), lorentzians)
+    # other parameter orders and gaussian widths, as used by the other SERS_Fitting modules
+    cwh = np.concatenate([[3.], params[1:].reshape(-1, 3)[:, [1, 2, 0]].ravel()])
+    assert np.allclose(lineshapes.model(x, cwh, 'L', constant=True, order='CWH'), lorentzians)
+    assert np.allclose(lineshapes.model(x, params[1:], 'G', gaussian_factor=0.5),
+                       sum(H * np.exp(-0.5 * ((x - C) / W)**2) for H, C, W in params[1:].reshape(-1, 3)))
+    for lineshape in 'LG':
+        f, jac = lineshapes.curve_fit_functions(lineshape, constant=True, order='CWH')
+        step = 1e-6 * np.maximum(np.abs(cwh), 1)
+        numerical = np.array([(f(x, *(cwh + dp)) - f(x, *(cwh - dp))) / (2 * step[i])
+                              for i, dp in enumerate(np.diag(step))]).T
+        assert np.allclose(jac(x, *cwh), numerical, atol=1e-6)
+    # a batch of models sharing the x axis
+    batch = params * np.linspace(0.9, 1.1, 4)[:, np.newaxis]
+    values, jacobians = lineshapes.model_and_jacobian(x, batch, constant=True)
+    assert values.shape == (4, 1600) and jacobians.shape == (4, 1600, 7)
+    for p, v, j in zip(batch, values, jacobians):
+        assert np.allclose(v, lineshapes.model(x, p, constant=True))
+        assert np.allclose(j, lineshapes.jacobian(x, p, constant=True))
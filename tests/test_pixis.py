@@ -0,0 +1,45 @@
+import numpy as np
+from nplab.instrument.camera.Picam.pixis import Pixis
+from nplab.instrument.camera.Picam.simulated_picam import SimulatedPicam
+
+
+def expected_frame(index, width=16, height=4):
+    return ((np.arange(width * height) + index) % 65536).reshape(height, width)
+
+
+def test_current_frame():
+    pixis = Pixis(dll=SimulatedPicam(width=16, height=4), with_start_up=True)
+    frame = pixis.GetCurrentFrame()
+    assert frame.shape == (4, 16)
+    assert np.all(frame == expected_frame(0))
+    pixis.ShutDown()
+
+
+def test_continuous_acquisition():
+    dll = SimulatedPicam(width=16, height=4, readouts_per_update=3)
+    pixis = Pixis(dll=dll, with_start_up=True)
+    frames = [np.copy(frame) for frame in pixis.continuous_frames(10, buffer_frames=4)]
+    assert len(frames) == 10
+    for index, frame in enumerate(frames):
+        assert np.all(frame == expected_frame(index))
+    assert not pixis.bolContinuous and not dll.running
+    assert pixis.readout_stats['readouts'] >= 10 and pixis.readout_stats['camera_rate'] == 100
+
+    # frames are views into the circular buffer, unless they're copied
+    pixis.StartContinuousAcquisition(buffer_frames=8)
+    view = pixis.WaitForReadouts()
+    copy = pixis.WaitForReadouts(copy=True)
+    assert len(view) == 3 and np.shares_memory(view, pixis.frame_buffer)
+    assert not np.shares_memory(copy, pixis.frame_buffer)
+    assert np.all(copy[0] == expected_frame(3))
+    pixis.ShutDown()
+    assert not dll.running
+
+
+def test_get_spectrum():
+    pixis = Pixis(dll=SimulatedPicam(width=16, height=4), with_start_up=True)
+    pixis.boundary_cut = 2
+    spectrum, offsets = pixis.get_spectrum(y_min=1, y_max=3)
+    assert np.allclose(spectrum, expected_frame(0)[1:3].mean(axis=0)[2:-2])
+    assert len(offsets) == len(spectrum)
+    pixis.ShutDown()
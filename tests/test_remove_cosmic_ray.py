@@ -0,0 +1,63 @@
+import numpy as np
+from scipy.ndimage import gaussian_filter
+from nplab.analysis import Spectrum, remove_cosmic_ray
+
+
+def _reference_remove_cosmic_ray(spectrum, thresh=5, smooth=30, max_iterations=10):
+    '''the original, one spectrum at a time implementation'''
+    _len = len(spectrum)
+    cleaned = np.copy(spectrum)
+    for i in range(max_iterations):
+        noise_spectrum = cleaned / gaussian_filter(cleaned, smooth)
+        noise_level = np.sqrt(np.var(noise_spectrum))
+        mean_noise = noise_spectrum.mean()
+        spikes = np.arange(_len)[noise_spectrum > mean_noise + (thresh * noise_level)]
+        rays = set()
+        for spike in spikes:
+            for side in (-1, 1):
+                step = 0
+                while 0 <= (coord := spike + (side * step)) <= _len - 1:
+                    if noise_spectrum[coord] > mean_noise + noise_level:
+                        rays.add(coord)
+                        step += 1
+                    else:
+                        break
+        rays = list(rays)
+        if rays:
+            cleaned[rays] = gaussian_filter(cleaned, smooth)[rays]
+            continue
+        return cleaned
+    return cleaned
+
+
+def _spectra(n, rng):
+    x = np.linspace(0, 1, 400)
+    spectra = 1000 * np.exp(-(x - 0.5)**2 / 0.02) + 100 + rng.normal(0, 5, (n, len(x)))
+    for spectrum in spectra:
+        for ray in range(rng.randint(0, 4)):
+            start = rng.randint(len(x))
+            spectrum[start:start + rng.randint(1, 6)] += rng.uniform(50, 2000)
+    return x, spectra
+
+
+def test_remove_cosmic_ray_matches_reference():
+    rng = np.random.RandomState(0)
+    x, spectra = _spectra(50, rng)
+    for thresh, max_iterations in ((5, 10), (2, 10), (0.5, 3)):
+        for data in (spectra, spectra.astype(int)):
+            expected = np.array([_reference_remove_cosmic_ray(s, thresh, 30, max_iterations) for s in data])
+            cleaned = remove_cosmic_ray(data, thresh=thresh, max_iterations=max_iterations)
+            assert cleaned.dtype == expected.dtype
+            assert np.array_equal(cleaned, expected)
+            assert np.array_equal(remove_cosmic_ray(data[3], thresh=thresh, max_iterations=max_iterations),
+                                  expected[3])
+    assert not np.array_equal(expected, spectra)  # something was actually removed
+
+
+def test_spectrum_remove_cosmic_ray():
+    x, spectra = _spectra(6, np.random.RandomState(1))
+    stack = Spectrum(spectra.reshape(2, 3, -1), x)
+    cleaned = stack.remove_cosmic_ray()
+    assert isinstance(cleaned, Spectrum) and np.all(cleaned.wl == x)
+    assert np.array_equal(cleaned.reshape(6, -1), [_reference_remove_cosmic_ray(s) for s in spectra])
+    assert np.array_equal(stack, spectra.reshape(2, 3, -1))  # not modified in place
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("serial")
+from nplab.instrument.serial_instrument import SerialInstrument
+from nplab.instrument.simulated_serial_device import SimulatedSerialDevice
+
+
+class FastSerialInstrument(SerialInstrument):
+    port_settings = dict(timeout=0.05)
+
+
+def binary_block(data):
+    length = str(len(data)).encode()
+    return b'#' + str(len(length)).encode() + length + data + b'\n'
+
+
+REPLIES = {
+    'two lines?': 'first\nsecond',
+    'partial?': b'no termination',
+    'curve?': b'CURVE ' + binary_block(np.arange(1000, dtype='>i2').tobytes()),
+    'indefinite?': b'#0' + b'\x01\x02\x03\n',
+}
+
+
+@pytest.fixture
+def instrument():
+    device = SimulatedSerialDevice(REPLIES.get)
+    instrument = FastSerialInstrument(device.port)
+    yield instrument
+    instrument.close()
+    device.close()
+
+
+def test_readline_keeps_leftover_bytes(instrument):
+    assert instrument.query('two lines?') == 'first'
+    assert instrument.readline().strip() == 'second'
+    assert instrument.query('partial?') == 'no termination'  # returned once the port times out
+
+
+def test_binary_blocks(instrument):
+    curve = instrument.query_binary_block('curve?', dtype='>i2')
+    assert np.array_equal(curve, np.arange(1000))
+    assert len(instrument._read_buffer) == 0  # the termination after the block is consumed
+    assert instrument.query_binary_block('indefinite?') == b'\x01\x02\x03'
+    with pytest.raises(IOError):
+        instrument.query_binary_block('unknown?')
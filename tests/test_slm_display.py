@@ -0,0 +1,44 @@
+import numpy as np
+from scipy.interpolate import interp1d
+
+from nplab.utils.gui import get_qt_app
+from nplab.instrument.electronics.SLM import SlmDisplay
+
+
+def _interpolated_gray_levels(display, phase):
+    """Grey levels as SlmDisplay computed them before the LUT was tabulated: the LUT evaluated at every pixel"""
+    phase = (phase + 0.1*np.pi / 2 ** 8) % (2 * np.pi) - 0.1*np.pi / 2 ** 8
+    phase -= np.pi
+    if isinstance(display.LUT, interp1d):
+        phase = np.clip(phase, np.min(display.LUT.x), np.max(display.LUT.x))
+    return display.LUT(phase).astype(np.uint8)
+
+
+def test_tabulated_lut_matches_interpolation():
+    app = get_qt_app()
+    rng = np.random.RandomState(0)
+    phase = rng.uniform(-4 * np.pi, 4 * np.pi, (64, 96))
+    lut_phases = np.linspace(-np.pi, np.pi, 20)
+    for lut in [(256, 0), (200, 20), np.array([lut_phases, 127 + 100 * np.sin(lut_phases / 2)])]:
+        display = SlmDisplay(shape=(96, 64), lut=lut)
+        tabulated = display.phase_to_gray_level(phase).astype(int)
+        interpolated = _interpolated_gray_levels(display, phase).astype(int)
+        difference = np.abs((tabulated - interpolated + 128) % 256 - 128)  # grey levels wrap around
+        assert difference.max() <= 1  # pixels within a phase bin of a grey level boundary can round either way
+        assert np.mean(difference) < 0.01
+        display.close()
+
+
+def test_returned_gray_levels_are_not_aliased():
+    app = get_qt_app()
+    display = SlmDisplay(shape=(96, 64))
+    first = display.set_image(np.zeros((64, 96)))
+    display._set_image(first, 0.)  # what the queued update_image signal does
+    assert not np.shares_memory(first, display._buffer)
+    kept = first.copy()
+    second = display.set_image(np.full((64, 96), np.pi))
+    display._set_image(second, 0.)
+    assert np.array_equal(first, kept)  # the caller's frame isn't overwritten by the next one
+    first[...] = 7
+    assert np.array_equal(display._buffer, second)  # and the caller can't change the frame on display
+    display.close()
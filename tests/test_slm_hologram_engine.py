@@ -0,0 +1,44 @@
+import numpy as np
+from nplab.instrument.electronics.SLM.hologram_engine import HologramEngine, get_engine
+from nplab.instrument.electronics.SLM import pattern_generators
+
+
+def _spot_targets(n, shape):
+    targets = np.zeros((n, ) + shape)
+    for indx, target in enumerate(targets):
+        target[shape[0] // 2 + indx + 1, shape[1] // 2 - indx - 2] = 1
+        target[shape[0] // 2 - 3, shape[1] // 2 + 2 * indx] = 1
+    return targets
+
+
+def test_batched_matches_single():
+    shape = (48, 64)
+    engine = HologramEngine(shape)
+    targets = _spot_targets(3, shape)
+    batched = engine.mraf(targets, iterations=5)
+    for target, phase in zip(targets, batched):
+        single = engine.mraf(target, iterations=5)
+        assert np.allclose(np.exp(1j * phase), np.exp(1j * single))
+
+
+def test_shared_engine():
+    shape = (32, 40)
+    assert get_engine(shape) is get_engine(list(shape))
+    phase = pattern_generators.mraf(np.zeros(shape), _spot_targets(1, shape)[0], iterations=2)
+    assert phase.shape == shape
+
+
+def test_early_stopping():
+    shape = (48, 64)
+    engine = HologramEngine(shape)
+    engine.gerchberg_saxton(_spot_targets(2, shape), iterations=500, tolerance=1e-6)
+    assert engine.iterations_run < 500
+    assert len(engine.convergence) == engine.iterations_run
+
+
+def test_shared_engines_are_bounded():
+    from nplab.instrument.electronics.SLM import hologram_engine
+    engines = [get_engine((8, 8 + indx)) for indx in range(hologram_engine.MAX_ENGINES + 2)]
+    assert len(hologram_engine._engines) == hologram_engine.MAX_ENGINES
+    assert get_engine((8, 8 + hologram_engine.MAX_ENGINES + 1)) is engines[-1]
+    assert get_engine((8, 8)) is not engines[0]  # the least recently used were dropped
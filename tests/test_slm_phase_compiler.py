@@ -0,0 +1,36 @@
+import numpy as np
+from nplab.instrument.electronics.SLM import pattern_generators
+from nplab.instrument.electronics.SLM.phase_compiler import PhaseCompiler
+from nplab.instrument.electronics.SLM.basis_cache import BasisCache
+
+
+def _reference(shape, options, parameters):
+    phase = np.zeros(shape)
+    for option in options:
+        phase = getattr(pattern_generators, option)(phase, *parameters[option])
+    return phase
+
+
+def test_only_changed_terms_recomputed():
+    shape = (60, 80)
+    options = ['gratings', 'focus', 'zernike', 'linear_lut']
+    parameters = dict(gratings=(10, -20), focus=(1e-3, ), zernike=({(2, 2): 1., (3, -1): 0.5}, ),
+                      linear_lut=(1., 0.))
+    compiler = PhaseCompiler(shape)
+    assert np.allclose(compiler.compile(options, parameters), _reference(shape, options, parameters))
+
+    parameters['focus'] = (2e-3, )
+    assert np.allclose(compiler.compile(options, parameters), _reference(shape, options, parameters))
+    assert compiler.recompute_counts['focus'] == 2
+    assert compiler.recompute_counts['gratings'] == 1
+    assert compiler.recompute_counts['zernike'] == 1
+
+
+def test_basis_cache_memory_bound():
+    cache = BasisCache(max_bytes=3 * 8 * 100)
+    for indx in range(5):
+        cache.get(indx, np.ones, 100)
+    assert cache.nbytes <= cache.max_bytes
+    assert cache.misses == 5
+    cache.get(4, np.ones, 100)
+    assert cache.hits == 1
@@ -0,0 +1,70 @@
+import re
+import time
+
+import numpy as np
+
+import pytest
+
+pytest.importorskip("serial")
+from nplab.instrument.simulated_serial_device import SimulatedSerialDevice
+from nplab.instrument.stage.SMC100 import SMC100
+
+MOVE_TIME = 0.3
+
+
+class SimulatedSMC100Chain(object):
+    """Daisy-chained SMC100 controllers: each move takes MOVE_TIME, and every command takes the device some time"""
+    def __init__(self, axes=(1, 2, 3)):
+        self.positions = dict((str(axis), 0.) for axis in axes)
+        self.move_ends = dict((str(axis), 0.) for axis in axes)
+        self.move_times = []
+
+    def __call__(self, command):
+        axis, name, argument = re.match(r'(\d+)([A-Z]{2})(.*)', command).groups()
+        if name == 'ID':
+            return command[:-1] + 'TRB25CC'
+        elif name in ('PA', 'PR'):
+            self.positions[axis] = float(argument) + (self.positions[axis] if name == 'PR' else 0)
+            self.move_ends[axis] = time.time() + MOVE_TIME
+            self.move_times.append(time.time())
+        elif name == 'TS':
+            state = '28' if time.time() < self.move_ends[axis] else '33'  # moving, or ready from moving
+            return axis + 'TS0000' + state
+        elif name == 'TP':
+            return axis + 'TP' + str(self.positions[axis])
+
+
+@pytest.fixture
+def device():
+    device = SimulatedSerialDevice(SimulatedSMC100Chain(), termination='\r\n', latency=0.005)
+    device.chain = device.respond  # the simulated controllers
+    yield device
+    device.close()
+
+
+def test_batched_move(device):
+    stage = SMC100(device.port, smcID=(1, 2, 3))
+    stage.command_wait_time = 0.05
+    try:
+        del device.commands[:]
+        start = time.time()
+        stage.move([1, 2, 3])
+        elapsed = time.time() - start
+        assert device.commands[:3] == ['1PA1', '2PA2', '3PA3']
+        assert np.all(np.diff(device.chain.move_times) >= 0.045)  # the commands are still spaced out
+        assert MOVE_TIME <= elapsed < 2 * MOVE_TIME  # but the axes move together, not one after another
+        assert stage.get_position() == [1., 2., 3.]
+    finally:
+        stage.close()
+
+
+def test_batched_query_and_send(device):
+    stage = SMC100(device.port, smcID=(1, 2, 3))
+    try:
+        assert stage.batched_query(['1TP?', '2TP?', '3TP?']) == ['1TP0.0', '2TP0.0', '3TP0.0']
+        batch = stage.send_batch(['1ID?', '2ID?'], block=False)
+        assert batch.sent.wait(1)
+        assert batch.wait(1) == ['1IDTRB25CC', '2IDTRB25CC']
+        assert batch.done
+    finally:
+        stage.close()
@@ -0,0 +1,56 @@
+import time
+import numpy as np
+from nplab.instrument.spectrometer.acquisition import SpectrumRingBuffer, MultiSpectrometerAcquisition
+
+
+class FakeSpectrometer(object):
+    def __init__(self, period):
+        self.period = period
+
+    def read_spectrum(self):
+        time.sleep(self.period)
+        return np.ones(10) * time.time()
+
+    def log(self, message, level='info'):
+        print(message)
+
+
+def test_ring_buffer():
+    buffer = SpectrumRingBuffer(capacity=5)
+    for indx in range(7):
+        buffer.append(np.ones(3) * indx, float(indx))
+    spectra, timestamps = buffer.get_all()
+    assert list(timestamps) == [2, 3, 4, 5, 6]
+    assert np.all(spectra[:, 0] == timestamps)
+    spectrum, timestamp = buffer.nearest(3.2)
+    assert timestamp == 3 and spectrum[0] == 3
+
+
+def test_aligned_frames():
+    acquisition = MultiSpectrometerAcquisition([FakeSpectrometer(0.01), FakeSpectrometer(0.03)], tolerance=0.05)
+    with acquisition:
+        frame = acquisition.wait_for_frame(timeout=2)
+        time.sleep(0.2)
+    assert not acquisition.running
+    assert frame is not None and frame.spread <= 0.05
+    frames = acquisition.aligned_frames()
+    assert len(frames) > 0
+    for frame in frames:
+        assert len(frame.spectra) == 2
+        assert frame.spread <= 0.05
+
+
+def test_latest_frame_without_acquisition():
+    import h5py
+    import nplab
+    from nplab.instrument.spectrometer import Spectrometers, DummySpectrometer
+    # spectrometers open the current datafile
+    nplab.datafile.set_current(h5py.File('spectrometers.h5', 'w', driver='core', backing_store=False))
+    try:
+        spectrometers = Spectrometers([DummySpectrometer()])
+        assert spectrometers.latest_frame() is None
+        assert spectrometers.latest_frame(wait=True, timeout=0.1) is None
+        spectrometers.stop_acquisition()
+        assert spectrometers.latest_frame(processed=True) is None
+    finally:
+        nplab.close_current_datafile()
@@ -0,0 +1,67 @@
+import numpy as np
+from scipy.signal import correlate
+from nplab.experiment.fiber_raman.spectrum_stitcher import SpectrumStitcher, interpolate_invalid_shifts
+
+
+def test_correlation_shift_matches_correlate():
+    rng = np.random.RandomState(0)
+    for n in (64, 65):
+        stitcher = SpectrumStitcher(n_pixels=n)
+        for i in range(20):
+            a = rng.rand(n)
+            b = np.roll(a, rng.randint(-n // 2, n // 2)) + 0.3 * rng.rand(n)
+            xcorr = correlate(a, b, mode="same")
+            expected = int(np.round(np.round(n / 2.0) - np.argmax(xcorr)))
+            assert stitcher.correlation_shift(stitcher._window(a), stitcher._window(b)) == expected
+
+
+def test_interpolate_invalid_shifts():
+    assert list(interpolate_invalid_shifts([-120, -50, -130, -10], -105)) == [0, -120, -125, -130, -130]
+
+
+def test_incremental_stitching():
+    rng = np.random.RandomState(1)
+    true = np.convolve(rng.rand(5000)**8 * 100, np.ones(9), 'same') + 1
+    n, step = 500, 120
+    stitcher = SpectrumStitcher(threshold=-100)
+    for i in range(12):
+        stitcher.add(500 + i, true[i * step:i * step + n])
+    assert list(stitcher.offsets) == [i * step for i in range(12)]
+    assert np.allclose(stitcher.merged, true[:11 * step + n])
+    # changing the threshold re-uses the stored shifts, and changing it back gives the same result
+    merged = stitcher.merged.copy()
+    stitcher.set_threshold(-200)
+    assert list(stitcher.offsets) == [0] * 12
+    stitcher.set_threshold(-100)
+    assert np.all(stitcher.merged == merged)
+    assert stitcher.pixel_to_index(502.5, 10) == int(np.round(2.5 * step)) + 10
+
+
+def test_aligner_compute_shifts():
+    from nplab.experiment.fiber_raman import spectrum_aligner, spectrum_aligner2
+    rng = np.random.RandomState(2)
+    true = np.convolve(rng.rand(3000)**8 * 100, np.ones(9), 'same') + 1
+    n, step = 500, 120
+    spectra = [true[i * step:i * step + n] for i in range(8)]
+    spectra[4] = np.ones(n)  # no features, so its shifts fail and are interpolated
+    for aligner in (spectrum_aligner, spectrum_aligner2):
+        inds, shifts = aligner.compute_shifts(spectra, threshold=-100)
+        assert list(inds) == [0, 1, 5]  # the shifts either side of the flat spectrum (and some others) fail
+        assert list(shifts) == [0] + [-step] * 7
+
+
+def test_restitching_with_unchanged_offsets():
+    rng = np.random.RandomState(3)
+    true = np.convolve(rng.rand(2000)**8 * 100, np.ones(9), 'same') + 1
+    stitcher = SpectrumStitcher(threshold=-100)
+    for i in range(5):
+        stitcher.add(500 + i, true[i * 120:i * 120 + 500])
+    offsets, merged = stitcher.offsets.copy(), stitcher.merged.copy()
+    for threshold in (-100, -101):  # the same threshold, and one that classifies every shift the same way
+        stitcher.set_threshold(threshold)
+        assert np.array_equal(stitcher.offsets, offsets) and np.array_equal(stitcher.merged, merged)
+
+    single = SpectrumStitcher(threshold=-100)
+    assert single.add(500, true[:500]) == 0
+    single.set_threshold(-50)
+    assert np.array_equal(single.merged, true[:500])
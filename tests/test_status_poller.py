@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+from nplab.utils.status_poller import StatusPoller
+
+
+class Counter(object):
+    def __init__(self):
+        self.value = 0
+
+    def __call__(self):
+        self.value += 1
+        return self.value
+
+
+def test_poll_publishes_new_values():
+    counter = Counter()
+    poller = StatusPoller(dict(count=counter, broken=lambda: 1 / 0))
+    values = poller.values
+    assert poller.poll() == dict(count=1)
+    assert values == dict()  # published values are replaced, not changed
+    assert poller.values['count'] == 1 and poller.updated is not None
+
+
+def test_background_polling_and_pausing():
+    counter = Counter()
+    poller = StatusPoller(dict(count=counter), interval=0.01)
+    poller.start()
+    try:
+        assert poller.wait_until(lambda values: values['count'] >= 3, timeout=5)['count'] >= 3
+        with poller.paused():
+            time.sleep(0.05)  # any poll already started finishes
+            paused_count = counter.value
+            time.sleep(0.1)
+            assert counter.value == paused_count
+        assert poller.wait_until(lambda values: values['count'] > paused_count, timeout=5)
+    finally:
+        poller.stop()
+    assert not poller.running
+
+
+def test_wait_until_starts_and_stops_polling():
+    poller = StatusPoller(dict(count=Counter()), interval=0.01)
+    seen = []
+    assert poller.wait_until(lambda values: values['count'] == 2, callback=seen.append)['count'] == 2
+    assert [values['count'] for values in seen] == [1, 2]
+    assert not poller.running
+    with pytest.raises(IOError):
+        poller.wait_until(lambda values: False, timeout=0.05)
+    assert not poller.running
+
+
+def test_wait_until_ignores_stale_values():
+    status = dict(value='Locked')
+    poller = StatusPoller(dict(status=lambda: status['value']), interval=0.02)
+    poller.start()
+    try:
+        poller.wait_until(lambda values: values.get('status') == 'Locked', timeout=5)
+        status['value'] = 'Unlocked'  # e.g. after changing the set point; 'Locked' is still published
+        start = time.time()
+        with pytest.raises(IOError):
+            poller.wait_until(lambda values: values['status'] == 'Locked', timeout=0.2)
+        assert time.time() - start >= 0.2
+        assert poller.values['status'] == 'Unlocked'
+    finally:
+        poller.stop()
+
+
+def test_wait_until_with_failed_reads():
+    poller = StatusPoller(dict(temperature=lambda: 1 / 0), interval=0.01)
+    with pytest.raises(IOError):
+        poller.wait_until(lambda values: values.get('temperature', -273) >= -20, timeout=0.1)
+    assert poller.values == dict() and not poller.running
+
+
+def test_wait_until_ignores_values_that_failed_to_refresh():
+    status = dict(value='Locked')
+
+    def read_status():
+        if status['value'] is None:
+            raise IOError('no reply')
+        return status['value']
+    poller = StatusPoller(dict(status=read_status), interval=0.02)
+    poller.poll()
+    status['value'] = None  # e.g. the instrument stops replying after the set point is changed
+    with pytest.raises(IOError):
+        poller.wait_until(lambda values: values.get('status') == 'Locked', timeout=0.2)
+    assert poller.values['status'] == 'Locked'  # still published for display
+    assert poller.read_times['status'] < poller.updated - 0.1
@@ -0,0 +1,67 @@
+import time
+
+import h5py
+import numpy as np
+import pytest
+
+from nplab.instrument.spectrometer.time_series import StreamingTimeSeries
+
+
+class FakeSpectrometer(object):
+    """Takes period seconds to read each spectrum, whose pixels are all its number (from 1)"""
+    def __init__(self, period=0., n_pixels=16):
+        self.period = period
+        self.n_pixels = n_pixels
+        self.spectra_read = 0
+        self.metadata = dict(integration_time=10)
+        self.file = h5py.File('time_series.h5', 'w', driver='core', backing_store=False)
+
+    def read_spectrum(self):
+        time.sleep(self.period)
+        self.spectra_read += 1
+        return np.full(self.n_pixels, float(self.spectra_read))
+
+    def create_data_group(self, name, attrs=None):
+        group = self.file.create_group(name % 0)
+        group.attrs.update(attrs)
+        return group
+
+
+@pytest.fixture
+def spectrometer():
+    spectrometer = FakeSpectrometer()
+    yield spectrometer
+    spectrometer.file.close()
+
+
+def test_chunked_datasets_and_timestamps(spectrometer):
+    series = StreamingTimeSeries(spectrometer, num_spectra=25, interval=0.01, chunk_size=10)
+    group = series.run()
+    spectra, timestamps = group['spectra'], group['timestamps']
+    assert spectra.chunks == (10, 16) and spectra.maxshape == (None, 16)
+    assert spectra.shape == (25, 16) and timestamps.shape == (25, )  # two full chunks, and the rest at the end
+    assert np.array_equal(spectra[:, 0], np.arange(1, 26))
+    slots = np.arange(25) * 0.01
+    assert np.all(timestamps[()] >= slots - 1e-3)  # never before its slot on the interval's grid
+    assert timestamps[-1] < slots[-1] + 0.05  # and late spectra don't delay the rest
+    assert group.attrs['number of spectra saved'] == 25
+    assert group.attrs['number of spectra'] == 25 and group.attrs['integration_time'] == 10
+
+
+def test_streaming_until_stopped(spectrometer):
+    spectrometer.period = 0.002
+    series = StreamingTimeSeries(spectrometer, num_spectra=None, interval=0, chunk_size=5)
+    series.start()
+    deadline = time.time() + 5
+    while series.spectra_saved < 10 and time.time() < deadline:
+        time.sleep(0.01)
+    assert series.running
+    assert series.spectra_saved % 5 == 0  # written a chunk at a time while running
+    series.stop(join=True)
+    assert not series.running
+    group = series.data_group
+    saved = group.attrs['number of spectra saved']
+    assert saved == spectrometer.spectra_read >= 10  # the last, partial chunk is written when stopped
+    assert group['spectra'].shape == (saved, 16) and group['timestamps'].shape == (saved, )
+    assert np.array_equal(group['spectra'][:, 0], np.arange(1, saved + 1))
+    assert np.all(np.diff(group['timestamps'][()]) > 0)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from nplab.instrument.camera.track_extraction import Track, TrackExtractor, multi_tracks, random_tracks
+
+
+@pytest.fixture
+def frames():
+    return np.random.RandomState(0).randint(0, 60000, (6, 64, 32)).astype(np.uint16)
+
+
+def test_tracks_sum_their_rows(frames):
+    extractor = TrackExtractor([Track(3, 7), Track(20, 21, weights=[0.5, 0.5])], (64, 32))
+    spectra = extractor.extract(frames)
+    assert spectra.shape == (6, 2, 32)
+    assert np.allclose(spectra[:, 0], frames[:, 3:8].sum(axis=1))
+    assert np.allclose(spectra[:, 1], frames[:, 20:22].mean(axis=1))
+    out = extractor.empty()
+    assert extractor.extract(frames[2], out=out) is out
+    assert np.allclose(out, spectra[2])
+
+
+def test_smile_correction(frames):
+    # a smile that shifts the track by a whole row on the right half of the frame
+    track = Track(10, 12, smile=[1. / 64, 0.5])
+    spectra = TrackExtractor([track], (64, 32)).extract(frames)
+    shifts = np.round(track.shifts(32)).astype(int)
+    expected = [frames[:, 10 + shift:13 + shift, column].sum(axis=1) for column, shift in enumerate(shifts)]
+    whole = track.shifts(32) == shifts
+    assert np.allclose(spectra[:, 0, whole], np.transpose(expected)[:, whole])
+    # a fractional shift keeps the total weight
+    assert np.allclose(track.pixel_weights(np.arange(64), 32).sum(axis=0), 3)
+
+
+def test_binned_frames_and_datasets(frames):
+    binned = frames[:, 8:40].reshape(6, 16, 2, 32).sum(axis=2)
+    extractor = TrackExtractor(random_tracks([13, 16]), (16, 32), first_row=8, row_binning=2)
+    assert np.allclose(extractor.extract(binned)[:, 0], frames[:, 12:16].sum(axis=1))
+    assert np.allclose(extractor.extract_dataset(binned, chunk_size=4), extractor.extract(binned))
+
+
+def test_multi_tracks():
+    tracks = multi_tracks(4, 10, 0, 200)
+    assert [(track.first_row, track.last_row) for track in tracks] == [(20, 29), (70, 79), (120, 129), (170, 179)]
+    assert multi_tracks(2, 10, 100, 200)[-1].last_row == 199